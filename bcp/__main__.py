@@ -0,0 +1,5 @@
+#!/usr/bin/env python
+import sys
+from bcp.cli import main
+
+sys.exit(main())
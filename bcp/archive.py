@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+from __future__ import division
+
+import json
+import lzma
+import os
+import struct
+import zlib
+import numpy as np
+from bcp import store
+
+'''
+Compressed, chunked archive format for finished experiment stores.
+
+Each channel is written to `<field>_<cage>.bca` holding its samples in
+chunks of `chunk_size` that are compressed independently, so any window of
+time is read by decompressing only the chunks it overlaps.
+
+Each chunk is encoded losslessly in one of two ways:
+'delta'
+    The chunk is scaled by the smallest of `SCALES` that makes every value
+    an integer that converts back to exactly the stored value (1 for wheel
+    counts, 4 for beam positions in 0.25 cm steps, 10000 for weights read
+    with 4 decimals), delta encoded, stored in the narrowest integer type
+    that holds the deltas, byte shuffled and compressed.
+'shuffle'
+    Otherwise (e.g. chunks with NaNs) the raw bytes are byte shuffled and
+    compressed.
+Byte shuffling groups the first bytes of every value, then the second
+bytes, etc., which turns the mostly zero high bytes of small deltas into
+long runs the codec compresses well.
+
+File layout: the magic bytes, the compressed chunks, a JSON index of the
+chunks and the 8 byte offset of the index.
+
+Examples
+--------
+>>> archive_experiment('data/exp1', 'archive/exp1')
+>>> water = open_channel('archive/exp1', 'Water', 2)
+>>> window = water[86400:2 * 86400]
+'''
+
+MAGIC = b'BCPA\x01'
+EXTENSION = '.bca'
+SCALES = (1, 2, 4, 10, 100, 1000, 10000)
+CODECS = {'zlib': (zlib.compress, zlib.decompress),
+          'lzma': (lambda b, level: lzma.compress(b, preset=level),
+                   lzma.decompress)}
+_FOOTER = struct.Struct('<Q')
+
+
+def _shuffle(arr):
+    '''Return the bytes of `arr` grouped by byte position.'''
+    return np.ascontiguousarray(
+        arr.view(np.uint8).reshape(-1, arr.dtype.itemsize).T).tobytes()
+
+
+def _unshuffle(buf, dtype, n):
+    '''Invert `_shuffle`.'''
+    dtype = np.dtype(dtype)
+    b = np.frombuffer(buf, dtype=np.uint8).reshape(dtype.itemsize, n)
+    return np.ascontiguousarray(b.T).view(dtype).ravel()
+
+
+def _delta_dtype(deltas):
+    '''Return the narrowest signed integer type holding `deltas`.'''
+    lo, hi = deltas.min(), deltas.max()
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _encode_delta(ints, scale):
+    deltas = np.diff(ints)
+    dtype = _delta_dtype(deltas) if deltas.size else np.dtype(np.int8)
+    return ({'mode': 'delta', 'scale': scale, 'first': int(ints[0]),
+             'delta_dtype': dtype.str}, _shuffle(deltas.astype(dtype)))
+
+
+def encode_chunk(chunk):
+    '''Return (meta, bytes) of the lossless encoding of `chunk`.
+
+    See the module docstring. The first value is kept in `meta` so the
+    stored deltas start at the second value.
+    '''
+    if chunk.dtype.kind in 'iub':
+        return _encode_delta(chunk.astype(np.int64), 1)
+    if chunk.dtype.kind == 'f' and np.isfinite(chunk).all():
+        x = chunk.astype(np.float64)
+        for scale in SCALES:
+            ints = np.round(x * scale)
+            if np.abs(ints).max() >= 2 ** 53:
+                break
+            if np.array_equal((ints / scale).astype(chunk.dtype), chunk):
+                return _encode_delta(ints.astype(np.int64), scale)
+    return {'mode': 'shuffle'}, _shuffle(np.ascontiguousarray(chunk))
+
+
+def decode_chunk(meta, buf, dtype, n):
+    '''Invert `encode_chunk` for a chunk of `n` values of `dtype`.'''
+    if meta['mode'] == 'shuffle':
+        return _unshuffle(buf, dtype, n)
+    deltas = _unshuffle(buf, meta['delta_dtype'], n - 1)
+    ints = np.empty(n, dtype=np.int64)
+    ints[0] = meta['first']
+    np.cumsum(deltas, out=ints[1:])
+    ints[1:] += meta['first']
+    if meta['scale'] == 1:
+        return ints.astype(dtype)
+    return (ints / meta['scale']).astype(dtype)
+
+
+def write_channel(fp, data, chunk_size=65536, codec='zlib', level=6):
+    '''Write the one dimensional `data` (may be a memmap) to archive `fp`.
+
+    Returns the number of bytes written.
+    '''
+    compress = CODECS[codec][0]
+    n = data.shape[0]
+    chunks = []
+    tmp = fp + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        for start in range(0, n, chunk_size):
+            chunk = np.asarray(data[start:start + chunk_size])
+            meta, raw = encode_chunk(chunk)
+            buf = compress(raw, level)
+            meta.update(offset=f.tell(), nbytes=len(buf))
+            f.write(buf)
+            chunks.append(meta)
+        index_offset = f.tell()
+        f.write(json.dumps({'dtype': np.dtype(data.dtype).str, 'n': n,
+                            'chunk_size': chunk_size, 'codec': codec,
+                            'chunks': chunks}).encode())
+        f.write(_FOOTER.pack(index_offset))
+        size = f.tell()
+    os.replace(tmp, fp)
+    return size
+
+
+class ArchivedChannel(object):
+    '''Read only, array like view of a channel archive.
+
+    Slicing with a step of 1 (`channel[a:b]`) decompresses only the chunks
+    overlapping [a, b). Other indexing decompresses the whole channel.
+
+    Attributes
+    ----------
+    shape : tuple
+    dtype : np.dtype
+    chunk_size : int
+    '''
+
+    def __init__(self, fp):
+        self.fp = fp
+        with open(fp, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError('%s is not a bcp archive.' % fp)
+            f.seek(-_FOOTER.size, os.SEEK_END)
+            end = f.tell()
+            index_offset = _FOOTER.unpack(f.read(_FOOTER.size))[0]
+            f.seek(index_offset)
+            index = json.loads(f.read(end - index_offset).decode())
+        self.dtype = np.dtype(index['dtype'])
+        self.shape = (index['n'],)
+        self.chunk_size = index['chunk_size']
+        self._chunks = index['chunks']
+        self._decompress = CODECS[index['codec']][1]
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def ndim(self):
+        return 1
+
+    def _chunk(self, f, i):
+        meta = self._chunks[i]
+        f.seek(meta['offset'])
+        n = min(self.chunk_size, self.shape[0] - i * self.chunk_size)
+        return decode_chunk(meta, self._decompress(f.read(meta['nbytes'])),
+                            self.dtype, n)
+
+    def read(self, start=0, stop=None):
+        '''Return entries [start, stop) as an array.'''
+        start, stop, _ = slice(start, stop).indices(self.shape[0])
+        if stop <= start:
+            return np.empty(0, dtype=self.dtype)
+        c0 = start // self.chunk_size
+        c1 = (stop - 1) // self.chunk_size + 1
+        with open(self.fp, 'rb') as f:
+            parts = [self._chunk(f, i) for i in range(c0, c1)]
+        out = np.concatenate(parts) if len(parts) > 1 else parts[0]
+        offset = c0 * self.chunk_size
+        return out[start - offset:stop - offset]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice) and key.step in (None, 1):
+            return self.read(key.start, key.stop)
+        return self.read()[key]
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self.read()
+        return arr if dtype is None else arr.astype(dtype)
+
+
+def archive_path(archive_dir, field, cage):
+    '''Return the path of the archive of a channel.'''
+    fp = store.channel_path(archive_dir, field, cage)
+    return os.path.splitext(fp)[0] + EXTENSION
+
+
+def open_channel(archive_dir, field, cage):
+    '''Return an `ArchivedChannel` of `field` of `cage`.
+
+    Compactly stored channels (see `bcp.store`) are wrapped in a
+    `bcp.store.EncodedChannel` decoding the values read.
+    '''
+    channel = ArchivedChannel(archive_path(archive_dir, field, cage))
+    encoding = store.read_manifest(archive_dir).get('encodings', {}).get(
+        '%s_%s' % (field, cage))
+    return channel if encoding is None else store.EncodedChannel(channel,
+                                                                 encoding)
+
+
+def open_times(archive_dir):
+    '''Return an `ArchivedChannel` of the sample times.'''
+    return ArchivedChannel(os.path.splitext(store.time_path(archive_dir))[0] +
+                           EXTENSION)
+
+
+def archive_experiment(exp_dir, archive_dir, chunk_size=65536, codec='zlib',
+                       level=6):
+    '''Archive every raw channel, the times and the manifest of `exp_dir`.
+
+    Parameters
+    ----------
+    exp_dir : str
+        Experiment store to archive.
+    archive_dir : str
+        Output directory, created if missing.
+    chunk_size : int, optional
+        Samples per independently compressed chunk. Smaller chunks make
+        random windows cheaper to read and compress slightly worse.
+    codec : {'zlib', 'lzma'}, optional
+        lzma compresses better and is several times slower to decompress.
+    level : int, optional
+        Compression level passed to the codec.
+
+    Returns
+    -------
+    dict
+        Maps each archived file name to (bytes before, bytes after).
+    '''
+    if not os.path.isdir(archive_dir):
+        os.makedirs(archive_dir)
+    sizes = {}
+    inputs = [store.time_path(exp_dir)]
+    for field, cages in sorted(store.channels(exp_dir).items()):
+        inputs.extend(store.channel_path(exp_dir, field, c) for c in cages)
+    for fp in inputs:
+        data = np.load(fp, mmap_mode='r')
+        if data.ndim != 1:
+            continue
+        name = os.path.splitext(os.path.basename(fp))[0] + EXTENSION
+        size = write_channel(os.path.join(archive_dir, name), data,
+                             chunk_size, codec, level)
+        sizes[name] = (os.path.getsize(fp), size)
+    manifest = store.read_manifest(exp_dir)
+    if manifest:
+        store.write_manifest(archive_dir, manifest)
+    return sizes
+
+
+def restore_experiment(archive_dir, exp_dir):
+    '''Decompress an archive written by `archive_experiment` to a store.'''
+    if not os.path.isdir(exp_dir):
+        os.makedirs(exp_dir)
+    for name in sorted(os.listdir(archive_dir)):
+        if name.endswith(EXTENSION):
+            data = ArchivedChannel(os.path.join(archive_dir, name)).read()
+            store.save_array(os.path.join(
+                exp_dir, name[:-len(EXTENSION)] + '.npy'), data)
+    manifest = store.read_manifest(archive_dir)
+    if manifest:
+        store.write_manifest(exp_dir, manifest)
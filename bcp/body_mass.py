@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+from __future__ import division
+
+import numpy as np
+from bcp.cache import cached
+from bcp.util import float_dtype, output_array
+
+'''
+Body mass estimation from the habitat mass sensor.
+
+The habitat sensor reads the body mass only while the mouse sits in the
+habitat, and even then fluctuates by several tenths of a gram from second to
+second; when the mouse is out it reads a small positive value. The mass
+itself drifts by up to ~.8 g over an hour (food, water, excretion).
+
+The estimate is built in three vectorized steps over all cages at once:
+1. Occupancy: runs of readings above `min_mass`, split at recording gaps,
+   at least `min_duration` long and with `trim` samples cut from both ends
+   where the mouse is climbing in or out.
+2. Windows: each run is cut into windows of `window` samples and each window
+   gets a robust estimate (median or trimmed mean) computed for all windows
+   with one sort.
+3. Series: window estimates are interpolated to every sample, or combined
+   into hourly medians.
+
+Examples
+--------
+>>> mass = body_mass(np.vstack(traces), times)
+>>> hourly, hours = hourly_body_mass(np.vstack(traces), times)
+'''
+
+ESTIMATE_DTYPE = [('cage', 'i4'), ('time', 'f8'), ('mass', 'f8'),
+                  ('n', 'i8')]
+
+
+def _estimate_dtype(mass_dtype):
+    '''Return `ESTIMATE_DTYPE` with a 'mass' field of `mass_dtype`.'''
+    return [(name, mass_dtype if name == 'mass' else kind)
+            for name, kind in ESTIMATE_DTYPE]
+
+
+def grouped_median(values, groups, n_groups):
+    '''Return the median of `values` in each group 0..n_groups-1.
+
+    Computed with one lexsort; empty groups give NaN.
+    '''
+    if values.shape[0] == 0:
+        return np.full(n_groups, np.nan)
+    v = values[np.lexsort((values, groups))]
+    n = np.bincount(groups, minlength=n_groups)
+    first = np.concatenate(([0], np.cumsum(n)[:-1]))
+    # Empty groups index a neighbouring value and are masked below.
+    lo = np.minimum(first + np.maximum(n - 1, 0) // 2, v.shape[0] - 1)
+    hi = np.minimum(first + n // 2, v.shape[0] - 1)
+    return np.where(n > 0, (v[lo] + v[hi]) / 2, np.nan)
+
+
+def grouped_trimmed_mean(values, groups, n_groups, proportion=.1):
+    '''Return the mean of each group after cutting `proportion` of its
+    values from both ends.
+
+    Computed with one lexsort and a cumulative sum; empty groups give NaN.
+    '''
+    order = np.lexsort((values, groups))
+    cs = np.concatenate(([0], np.cumsum(values[order], dtype=np.float64)))
+    n = np.bincount(groups, minlength=n_groups)
+    first = np.concatenate(([0], np.cumsum(n)[:-1]))
+    k = np.floor(n * proportion).astype(np.intp)
+    kept = n - 2 * k
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(kept > 0, (cs[first + n - k] - cs[first + k]) / kept,
+                        np.nan)
+
+
+def occupied(data, times, min_mass=10., min_duration=30, trim=5, max_gap=1):
+    '''Return a mask of the readings usable for estimating body mass.
+
+    Parameters
+    ----------
+    data : np.array
+        Habitat mass readings of shape (T,) or (C, T).
+    times : np.array
+        Array of shape (T,), seconds since the start of the experiment.
+    min_mass : float, optional
+        Readings above this are taken as the mouse being in the habitat.
+    min_duration : int, optional
+        Shortest occupancy run used (before trimming), in samples.
+    trim : int, optional
+        Samples dropped from both ends of every run.
+    max_gap : numeric, optional
+        Consecutive samples further apart in time are a recording gap; runs
+        are split at gaps.
+
+    Returns
+    -------
+    mask : np.array
+        Boolean array shaped like `data`.
+    run : np.array
+        Integer array shaped like `data` numbering the (trimmed) runs from 0
+        in cage then time order; -1 outside runs.
+    position : np.array
+        Position of each sample within its trimmed run; -1 outside runs.
+    '''
+    data = np.asarray(data)
+    occ = np.atleast_2d(data > min_mass)
+    C, T = occ.shape
+    starts = occ.copy()
+    starts[:, 1:] &= ~occ[:, :-1] | (np.diff(times) > max_gap)
+    flat_occ = occ.ravel()
+    flat_starts = starts.ravel()
+    seg = np.cumsum(flat_starts) - 1
+    n_seg = seg[-1] + 1 if seg.shape[0] else 0
+    shape = data.shape
+    if n_seg == 0:
+        return (np.zeros(shape, dtype=bool), np.full(shape, -1, dtype=np.intp),
+                np.full(shape, -1, dtype=np.intp))
+    idx = np.arange(flat_occ.shape[0])
+    seg_first = idx[flat_starts]
+    seg_len = np.bincount(seg[flat_occ], minlength=n_seg)
+    pos = np.where(flat_occ, idx - seg_first[np.maximum(seg, 0)], -1)
+    keep = (flat_occ & (seg_len[np.maximum(seg, 0)] >= min_duration) &
+            (pos >= trim) & (pos < seg_len[np.maximum(seg, 0)] - trim))
+    # Renumber the runs that survive.
+    used = np.zeros(n_seg, dtype=bool)
+    used[seg[keep]] = True
+    new_id = np.cumsum(used) - 1
+    run = np.where(keep, new_id[np.maximum(seg, 0)], -1)
+    position = np.where(keep, pos - trim, -1)
+    return keep.reshape(shape), run.reshape(shape), position.reshape(shape)
+
+
+def window_estimates(data, times, window=60, statistic='median',
+                     proportion=.1, min_samples=None, dtype=None, **kwargs):
+    '''Return robust body mass estimates for windows of occupancy runs.
+
+    Parameters
+    ----------
+    data, times : np.array
+        See `occupied`.
+    window : int, optional
+        Samples per window. The last window of a run may be shorter.
+    statistic : {'median', 'trimmed_mean'}, optional
+        Robust estimate of each window.
+    proportion : float, optional
+        Fraction cut from each end for 'trimmed_mean'.
+    min_samples : int, optional
+        Windows with fewer samples are dropped. Defaults to window // 2.
+    dtype : np.dtype, optional
+        Dtype of the 'mass' field. Defaults to that of floating point `data`
+        (see `bcp.util.float_dtype`); the estimates are computed in float64
+        either way.
+    kwargs : dict
+        Passed to `occupied`.
+
+    Returns
+    -------
+    np.array
+        Structured array with dtype `ESTIMATE_DTYPE` (with the 'mass' field
+        of `dtype`), one entry per window in cage then time order; 'time' is
+        the mean time of the window.
+    '''
+    if min_samples is None:
+        min_samples = window // 2
+    data2 = np.atleast_2d(data)
+    C, T = data2.shape
+    mask, run, position = occupied(data2, times, **kwargs)
+    flat = np.flatnonzero(mask.ravel())
+    new_window = (position.ravel()[flat] % window) == 0
+    group = np.cumsum(new_window) - 1
+    n_groups = group[-1] + 1 if group.shape[0] else 0
+    values = data2.ravel()[flat].astype(np.float64)
+    if statistic == 'median':
+        mass = grouped_median(values, group, n_groups)
+    elif statistic == 'trimmed_mean':
+        mass = grouped_trimmed_mean(values, group, n_groups, proportion)
+    else:
+        raise ValueError("`statistic` must be 'median' or 'trimmed_mean'.")
+    n = np.bincount(group, minlength=n_groups)
+    t = np.asarray(times, dtype=np.float64)[flat % T]
+    out = np.empty(n_groups,
+                   dtype=_estimate_dtype(float_dtype(data2, dtype)))
+    out['cage'] = flat[new_window] // T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out['time'] = np.bincount(group, weights=t, minlength=n_groups) / n
+    out['mass'] = mass
+    out['n'] = n
+    return out[n >= min_samples]
+
+
+@cached
+def body_mass(data, times, out=None, dtype=None, **kwargs):
+    '''Return a per sample body mass series.
+
+    Window estimates (see `window_estimates`, which takes `kwargs`) are
+    linearly interpolated to every sample and held constant before the first
+    and after the last. Cages without any estimate are NaN.
+
+    The result has the dtype given by `bcp.util.float_dtype` (that of
+    floating point `data`) unless `dtype` is passed, and is written into
+    `out` if given, which may be `data` itself.
+
+    Returns
+    -------
+    np.array
+        Array shaped like `data`.
+    '''
+    data2 = np.atleast_2d(data)
+    times = np.asarray(times, dtype=np.float64)
+    est = window_estimates(data2, times, dtype=np.float64, **kwargs)
+    mass = output_array(out, np.shape(data), float_dtype(data, dtype))
+    mass2 = np.atleast_2d(mass)
+    bounds = np.searchsorted(est['cage'], np.arange(data2.shape[0] + 1))
+    for c in range(data2.shape[0]):
+        e = est[bounds[c]:bounds[c + 1]]
+        if e.shape[0]:
+            mass2[c] = np.interp(times, e['time'], e['mass'])
+        else:
+            mass2[c] = np.nan
+    return mass
+
+
+def hourly_body_mass(data, times, bin_seconds=3600, **kwargs):
+    '''Return the median window estimate of each cage in each time bin.
+
+    Parameters
+    ----------
+    data, times : np.array
+        See `occupied`.
+    bin_seconds : numeric, optional
+        Width of the bins, an hour by default.
+    kwargs : dict
+        Passed to `window_estimates`.
+
+    Returns
+    -------
+    mass : np.array
+        Array of shape (C, B) (or (B,) for one dimensional `data`); NaN for
+        bins without an estimate.
+    bin_starts : np.array
+        Start time of each of the B bins.
+    '''
+    data2 = np.atleast_2d(data)
+    times = np.asarray(times, dtype=np.float64)
+    n_bins = int(times[-1] // bin_seconds) + 1 if times.shape[0] else 0
+    est = window_estimates(data2, times, **kwargs)
+    group = (est['cage'] * n_bins +
+             (est['time'] // bin_seconds).astype(np.intp))
+    C = data2.shape[0]
+    mass = grouped_median(est['mass'], group, C * n_bins).reshape(C, n_bins)
+    if np.ndim(data) == 1:
+        mass = mass[0]
+    return mass, np.arange(n_bins) * bin_seconds
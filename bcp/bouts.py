@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+from __future__ import division
+
+import numpy as np
+from bcp import store
+
+'''
+Drinking and feeding bouts with intake quantities from weight sensors.
+
+While a mouse drinks or eats, the water bottle or food hopper sensor jumps
+around; before and after it reads a stable level and the intake is the drop
+between the two. A bout is a stretch of the trace that is not part of a
+stable level and contains at least one difference larger than `u_diff`,
+as in `bcp.preprocess.unstable_sequences`. A stable level is a run of at
+least `stability_duration` consecutive differences of at most `s_diff`.
+Positive spikes, single samples far above the samples on either side of
+them (see `bcp.preprocess.weight_sensor_positive_spikes`), are measurement
+artifacts rather than intake and are removed before bouts are found.
+
+All cages are processed together: the rows of a 2d array are classified and
+cut into runs in one pass, and the levels around every bout are averaged
+with a single `np.add.reduceat`.
+
+Examples
+--------
+>>> bouts, cages = channel_bouts('data/exp1', 'Water')
+>>> bouts[bouts['cage'] == 0]['uptake'].sum()  # water drunk by cages[0]
+'''
+
+BOUT_DTYPE = [('cage', 'i4'), ('start', 'i8'), ('stop', 'i8'),
+              ('start_time', 'f8'), ('stop_time', 'f8'), ('pre_level', 'f8'),
+              ('post_level', 'f8'), ('uptake', 'f8'), ('gap', '?')]
+
+# Default detection parameters per weight channel (grams).
+BOUT_PARAMETERS = {'Water': {'u_diff': .05, 's_diff': .02,
+                             'stability_duration': 10},
+                   'FoodA': {'u_diff': .05, 's_diff': .02,
+                             'stability_duration': 10}}
+
+# Run states.
+_STABLE, _UNSTABLE, _SEPARATOR = 0, 1, 2
+
+
+def _segment_means(x, starts, stops):
+    '''Return x[starts[i]:stops[i]].mean() for each i with one reduceat.
+
+    Empty segments give NaN.
+    '''
+    x = np.concatenate((x, [0]))
+    idx = np.empty(2 * starts.shape[0], dtype=np.intp)
+    idx[::2] = starts
+    idx[1::2] = stops
+    sums = np.add.reduceat(x, idx)[::2]
+    n = stops - starts
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(n > 0, sums / n, np.nan)
+
+
+def extract_bouts(data, times, u_diff, s_diff=None, stability_duration=10,
+                  level_window=60, max_gap=1):
+    '''Find bouts in weight sensor traces and the intake of each.
+
+    Parameters
+    ----------
+    data : np.array
+        Trace of shape (T,) or traces of shape (C, T), e.g. one row per cage.
+    times : np.array
+        Array of shape (T,), seconds since the start of the experiment.
+    u_diff : numeric
+        A difference between consecutive samples larger than this starts a
+        bout.
+    s_diff : numeric, optional
+        Largest difference between consecutive samples of a stable level.
+        Defaults to `u_diff`.
+    stability_duration : int, optional
+        Number of consecutive differences of at most `s_diff` needed for a
+        stable level.
+    level_window : int, optional
+        The levels before and after a bout are the means of the last and
+        first (respectively) `level_window` samples of the adjacent stable
+        levels.
+    max_gap : numeric, optional
+        Consecutive samples further apart in time are a recording gap.
+
+    Returns
+    -------
+    np.array
+        Structured array with dtype `BOUT_DTYPE`, sorted by cage then time.
+        'cage' is the row of `data`; data[cage, start:stop] are the samples
+        reached by the bout's unstable differences, so `start` is the first
+        disturbed sample and `stop - 1` the first sample back at a stable
+        level. 'pre_level' and 'post_level' are NaN for bouts at the edges
+        of the data; 'uptake' is pre_level - post_level. 'gap' is True if
+        the bout spans a recording gap, in which case its uptake includes
+        whatever happened during the gap.
+
+    Notes
+    -----
+    A sample more than `u_diff` above both of its neighbours, which are
+    within `s_diff` of each other and not separated from it by a recording
+    gap, is a positive spike and is replaced by the sample before it.
+    '''
+    if s_diff is None:
+        s_diff = u_diff
+    data = np.array(np.atleast_2d(data), dtype=np.float64)
+    times = np.asarray(times, dtype=np.float64)
+    C, T = data.shape
+    out = np.empty(0, dtype=BOUT_DTYPE)
+    if T < 2:
+        return out
+    # Differences are compared with a tolerance as in `unstable_sequences`
+    # because of round off, e.g. abs(.7 - .9) > .2.
+    tol = 1e-8 + 1e-5 * abs(s_diff)
+    before, sample, after = data[:, :-2], data[:, 1:-1], data[:, 2:]
+    spikes = ((sample - before > u_diff) & (sample - after > u_diff) &
+              (np.abs(after - before) <= s_diff + tol) &
+              (np.diff(times[:-1]) <= max_gap) &
+              (np.diff(times[1:]) <= max_gap))
+    sample[spikes] = before[spikes]
+    d = np.abs(np.diff(data, axis=1))
+    # One entry per difference plus a separator column so runs never cross
+    # from one cage to the next. Difference k of a row sits at the same flat
+    # position as its left sample.
+    small = np.zeros((C, T), dtype=bool)
+    small[:, :-1] = d <= s_diff + tol
+    trigger = np.zeros((C, T), dtype=np.intp)
+    trigger[:, :-1] = d > u_diff
+    gap = np.zeros((C, T), dtype=np.intp)
+    gap[:, :-1] = np.diff(times) > max_gap
+    small, trigger, gap = small.ravel(), trigger.ravel(), gap.ravel()
+
+    # Stable levels: runs of small differences at least stability_duration
+    # long.
+    change = np.concatenate(([False], small[1:] != small[:-1]))
+    run = np.cumsum(change)
+    run_starts = np.flatnonzero(np.concatenate(([True], change[1:])))
+    run_lengths = np.diff(np.concatenate((run_starts, [small.shape[0]])))
+    stable = (small[run_starts] & (run_lengths >= stability_duration))[run]
+
+    state = np.where(stable, _STABLE, _UNSTABLE).astype(np.int8)
+    state.reshape(C, T)[:, -1] = _SEPARATOR
+    change = np.concatenate(([True], state[1:] != state[:-1]))
+    starts = np.flatnonzero(change)
+    stops = np.concatenate((starts[1:], [state.shape[0]]))
+    kind = state[starts]
+    n_triggers = np.add.reduceat(trigger, starts)
+    bouts = np.flatnonzero((kind == _UNSTABLE) & (n_triggers > 0))
+    if bouts.shape[0] == 0:
+        return out
+
+    # Unstable runs are maximal, so their neighbours are stable levels or
+    # separators.
+    prev_stable = np.zeros(bouts.shape[0], dtype=bool)
+    prev_stable[bouts > 0] = kind[bouts[bouts > 0] - 1] == _STABLE
+    next_stable = np.zeros(bouts.shape[0], dtype=bool)
+    has_next = bouts < starts.shape[0] - 1
+    next_stable[has_next] = kind[bouts[has_next] + 1] == _STABLE
+    a0, a1 = starts[bouts], stops[bouts]
+    # Samples of the stable levels within `level_window` of the bout.
+    pre_lo = np.where(prev_stable, starts[np.maximum(bouts - 1, 0)], a0 + 1)
+    pre_lo = np.maximum(pre_lo, a0 + 1 - level_window)
+    pre_hi = np.where(prev_stable, a0 + 1, pre_lo)
+    post_hi = np.where(next_stable,
+                       stops[np.minimum(bouts + 1, starts.shape[0] - 1)] + 1,
+                       a1)
+    post_hi = np.minimum(post_hi, a1 + level_window)
+    post_lo = np.where(next_stable, a1, post_hi)
+    bounds = np.concatenate((pre_lo, post_lo))
+    means = _segment_means(data.ravel(), bounds,
+                           np.concatenate((pre_hi, post_hi)))
+
+    out = np.empty(bouts.shape[0], dtype=BOUT_DTYPE)
+    out['cage'] = a0 // T
+    out['start'] = a0 % T + 1
+    out['stop'] = (a1 - 1) % T + 2
+    out['start_time'] = times[out['start']]
+    out['stop_time'] = times[out['stop'] - 1]
+    out['pre_level'] = means[:bouts.shape[0]]
+    out['post_level'] = means[bouts.shape[0]:]
+    out['uptake'] = out['pre_level'] - out['post_level']
+    out['gap'] = np.add.reduceat(gap, starts)[bouts] > 0
+    return out
+
+
+def channel_bouts(exp_dir, field, cages=None, **kwargs):
+    '''Extract bouts of a weight channel for all cages of an experiment.
+
+    Parameters
+    ----------
+    exp_dir : str
+        Experiment store (see `bcp.store`).
+    field : str
+        Weight channel, e.g. 'Water' or 'FoodA'.
+    cages : list, optional
+        Cages to process. Defaults to every cage with the channel.
+    kwargs : dict
+        Passed to `extract_bouts`, overriding `BOUT_PARAMETERS[field]`.
+
+    Returns
+    -------
+    bouts : np.array
+        See `extract_bouts`; 'cage' indexes `cages`.
+    cages : list
+    '''
+    if cages is None:
+        cages = store.channels(exp_dir)[field]
+    params = dict(BOUT_PARAMETERS.get(field, {}))
+    params.update(kwargs)
+    times = np.load(store.time_path(exp_dir), mmap_mode='r')
+    data = np.vstack([store.load_channel(exp_dir, field, c) for c in cages])
+    return extract_bouts(data, times, **params), list(cages)
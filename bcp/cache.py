@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+from __future__ import division
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+import numpy as np
+
+'''
+Opt-in on-disk memoization of expensive bcp functions.
+
+Pure, expensive functions of `bcp.preprocess`, `bcp.stats` and
+`bcp.feature_extraction` are wrapped with `cached`. While a cache is enabled
+(with the `caching` context manager, `enable`, or by setting the
+`BCP_CACHE_DIR` environment variable before bcp is imported) each call is
+keyed by a blake2b digest of the function, its code, and its arguments
+(array arguments are hashed over their buffers, dtype and shape). Results are
+stored as .npy files, and hits are returned as memmaps, so repeating
+`smooth(water, 200, ...)` in another notebook or cron run only reads the
+result back.
+
+The cache is bounded: after storing a result the least recently used
+entries are removed until the cache holds at most `max_bytes`. Entries are
+written to a temporary directory and renamed into place, and removed by
+renaming them away first, so several processes can share one cache.
+
+Calls whose arguments or results can not be keyed or stored (e.g. lists of
+arrays, object arrays) and calls writing into an `out` array run uncached.
+Hits are read only memmaps (see `mmap_mode`); copy them before modifying.
+The source digest covers every module of the bcp package, and the module
+defining the function if it is not one of them, so editing a helper that a
+cached function calls changes the keys instead of serving stale results.
+
+Examples
+--------
+>>> with caching('/tmp/bcp_cache', max_bytes=2 ** 30):
+...     s = smooth(water, 200, .2, 50)
+'''
+
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 2 ** 32
+STALE_SECONDS = 86400
+_META = 'meta.json'
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Maps source files to ((mtime, size), digest) of their last reading.
+_file_digests = {}
+
+# The cache currently in use, None when caching is disabled.
+_active = None
+
+
+class Uncacheable(Exception):
+    '''Raised for arguments or results the cache does not handle.'''
+
+
+def _update(h, value):
+    '''Feed a canonical encoding of `value` to the hash `h`.'''
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            raise Uncacheable('object array')
+        h.update(b'a%s%r' % (value.dtype.str.encode(), value.shape))
+        # Viewed as bytes, as datetime and timedelta arrays do not export
+        # a buffer.
+        h.update(np.ascontiguousarray(value).reshape(-1).view(np.uint8))
+    elif isinstance(value, (list, tuple)):
+        h.update(b'l%d' % len(value))
+        for v in value:
+            _update(h, v)
+    elif isinstance(value, dict):
+        h.update(b'd%d' % len(value))
+        for k in sorted(value, key=repr):
+            _update(h, k)
+            _update(h, value[k])
+    elif value is None or isinstance(value, (bool, int, float, complex, str,
+                                             bytes, np.generic)):
+        h.update(b's%s' % repr(value).encode())
+    elif isinstance(value, type) and issubclass(value, np.generic):
+        h.update(b't%s' % np.dtype(value).str.encode())
+    elif isinstance(value, np.dtype):
+        h.update(b't%s' % value.str.encode())
+    else:
+        raise Uncacheable(type(value).__name__)
+
+
+def _code_digest(func):
+    '''Return a digest of the byte code and simple constants of `func`.'''
+    code = func.__code__
+    consts = tuple(c for c in code.co_consts if not inspect.iscode(c))
+    h = hashlib.blake2b(code.co_code, digest_size=16)
+    h.update(repr(consts).encode())
+    return h.hexdigest()
+
+
+def _file_digest(fp):
+    '''Return a digest of the contents of the file `fp`.
+
+    Files are only read again after their modification time or size change.
+    '''
+    st = os.stat(fp)
+    stamp = (st.st_mtime_ns, st.st_size)
+    known = _file_digests.get(fp)
+    if known is None or known[0] != stamp:
+        with open(fp, 'rb') as f:
+            known = (stamp, hashlib.blake2b(f.read(), digest_size=16).digest())
+        _file_digests[fp] = known
+    return known[1]
+
+
+def _source_digest(func):
+    '''Return a digest of the sources the results of `func` may depend on:
+    the modules of the bcp package and the module defining `func`.'''
+    files = [os.path.join(_PACKAGE_DIR, n) for n in os.listdir(_PACKAGE_DIR)
+             if n.endswith('.py')]
+    try:
+        fp = inspect.getsourcefile(func)
+    except TypeError:
+        fp = None
+    # Functions defined interactively have no source file; their own code
+    # is still covered by `_code_digest`.
+    if fp is not None and os.path.exists(fp):
+        files.append(os.path.abspath(fp))
+    h = hashlib.blake2b(digest_size=16)
+    for fp in sorted(set(files)):
+        h.update(_file_digest(fp))
+    return h.hexdigest()
+
+
+def call_key(func, args, kwargs):
+    '''Return the cache key of func(*args, **kwargs).
+
+    Raises `Uncacheable` if an argument can not be hashed.
+    '''
+    bound = inspect.signature(func).bind(*args, **kwargs)
+    bound.apply_defaults()
+    h = hashlib.blake2b(digest_size=20)
+    h.update(('%d %s.%s %s %s' % (CACHE_VERSION, func.__module__,
+                                  func.__qualname__, _code_digest(func),
+                                  _source_digest(func))).encode())
+    for name, value in bound.arguments.items():
+        h.update(name.encode())
+        _update(h, value)
+    return h.hexdigest()
+
+
+def _entry_size(path):
+    return sum(e.stat().st_size for e in os.scandir(path))
+
+
+class ResultCache(object):
+    '''Directory of cached results.
+
+    Parameters
+    ----------
+    directory : str
+        Created if missing.
+    max_bytes : int, optional
+        Size above which least recently used entries are evicted.
+    mmap_mode : {'r', 'c'}, optional
+        How hits are opened; 'c' (copy on write) returns writable arrays
+        whose changes are not saved.
+    '''
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES,
+                 mmap_mode='r'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.mmap_mode = mmap_mode
+        self.hits = self.misses = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        '''Return (True, result) for a stored key, (False, None) otherwise.'''
+        path = self._path(key)
+        try:
+            with open(os.path.join(path, _META)) as f:
+                meta = json.load(f)
+            parts = [np.load(os.path.join(path, '%d.npy' % i),
+                             mmap_mode=self.mmap_mode if mmap else None)
+                     for i, mmap in enumerate(meta['mmap'])]
+            os.utime(path)
+        except (OSError, ValueError):
+            # Missing, or evicted by another process while being read.
+            return False, None
+        parts = [p[()] if scalar else p
+                 for p, scalar in zip(parts, meta['scalar'])]
+        return True, tuple(parts) if meta['tuple'] else parts[0]
+
+    def put(self, key, result):
+        '''Store `result` (an array, a scalar or a tuple of them).
+
+        Raises `Uncacheable` for other results.
+        '''
+        is_tuple = isinstance(result, tuple)
+        raw = result if is_tuple else (result,)
+        parts = []
+        for r in raw:
+            if not isinstance(r, (np.ndarray, np.generic, bool, int, float)):
+                raise Uncacheable(type(r).__name__)
+            parts.append(np.asarray(r))
+            if parts[-1].dtype.hasobject:
+                raise Uncacheable('object array')
+        tmp = tempfile.mkdtemp(prefix='.tmp-', dir=self.directory)
+        try:
+            for i, p in enumerate(parts):
+                np.save(os.path.join(tmp, '%d.npy' % i), p)
+            # Empty arrays can not be memmapped.
+            meta = {'tuple': is_tuple,
+                    'mmap': [p.size > 0 and p.ndim > 0 for p in parts],
+                    'scalar': [not isinstance(r, np.ndarray) for r in raw]}
+            with open(os.path.join(tmp, _META), 'w') as f:
+                json.dump(meta, f)
+            try:
+                os.rename(tmp, self._path(key))
+            except OSError:
+                # Stored meanwhile by another process.
+                pass
+        finally:
+            if os.path.isdir(tmp):
+                shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def entries(self):
+        '''Return list of (last use, bytes, key) of the stored entries.'''
+        out = []
+        for e in os.scandir(self.directory):
+            try:
+                if e.name.startswith('.'):
+                    # Left behind by a process killed while writing or
+                    # removing an entry.
+                    if e.stat().st_mtime < time.time() - STALE_SECONDS:
+                        shutil.rmtree(e.path, ignore_errors=True)
+                elif e.is_dir():
+                    out.append((e.stat().st_mtime, _entry_size(e.path),
+                                e.name))
+            except OSError:
+                continue
+        return out
+
+    def _remove(self, key):
+        # Renaming first makes the removal atomic for readers.
+        trash = os.path.join(self.directory, '.del-%s-%d' % (key, os.getpid()))
+        try:
+            os.rename(self._path(key), trash)
+        except OSError:
+            return
+        shutil.rmtree(trash, ignore_errors=True)
+
+    def evict(self, max_bytes=None):
+        '''Remove least recently used entries until at most `max_bytes`
+        (default `self.max_bytes`) are stored.'''
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        entries = sorted(self.entries())
+        total = sum(e[1] for e in entries)
+        for _, size, key in entries:
+            if total <= max_bytes:
+                break
+            self._remove(key)
+            total -= size
+
+    def clear(self):
+        '''Remove every entry.'''
+        self.evict(0)
+
+    def call(self, func, args, kwargs):
+        '''Return func(*args, **kwargs), from the cache if stored.'''
+        try:
+            if inspect.signature(func).bind(*args, **kwargs).arguments.get(
+                    'out') is not None:
+                return func(*args, **kwargs)
+            key = call_key(func, args, kwargs)
+        except (Uncacheable, TypeError):
+            return func(*args, **kwargs)
+        found, result = self.get(key)
+        if found:
+            self.hits += 1
+            return result
+        self.misses += 1
+        result = func(*args, **kwargs)
+        try:
+            self.put(key, result)
+        except Uncacheable:
+            pass
+        return result
+
+
+def cached(func):
+    '''Decorator memoizing `func` while a cache is enabled.'''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        cache = _active
+        if cache is None:
+            return func(*args, **kwargs)
+        return cache.call(func, args, kwargs)
+    return wrapper
+
+
+def enabled():
+    '''Return True if caching is enabled.'''
+    return _active is not None
+
+
+def enable(directory, max_bytes=DEFAULT_MAX_BYTES, mmap_mode='r'):
+    '''Cache calls of cached functions in `directory` until `disable`.
+
+    Returns the `ResultCache`.
+    '''
+    global _active
+    _active = ResultCache(directory, max_bytes, mmap_mode)
+    return _active
+
+
+def disable():
+    '''Stop caching.'''
+    global _active
+    _active = None
+
+
+@contextmanager
+def caching(directory, max_bytes=DEFAULT_MAX_BYTES, mmap_mode='r'):
+    '''Cache calls of cached functions inside the block.
+
+    Yields the `ResultCache`; see `ResultCache` for the parameters.
+    '''
+    global _active
+    previous = _active
+    _active = ResultCache(directory, max_bytes, mmap_mode)
+    try:
+        yield _active
+    finally:
+        _active = previous
+
+
+if os.environ.get('BCP_CACHE_DIR'):
+    enable(os.environ['BCP_CACHE_DIR'],
+           int(os.environ.get('BCP_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)))
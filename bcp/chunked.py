@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+from __future__ import division
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from bcp.preprocess import (smooth, stable_sequences, valued_sequences,
+                            unstable_sequences)
+from bcp.stats import moving_function
+
+'''
+Out-of-core execution of windowed functions over long (memmapped) channels.
+
+A channel is processed in chunks of `chunk_size` samples so that only a few
+chunks are in memory at a time, and the results equal those of calling the
+function on the whole array.
+
+Pointwise window functions (`smooth`, `moving_function`) are run by
+`map_overlap` on each chunk extended by a halo of `halo` samples on both
+sides, at least the radius of the function's window; the halo is trimmed
+from each output, so every kept value was computed from the same
+neighbourhood as in the full array. Chunks can be processed by several
+worker processes.
+
+The sequence finders (`stable_sequences`, `valued_sequences`,
+`unstable_sequences`) scan the data left to right, and a sequence can be
+arbitrarily long. `map_sequences` runs them chunk after chunk, restarting
+each scan where the previous one stopped and extending the chunk's look
+ahead whenever a sequence might continue past the loaded data.
+
+Examples
+--------
+>>> water = np.load('data/exp1/Water_3.npy', mmap_mode='r')
+>>> out = np.lib.format.open_memmap('Water_smooth_3.npy', 'w+', float,
+...                                 water.shape)
+>>> chunked_smooth(water, 10, .1, 5, out=out, jobs=4)
+>>> spans = chunked_unstable_sequences(water, .05, .02, 10)
+'''
+
+CHUNK_SIZE = 2 ** 20
+
+
+def chunk_bounds(n, chunk_size=CHUNK_SIZE, halo=0):
+    '''Yield (lo, start, stop, hi) for the chunks of an array of length `n`.
+
+    [start, stop) is the chunk and [lo, hi) the chunk with its halo, clipped
+    to the array.
+    '''
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        yield max(start - halo, 0), start, stop, min(stop + halo, n)
+
+
+def _apply(func, chunk, kwargs):
+    return func(chunk, **kwargs)
+
+
+def map_overlap(func, data, halo, chunk_size=CHUNK_SIZE, out=None, jobs=1,
+                **kwargs):
+    '''Apply a pointwise window function to `data` in chunks.
+
+    Parameters
+    ----------
+    func : function
+        Called as func(chunk, **kwargs); returns an array with one value per
+        entry of `chunk` that depends only on entries within `halo` of it
+        (or on being within `halo` of the edge of `chunk`).
+    data : np.array
+        One dimensional array, e.g. a memmapped channel.
+    halo : int
+        Samples added on both sides of each chunk.
+    chunk_size : int, optional
+        Samples per chunk, not counting the halo.
+    out : np.array, optional
+        Array (e.g. a writable memmap) of the length of `data` receiving the
+        output. Allocated in memory if not given.
+    jobs : int, optional
+        Number of worker processes. At most 2 * `jobs` chunks are pending at
+        a time.
+    kwargs : dict
+        Passed to `func`.
+
+    Returns
+    -------
+    np.array
+        `out`, equal to func(data, **kwargs).
+    '''
+    n = data.shape[0]
+    if n == 0:
+        return func(np.asarray(data), **kwargs) if out is None else out
+    bounds = list(chunk_bounds(n, chunk_size, halo))
+
+    def store(bound, result):
+        lo, start, stop, hi = bound
+        out[start:stop] = result[start - lo:stop - lo]
+
+    if jobs == 1 or len(bounds) < 2:
+        for bound in bounds:
+            result = func(np.asarray(data[bound[0]:bound[3]]), **kwargs)
+            if out is None:
+                out = np.empty(n, dtype=np.asarray(result).dtype)
+            store(bound, result)
+        return out
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending = []
+        for i, bound in enumerate(bounds):
+            chunk = np.asarray(data[bound[0]:bound[3]])
+            pending.append((bound, pool.submit(_apply, func, chunk, kwargs)))
+            while pending and (len(pending) >= 2 * jobs or
+                               i == len(bounds) - 1):
+                done, future = pending.pop(0)
+                result = future.result()
+                if out is None:
+                    out = np.empty(n, dtype=np.asarray(result).dtype)
+                store(done, result)
+    return out
+
+
+def map_sequences(func, data, chunk_size=CHUNK_SIZE, halo=None, lead=0,
+                  **kwargs):
+    '''Run a left to right sequence finder over `data` in chunks.
+
+    Parameters
+    ----------
+    func : function
+        Called as func(chunk, **kwargs); returns a (K, 2) array of sequences
+        (start, length) such that a scan of the data from start + length on
+        finds the same sequences as the scan of the whole data. Runs it does
+        not report must not affect where it resumes (call the finders with a
+        `stability_duration` of 1 and filter afterwards).
+    data : np.array
+        One dimensional array, e.g. a memmapped channel.
+    chunk_size : int, optional
+        Samples scanned per chunk.
+    halo : int, optional
+        Initial look ahead past each chunk, doubled until the last sequence
+        starting in the chunk ends within the loaded data. Defaults to
+        chunk_size // 8.
+    lead : int, optional
+        Distance from the sample a sequence starts at to the first sample
+        the finder looked at for it (1 for `unstable_sequences`, which
+        reports the sample after the triggering difference).
+    kwargs : dict
+        Passed to `func`.
+
+    Returns
+    -------
+    np.array
+        Array of shape (K, 2), equal to func(data, **kwargs).
+    '''
+    if halo is None:
+        halo = max(chunk_size // 8, 1)
+    n = data.shape[0]
+    spans = []
+    pos = 0
+    while pos < n:
+        stop = min(pos + chunk_size, n)
+        look = halo
+        while True:
+            hi = min(stop + look, n)
+            found = np.array(func(np.asarray(data[pos:hi]), **kwargs),
+                             dtype=np.int64).reshape(-1, 2)
+            found[:, 0] += pos
+            found = found[found[:, 0] - lead < stop]
+            ends = found[:, 0] + found[:, 1]
+            # A sequence reaching the end of the loaded data may continue.
+            if hi == n or not (ends >= hi - 1).any():
+                break
+            look *= 2
+        spans.append(found)
+        pos = max(stop, ends.max()) if found.shape[0] else stop
+    if not spans:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.concatenate(spans)
+
+
+def chunked_smooth(data, radius, a_thresh, w_thresh, **kwargs):
+    '''`bcp.preprocess.smooth` with `map_overlap` (which takes `kwargs`).'''
+    return map_overlap(smooth, data, radius, radius=radius, a_thresh=a_thresh,
+                       w_thresh=w_thresh, **kwargs)
+
+
+def chunked_moving_function(data, window, function='sum', boundary=1,
+                            **kwargs):
+    '''`bcp.stats.moving_function` with `map_overlap` (which takes
+    `kwargs`).'''
+    return map_overlap(moving_function, data, window, window=window,
+                       function=function, boundary=boundary, **kwargs)
+
+
+def chunked_stable_sequences(data, diff, stability_duration=1, **kwargs):
+    '''`bcp.preprocess.stable_sequences` with `map_sequences` (which takes
+    `kwargs`).'''
+    spans = map_sequences(stable_sequences, data, diff=diff,
+                          stability_duration=1, **kwargs)
+    return spans[spans[:, 1] >= stability_duration]
+
+
+def chunked_valued_sequences(data, value, stability_duration=1, **kwargs):
+    '''`bcp.preprocess.valued_sequences` with `map_sequences` (which takes
+    `kwargs`).'''
+    spans = map_sequences(valued_sequences, data, value=value,
+                          stability_duration=1, **kwargs)
+    return spans[spans[:, 1] >= stability_duration]
+
+
+def chunked_unstable_sequences(data, u_diff, s_diff=None,
+                               stability_duration=10, **kwargs):
+    '''`bcp.preprocess.unstable_sequences` with `map_sequences` (which takes
+    `kwargs`).'''
+    return map_sequences(unstable_sequences, data, lead=1, u_diff=u_diff,
+                         s_diff=s_diff, stability_duration=stability_duration,
+                         **kwargs)
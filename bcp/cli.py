@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+from __future__ import division
+
+import argparse
+import datetime
+import fnmatch
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from bcp import store
+from bcp.archive import archive_experiment, archive_path, CODECS
+from bcp.parse import promethion_to_array
+from bcp.rollup import update_rollup
+from bcp.preprocess import (weight_sensor_positive_spikes,
+                            smooth_positive_spikes,
+                            remove_artifacts_wheel_running)
+from bcp.feature_extraction import trace_to_signals_matrix, minibatch_kmeans
+
+'''
+Batch processing of whole experiment stores from the command line.
+
+Every command takes one or more experiment stores (see `bcp.store`) and only
+does work whose outputs are missing or older than their inputs, so it can be
+run nightly over all active experiments:
+
+    python -m bcp ingest data/exp6 --raw /mnt/promethion/exp6
+    python -m bcp preprocess data/exp* --jobs 8
+    python -m bcp classify data/exp* --jobs 8
+    python -m bcp summarize data/exp* --since 1d
+    python -m bcp archive data/exp1 --output /mnt/archive
+
+Commands
+--------
+ingest
+    Append raw Promethion exports (files in the experiment's raw directory
+    that have not been ingested yet) to the store and extend the rollups of
+    every channel (see `bcp.rollup`).
+preprocess
+    Write `<field>Clean_<cage>.npy` with weight sensor spikes smoothed
+    (Water, FoodA) and wheel artifacts removed (WheelCount).
+classify
+    Cluster non overlapping windows of the cleaned water and food traces with
+    k-means; writes `<field>Class_<cage>.npy` (one label per window) and
+    `<field>Centroids_<cage>.npy`.
+summarize
+    Write `summary.tsv` with per day statistics of every raw channel.
+archive
+    Write a compressed archive of the raw channels of the store (see
+    `bcp.archive`) to `<output>/<experiment name>`. The outputs of
+    preprocess and classify are not archived; they are rebuilt from it.
+'''
+
+CLEAN_SUFFIX, CLASS_SUFFIX, CENTROIDS_SUFFIX = store.DERIVED_SUFFIXES
+SPIKE_FIELDS = ['Water', 'FoodA']
+SPIKE_THRESHOLD = .3
+SPIKE_BACKWARD_WINDOW = 10
+SPIKE_FORWARD_WINDOW = 5
+SUMMARY_FILE = 'summary.tsv'
+
+
+def parse_since(value, now=None):
+    '''Parse a --since value into seconds since the epoch.
+
+    Accepts an ISO date or datetime ('2016-05-25', '2016-05-25T18:00') or a
+    time before `now` in hours or days ('12h', '2d').
+    '''
+    now = time.time() if now is None else now
+    units = {'h': 3600, 'd': 86400}
+    if value[-1:] in units:
+        try:
+            return now - float(value[:-1]) * units[value[-1]]
+        except ValueError:
+            pass
+    try:
+        return time.mktime(datetime.datetime.fromisoformat(value).timetuple())
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid --since value: %r' % value)
+
+
+# Ingest --------------------------------------------------------------------
+
+def _split_key(key):
+    '''Split a Promethion column name such as Water_3 into (Water, 3).'''
+    field, cage = key.rsplit('_', 1)
+    return field, cage
+
+
+def _read_export_header(fp):
+    '''Return the header and first timestamp string of a Promethion export.'''
+    with open(fp) as f:
+        header = f.readline().strip().split(',')
+        first = f.readline().split(',', 1)[0]
+    return header, first
+
+
+def ingest_experiment(exp_dir, raw_dir=None, pattern='*.csv', since=None,
+                      encodings=None):
+    '''Append raw Promethion exports not yet in the store to `exp_dir`.
+
+    Parameters
+    ----------
+    exp_dir : str
+        Experiment store, created if missing.
+    raw_dir : str, optional
+        Directory of Promethion exports. Remembered in the manifest, so it is
+        only needed on the first ingest.
+    pattern : str, optional
+        Glob selecting the export files in `raw_dir`.
+    since : float, optional
+        Ignore exports last modified before this time (seconds since the
+        epoch).
+    encodings : dict, optional
+        Maps fields to the storage encoding of their new channels (None for
+        float32), overriding `bcp.store.FIELD_ENCODINGS` and inference.
+
+    Returns
+    -------
+    list
+        Names of the exports ingested, in order.
+
+    Notes
+    -----
+    Exports are ingested in file name order. Rows at or before the last
+    ingested time (exports that overlap) are dropped. Channels are appended
+    in place; the manifest is written last and records the store length, so
+    an interrupted ingest is rolled back by the next one.
+    '''
+    if not os.path.isdir(exp_dir):
+        os.makedirs(exp_dir)
+    manifest = store.read_manifest(exp_dir)
+    if raw_dir is not None:
+        manifest['raw_dir'] = os.path.abspath(raw_dir)
+    if 'raw_dir' not in manifest:
+        raise ValueError('%s has no raw directory, pass --raw.' % exp_dir)
+    ingested = manifest.setdefault('ingested', {})
+    names = sorted(n for n in os.listdir(manifest['raw_dir'])
+                   if fnmatch.fnmatch(n, pattern))
+    done = []
+    for name in names:
+        fp = os.path.join(manifest['raw_dir'], name)
+        stat = os.stat(fp)
+        if name in ingested:
+            if ingested[name]['size'] != stat.st_size:
+                sys.stderr.write('warning: %s changed since it was ingested, '
+                                 'skipping\n' % fp)
+            continue
+        if since is not None and stat.st_mtime < since:
+            continue
+        header, first = _read_export_header(fp)
+        if 'start_timestamp' not in manifest:
+            manifest['start_timestamp'] = first
+        keys = [k for k in header[1:] if k[-1:].isdigit()]
+        cages = sorted(set(_split_key(k)[1] for k in keys),
+                       key=lambda c: (len(c), c))
+        fields = []
+        for k in keys:
+            if _split_key(k)[0] not in fields:
+                fields.append(_split_key(k)[0])
+        data, times, keys = promethion_to_array(fp, cages, fields,
+                                                manifest['start_timestamp'])
+        times = np.asarray(times)
+        keep = times > manifest.get('last_time', -np.inf)
+        n = manifest.get('n', 0)
+        store.append_array(store.time_path(exp_dir), times[keep], n)
+        all_times = np.load(store.time_path(exp_dir), mmap_mode='r')
+        for i, key in enumerate(keys):
+            field, cage = _split_key(key)
+            store.ingest_channel(exp_dir, field, cage, data[keep, i], n,
+                                 manifest, (encodings or {}).get(field,
+                                                                 'infer'))
+            update_rollup(store.channel_path(exp_dir, field, cage), all_times,
+                          n, data=store.load_channel(exp_dir, field, cage,
+                                                     manifest=manifest))
+        manifest['n'] = n + int(keep.sum())
+        if keep.any():
+            manifest['last_time'] = float(times[keep][-1])
+        ingested[name] = {'size': stat.st_size, 'rows': int(keep.sum())}
+        store.write_manifest(exp_dir, manifest)
+        done.append(name)
+    return done
+
+
+# Per cage tasks ------------------------------------------------------------
+
+def clean_channel(field, data, times, out=None):
+    '''Return the cleaned version of channel `field`, or None if not cleaned.
+
+    The result is written into `out` if given, which may be `data`.
+    '''
+    if field in SPIKE_FIELDS:
+        spikes = weight_sensor_positive_spikes(data, times, SPIKE_THRESHOLD)
+        # Spikes too close to either end cannot be smoothed.
+        spikes = spikes[(spikes >= SPIKE_BACKWARD_WINDOW) &
+                        (data.shape[0] - spikes >= SPIKE_FORWARD_WINDOW)]
+        return smooth_positive_spikes(data, spikes, SPIKE_BACKWARD_WINDOW,
+                                      SPIKE_FORWARD_WINDOW, out=out)
+    if field == 'WheelCount':
+        return remove_artifacts_wheel_running(data, out=out)
+    return None
+
+
+def preprocess_cage(exp_dir, cage, since=None, force=False):
+    '''Write the cleaned channels of `cage`; return the paths written.'''
+    written = []
+    tp = store.time_path(exp_dir)
+    times = None
+    for field in SPIKE_FIELDS + ['WheelCount']:
+        in_fp = store.channel_path(exp_dir, field, cage)
+        out_fp = store.channel_path(exp_dir, field + CLEAN_SUFFIX, cage)
+        if not os.path.exists(in_fp):
+            continue
+        if not force and not store.is_stale([out_fp], [in_fp, tp], since):
+            continue
+        if times is None:
+            times = np.load(tp)
+        # Cleaned in place so only one copy of the channel is in memory.
+        data = np.asarray(store.load_channel(exp_dir, field, cage,
+                                             mmap_mode=None))
+        store.save_array(out_fp, clean_channel(field, data, times, out=data))
+        written.append(out_fp)
+    return written
+
+
+def classify_cage(exp_dir, cage, since=None, force=False, signal_length=100,
+                  k=5, seed=0):
+    '''Cluster windows of the cleaned weight channels of `cage`.
+
+    Falls back to the raw channel where no cleaned channel exists. Returns
+    the paths written.
+    '''
+    written = []
+    for field in SPIKE_FIELDS:
+        in_fp = store.channel_path(exp_dir, field + CLEAN_SUFFIX, cage)
+        if not os.path.exists(in_fp):
+            in_fp = store.channel_path(exp_dir, field, cage)
+        if not os.path.exists(in_fp):
+            continue
+        out_fps = [store.channel_path(exp_dir, field + CLASS_SUFFIX, cage),
+                   store.channel_path(exp_dir, field + CENTROIDS_SUFFIX,
+                                      cage)]
+        if not force and not store.is_stale(out_fps, [in_fp], since):
+            continue
+        data = np.load(in_fp, mmap_mode='r')
+        if data.shape[0] < signal_length * k:
+            continue
+        signals = trace_to_signals_matrix(data, signal_length, 1e-3,
+                                          hop=signal_length)
+        centroids, labels, _ = minibatch_kmeans(signals, k, seed=seed)
+        store.save_array(out_fps[0], labels.astype(np.min_scalar_type(k - 1)))
+        store.save_array(out_fps[1], centroids)
+        written.extend(out_fps)
+    return written
+
+
+# Summarize -----------------------------------------------------------------
+
+SUMMARY_COLUMNS = ['cage', 'field', 'day', 'n', 'mean', 'min', 'max', 'sum',
+                   'change']
+
+
+def daily_summary(data, times):
+    '''Return per day statistics of a channel.
+
+    Days are counted from the start of the experiment. Returns a dict of
+    arrays, one entry per day with data: 'day', 'n' (non NaN samples),
+    'mean', 'min', 'max', 'sum' and 'change' (first minus last sample, the
+    amount consumed for weight sensors).
+    '''
+    days = (np.asarray(times) // 86400).astype(np.intp)
+    data = np.asarray(data, dtype=np.float64)
+    if days.shape[0] == 0:
+        empty = np.empty(0)
+        return {'day': days, 'n': np.empty(0, dtype=np.intp), 'mean': empty,
+                'min': empty, 'max': empty, 'sum': empty, 'change': empty}
+    starts = np.hstack(([0], (np.diff(days) != 0).nonzero()[0] + 1))
+    ends = np.hstack((starts[1:], [days.shape[0]]))
+    valid = ~np.isnan(data)
+    n = np.add.reduceat(valid, starts)
+    total = np.add.reduceat(np.where(valid, data, 0), starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {'day': days[starts], 'n': n,
+                'mean': total / n,
+                'min': np.fmin.reduceat(data, starts),
+                'max': np.fmax.reduceat(data, starts),
+                'sum': total,
+                'change': data[starts] - data[ends - 1]}
+
+
+def summarize_experiment(exp_dir, since=None, force=False):
+    '''Write the per day summary of every raw channel of `exp_dir`.'''
+    out_fp = os.path.join(exp_dir, SUMMARY_FILE)
+    tp = store.time_path(exp_dir)
+    fields = store.channels(exp_dir)
+    inputs = [tp] + [store.channel_path(exp_dir, f, c)
+                     for f, cages in fields.items() for c in cages]
+    if not force and not store.is_stale([out_fp], inputs, since):
+        return []
+    times = np.load(tp, mmap_mode='r')
+    rows = []
+    for field in sorted(fields):
+        for cage in fields[field]:
+            data = store.load_channel(exp_dir, field, cage)
+            if data.ndim != 1 or data.shape[0] != times.shape[0]:
+                continue
+            s = daily_summary(data, times)
+            for i in range(s['day'].shape[0]):
+                rows.append('\t'.join(
+                    [cage, field, '%d' % s['day'][i], '%d' % s['n'][i]] +
+                    ['%.6g' % s[c][i] for c in SUMMARY_COLUMNS[4:]]))
+    with open(out_fp + '.tmp', 'w') as f:
+        f.write('\t'.join(SUMMARY_COLUMNS) + '\n')
+        f.write(''.join(r + '\n' for r in rows))
+    os.replace(out_fp + '.tmp', out_fp)
+    return [out_fp]
+
+
+def archive_store(exp_dir, output, since=None, force=False, codec='zlib'):
+    '''Archive `exp_dir` into a directory of `output`; return it if written.
+    '''
+    out_dir = os.path.join(output, os.path.basename(os.path.normpath(exp_dir)))
+    keys = [(f, c) for f, cages in store.channels(exp_dir).items()
+            for c in cages]
+    inputs = [store.time_path(exp_dir)]
+    outputs = []
+    for f, c in keys:
+        fp = store.channel_path(exp_dir, f, c)
+        # Only one dimensional channels are archived.
+        if np.load(fp, mmap_mode='r').ndim == 1:
+            inputs.append(fp)
+            outputs.append(archive_path(out_dir, f, c))
+    if not force and not store.is_stale(outputs, inputs, since):
+        return []
+    archive_experiment(exp_dir, out_dir, codec=codec)
+    return [out_dir]
+
+
+# Driver --------------------------------------------------------------------
+
+def _cages(exp_dir):
+    '''Return the cages with any raw channel in `exp_dir`.'''
+    cages = set()
+    for c in store.channels(exp_dir).values():
+        cages.update(c)
+    return sorted(cages, key=lambda c: (len(c), c))
+
+
+def _tasks(args):
+    '''Return list of (function, args, kwargs) for the command in `args`.'''
+    since, force = args.since, getattr(args, 'force', False)
+    if args.command == 'ingest':
+        return [(ingest_experiment, (e, args.raw, args.pattern, since), {})
+                for e in args.experiments]
+    if args.command == 'summarize':
+        return [(summarize_experiment, (e, since, force), {})
+                for e in args.experiments]
+    if args.command == 'archive':
+        return [(archive_store, (e, args.output, since, force),
+                 {'codec': args.codec}) for e in args.experiments]
+    tasks = []
+    for e in args.experiments:
+        for cage in _cages(e):
+            if args.command == 'preprocess':
+                tasks.append((preprocess_cage, (e, cage, since, force), {}))
+            else:
+                tasks.append((classify_cage, (e, cage, since, force),
+                              {'signal_length': args.signal_length,
+                               'k': args.k, 'seed': args.seed}))
+    return tasks
+
+
+def _call(task):
+    func, a, kw = task
+    return func(*a, **kw)
+
+
+def run(args):
+    '''Run the tasks of a parsed command line; return their results.'''
+    tasks = _tasks(args)
+    if args.jobs == 1 or len(tasks) < 2:
+        return [_call(t) for t in tasks]
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        return list(pool.map(_call, tasks))
+
+
+def build_parser():
+    '''Return the argument parser of the `bcp` command.'''
+    parser = argparse.ArgumentParser(
+        prog='bcp', description='Batch processing of Promethion experiment '
+        'stores. Only out of date outputs are recomputed.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    commands = {}
+    for name, help in [('ingest', 'append new raw Promethion exports'),
+                       ('preprocess', 'remove sensor artifacts'),
+                       ('classify', 'cluster weight sensor windows'),
+                       ('summarize', 'write per day channel statistics'),
+                       ('archive', 'write a compressed archive')]:
+        p = sub.add_parser(name, help=help)
+        p.add_argument('experiments', nargs='+', metavar='EXPERIMENT',
+                       help='experiment store directories')
+        p.add_argument('-j', '--jobs', type=int, default=1,
+                       help='number of worker processes (default: 1)')
+        p.add_argument('--since', type=parse_since, default=None,
+                       help='only consider inputs modified after this time, '
+                       'an ISO date/datetime or e.g. 12h, 2d')
+        if name != 'ingest':
+            p.add_argument('--force', action='store_true',
+                           help='recompute outputs even if up to date')
+        commands[name] = p
+    commands['ingest'].add_argument(
+        '--raw', help='directory of raw exports (remembered after the first '
+        'ingest)')
+    commands['ingest'].add_argument(
+        '--pattern', default='*.csv',
+        help='glob of export file names (default: *.csv)')
+    commands['classify'].add_argument('--signal-length', type=int,
+                                      default=100)
+    commands['classify'].add_argument('-k', type=int, default=5)
+    commands['classify'].add_argument('--seed', type=int, default=0)
+    commands['archive'].add_argument('--output', required=True,
+                                     help='directory to archive into')
+    commands['archive'].add_argument('--codec', choices=sorted(CODECS),
+                                     default='zlib')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        results = run(args)
+    except (OSError, ValueError) as e:
+        sys.stderr.write('bcp %s: error: %s\n' % (args.command, e))
+        return 1
+    for written in results:
+        for fp in written:
+            print(fp)
+    return 0
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+from __future__ import division
+
+import os
+import numpy as np
+from bcp import store
+
+'''
+Min/max decimation pyramids for plotting long sensor traces.
+
+Level k of a pyramid holds the minimum and maximum of `data` over consecutive
+buckets of factor**k samples. Drawing one vertical min-max segment per bucket
+at a bucket size near one pixel looks identical to drawing every sample (no
+spike is lost) while sending at most ~2 points per pixel to matplotlib.
+Pyramids are cached as `<channel>.pyramid.npz` next to the channel's `.npy`
+file in the experiment directory.
+
+Examples
+--------
+>>> pyramid = load_pyramid('data/exp1/Water_2.npy')
+>>> x, y = decimated_trace(pyramid, data, times, 0, 12 * 3600, 1000)
+'''
+
+def _reduce_columns(ufunc, x):
+    '''Return ufunc.reduce(x, axis=1), combining whole columns.
+
+    Reducing each short row is several times slower than `factor` passes
+    over the columns.
+    '''
+    out = x[:, 0].copy()
+    for k in range(1, x.shape[1]):
+        ufunc(out, x[:, k], out=out)
+    return out
+
+
+def build_pyramid(data, factor=4, min_buckets=2):
+    '''Build a min/max decimation pyramid of `data`.
+
+    Parameters
+    ----------
+    data : np.array
+        One dimensional array (may be a memmap). NaNs are ignored unless a
+        whole bucket is NaN.
+    factor : int, optional
+        Number of buckets of one level combined into a bucket of the next.
+    min_buckets : int, optional
+        Stop adding levels once a level has at most this many buckets.
+
+    Returns
+    -------
+    dict
+        'factor', 'n' (length of `data`) and 'mins'/'maxs': lists whose
+        (k-1)th entries are the bucket minima and maxima of level k.
+    '''
+    if factor < 2:
+        raise ValueError('`factor` must be at least 2.')
+    mins, maxs = [], []
+    lo = hi = np.asarray(data)
+    while lo.shape[0] > min_buckets:
+        pad = -lo.shape[0] % factor
+        if pad:
+            # Repeating the last value leaves the last bucket's extremes
+            # unchanged for any dtype (NaN is not representable in integer
+            # channels).
+            lo = np.concatenate((lo, np.repeat(lo[-1:], pad)))
+            hi = np.concatenate((hi, np.repeat(hi[-1:], pad)))
+        lo = _reduce_columns(np.fmin, lo.reshape(-1, factor))
+        hi = _reduce_columns(np.fmax, hi.reshape(-1, factor))
+        mins.append(lo)
+        maxs.append(hi)
+    return {'factor': factor, 'n': np.asarray(data).shape[0], 'mins': mins,
+            'maxs': maxs}
+
+
+def select_level(pyramid, start, stop, width):
+    '''Return the finest level drawing [start, stop) in <= `width` buckets.
+
+    Level 0 means the raw samples, which are used whenever there are no more
+    than 2 * `width` of them.
+    '''
+    n = max(stop - start, 0)
+    if n <= 2 * width:
+        return 0
+    level = int(np.ceil(np.log(n / width) / np.log(pyramid['factor'])))
+    return min(level, len(pyramid['mins']))
+
+
+def decimated_trace(pyramid, data, times, start_time, stop_time, width):
+    '''Return x, y points to draw `data` between two times at `width` pixels.
+
+    Parameters
+    ----------
+    pyramid : dict
+        Output of `build_pyramid` or `load_pyramid` for `data`.
+    data : np.array
+        The raw data (may be a memmap, only the visible range is read when
+        drawing raw samples).
+    times : np.array
+        Sorted times of each entry of `data`.
+    start_time, stop_time : numeric
+        Time range to draw.
+    width : int
+        Width of the plotting area in pixels.
+
+    Returns
+    -------
+    x, y : np.array
+        For raw samples, the samples themselves. For a decimated level, two
+        points (the bucket minimum then maximum) at the time of the first
+        sample of each bucket.
+    '''
+    start, stop = np.searchsorted(times, [start_time, stop_time])
+    # Include one sample either side so lines reach the plot edges.
+    start = max(start - 1, 0)
+    stop = min(stop + 1, pyramid['n'])
+    level = select_level(pyramid, start, stop, width)
+    if level == 0:
+        return np.asarray(times[start:stop]), np.asarray(data[start:stop])
+    bucket = pyramid['factor'] ** level
+    b0 = start // bucket
+    b1 = -(-stop // bucket)
+    x = np.repeat(np.asarray(times)[np.arange(b0, b1) * bucket], 2)
+    y = np.empty(2 * (b1 - b0), dtype=pyramid['mins'][level - 1].dtype)
+    y[::2] = pyramid['mins'][level - 1][b0:b1]
+    y[1::2] = pyramid['maxs'][level - 1][b0:b1]
+    return x, y
+
+
+def pyramid_path(channel_fp):
+    '''Return the cache path of the pyramid for the channel at `channel_fp`.
+    '''
+    return os.path.splitext(channel_fp)[0] + '.pyramid.npz'
+
+
+def save_pyramid(fp, pyramid):
+    '''Save `pyramid` to the .npz file `fp`.'''
+    arrays = {}
+    for k, (lo, hi) in enumerate(zip(pyramid['mins'], pyramid['maxs'])):
+        arrays['min_%d' % (k + 1)] = lo
+        arrays['max_%d' % (k + 1)] = hi
+    # Write then rename so concurrent readers never see a partial file.
+    tmp = fp + '.tmp.npz'
+    np.savez(tmp, factor=pyramid['factor'], n=pyramid['n'], **arrays)
+    os.replace(tmp, fp)
+
+
+def read_pyramid(fp):
+    '''Load a pyramid saved with `save_pyramid`.'''
+    with np.load(fp) as f:
+        levels = len([k for k in f.files if k.startswith('min_')])
+        return {'factor': int(f['factor']), 'n': int(f['n']),
+                'mins': [f['min_%d' % k] for k in range(1, levels + 1)],
+                'maxs': [f['max_%d' % k] for k in range(1, levels + 1)]}
+
+
+def load_pyramid(channel_fp, factor=4):
+    '''Return the pyramid of a channel, building and caching it if stale.
+
+    The cached pyramid is rebuilt when it is missing, older than the channel
+    file, or was built with a different `factor`.
+    '''
+    fp = pyramid_path(channel_fp)
+    if (os.path.exists(fp) and
+            os.path.getmtime(fp) >= os.path.getmtime(channel_fp)):
+        pyramid = read_pyramid(fp)
+        if pyramid['factor'] == factor:
+            return pyramid
+    pyramid = build_pyramid(store.load_channel_file(channel_fp), factor)
+    save_pyramid(fp, pyramid)
+    return pyramid
@@ -3,6 +3,7 @@ from __future__ import division
 
 import numpy as np
 from bcp.util import add_seconds
+from bcp.profiling import instrument
 
 '''
 This library contains functions for replicating the Ethoscan functionality
@@ -42,6 +43,7 @@ def parse_ethoscan_line(line):
     v = line.strip().split(',')
     return [v[0], v[4], v[3], v[5], v[6], v[7], v[8], v[9]]
 
+@instrument
 def parse_ethoscan_report(lines, start_time=None):
     '''Parse Ethoscan report, casting behaviors to integers to avoid mixed type.
 
@@ -1,11 +1,48 @@
 #!/usr/bin/env python
 from __future__ import division
 
+import functools
 import numpy as np
-from scipy.cluster.vq import whiten
+from numpy.lib.stride_tricks import sliding_window_view
+from bcp.profiling import instrument
+from bcp.cache import cached
+from bcp.util import float_dtype, output_array
 
 
-def trace_to_signals_matrix(data, signal_length, regularization_value=1e-5):
+@instrument
+def signal_windows(data, signal_length, hop=None):
+    '''Return a read only strided view of windows of `data`.
+
+    Parameters
+    ----------
+    data : np.array
+        One dimensional array of data.
+    signal_length : int
+        Length of each window.
+    hop : int, optional
+        Number of samples between the starts of consecutive windows. Defaults
+        to `signal_length` (non-overlapping windows).
+
+    Returns
+    -------
+    np.array
+        View of shape k X signal_length where k is
+        (data.shape[0] - signal_length) // hop + 1. No data is copied.
+    '''
+    if hop is None:
+        hop = signal_length
+    if hop < 1:
+        raise ValueError('`hop` must be a positive integer.')
+    if data.shape[0] < signal_length:
+        return np.empty((0, signal_length), dtype=data.dtype)
+    return sliding_window_view(data, signal_length)[::hop]
+
+
+@instrument
+@cached
+def trace_to_signals_matrix(data, signal_length, regularization_value=1e-5,
+                            hop=None, out=None, chunk_size=None,
+                            dtype=None):
     '''Create a 2D array of signals from a singal data trace.
 
     Notes
@@ -17,6 +54,12 @@ def trace_to_signals_matrix(data, signal_length, regularization_value=1e-5):
     a signal is passed which has little variance. This seems to occur more with
     shorter signal lengths.
 
+    Rows are read from a strided view of `data` (see `signal_windows`) and
+    written straight into `out`, so the only full size allocation is the
+    output itself. If `chunk_size` is given the column standard deviations are
+    also accumulated `chunk_size` rows at a time; otherwise they are computed
+    with `np.std`, which briefly needs one more array the size of the output.
+
     Parameters
     ----------
     data : np.array
@@ -27,15 +70,396 @@ def trace_to_signals_matrix(data, signal_length, regularization_value=1e-5):
     regularization_value : float, optional
         This value is added to the standard deviation of each column before the
         column is divided (rescaled to have variance 1).
+    hop : int, optional
+        Number of samples between the starts of consecutive signals. Defaults
+        to `signal_length`, i.e. non-overlapping signals.
+    out : np.array, optional
+        Array of shape k X signal_length to write the result into (e.g. a
+        memmap). Its dtype sets the precision of the computation.
+    chunk_size : int, optional
+        Number of rows to process at a time.
+    dtype : np.dtype, optional
+        Dtype of the result when `out` is not given. Defaults to that of
+        floating point `data` (see `bcp.util.float_dtype`).
 
     Returns
     -------
     np.array
         Array of shape k X signal_length where k is
-        data.shape[0] // signal_length. Data has has had row means subtracted
-        and where each column has been rescaled.
+        (data.shape[0] - signal_length) // hop + 1 (data.shape[0] //
+        signal_length for the default hop). Data has has had row means
+        subtracted and where each column has been rescaled.
+    '''
+    if chunk_size is not None and chunk_size < 1:
+        raise ValueError('`chunk_size` must be a positive integer.')
+    windows = signal_windows(data, signal_length, hop)
+    nrows = windows.shape[0]
+    out = output_array(out, windows.shape, float_dtype(data, dtype))
+    if nrows == 0:
+        return out
+    step = nrows if chunk_size is None else chunk_size
+
+    for i in range(0, nrows, step):
+        w = windows[i:i + step]
+        np.subtract(w, np.expand_dims(w.mean(1), axis=1), out=out[i:i + step])
+
+    if chunk_size is None:
+        std = out.std(0)
+    else:
+        mean = np.zeros(signal_length, dtype=out.dtype)
+        for i in range(0, nrows, step):
+            mean += out[i:i + step].sum(0)
+        mean /= nrows
+        var = np.zeros(signal_length, dtype=out.dtype)
+        for i in range(0, nrows, step):
+            var += ((out[i:i + step] - mean)**2).sum(0)
+        std = np.sqrt(var / nrows)
+    std += regularization_value
+
+    for i in range(0, nrows, step):
+        np.divide(out[i:i + step], std, out=out[i:i + step])
+    return out
+
+
+@functools.lru_cache(maxsize=64)
+def _taper(window, n, dtype):
+    '''Return a cached, read only periodic taper of length `n`.'''
+    k = np.arange(n)
+    if window in (None, 'boxcar'):
+        w = np.ones(n)
+    elif window == 'hann':
+        w = .5 - .5 * np.cos(2 * np.pi * k / n)
+    elif window == 'hamming':
+        w = .54 - .46 * np.cos(2 * np.pi * k / n)
+    else:
+        raise ValueError('Unknown window %r.' % window)
+    w = w.astype(dtype)
+    w.flags.writeable = False
+    return w
+
+
+@functools.lru_cache(maxsize=64)
+def rfft_frequencies(n, sample_spacing=1.):
+    '''Return cached, read only `np.fft.rfftfreq(n, sample_spacing)`.'''
+    f = np.fft.rfftfreq(n, sample_spacing)
+    f.flags.writeable = False
+    return f
+
+
+@instrument
+@cached
+def power_spectra(signals, sample_spacing=1., window='hann',
+                  segment_length=None, hop=None, dtype=np.float32):
+    '''Compute one sided power spectral densities of every signal.
+
+    Parameters
+    ----------
+    signals : np.array
+        Array of shape (..., signal_length), e.g. the output of
+        `trace_to_signals_matrix`, or a stack of them for several cages and
+        channels. Spectra are computed along the last axis.
+    sample_spacing : float, optional
+        Seconds between samples.
+    window : {'hann', 'hamming', 'boxcar', None}, optional
+        Taper applied to each (segment of a) signal.
+    segment_length : int, optional
+        If given, each signal is split into segments of this length which
+        are averaged (Welch's method). Defaults to the whole signal.
+    hop : int, optional
+        Samples between segment starts. Defaults to half of
+        `segment_length`.
+    dtype : np.dtype, optional
+        Dtype of the returned spectra.
+
+    Returns
+    -------
+    psd : np.array
+        Array of shape (..., segment_length // 2 + 1).
+    freqs : np.array
+        Frequencies (Hz) of the last axis of `psd`.
+
+    Notes
+    -----
+    Each segment has its mean removed before tapering. All segments of all
+    signals are transformed with a single batched `np.fft.rfft` call; tapers
+    and frequency grids are cached between calls. The scaling matches
+    `scipy.signal.welch(..., scaling='density')`.
+    '''
+    signals = np.asarray(signals)
+    n = signals.shape[-1] if segment_length is None else segment_length
+    if hop is None:
+        hop = max(n // 2, 1)
+    work_dtype = np.result_type(signals.dtype, np.float32)
+    segments = sliding_window_view(signals, n, axis=-1)[..., ::hop, :]
+    taper = _taper(window, n, work_dtype)
+
+    x = segments - segments.mean(-1, keepdims=True)
+    x *= taper
+    spectra = np.fft.rfft(x, axis=-1)
+    psd = spectra.real**2 + spectra.imag**2
+    psd = psd.mean(-2)
+    scale = 2. * sample_spacing / (taper**2).sum()
+    psd *= scale
+    # DC (and Nyquist for even lengths) have no mirrored bin to fold in.
+    psd[..., 0] /= 2
+    if n % 2 == 0:
+        psd[..., -1] /= 2
+    return psd.astype(dtype, copy=False), rfft_frequencies(n, sample_spacing)
+
+
+@instrument
+def band_powers(psd, freqs, bands):
+    '''Integrate power spectral densities over frequency bands.
+
+    Parameters
+    ----------
+    psd : np.array
+        Array of shape (..., len(freqs)) as returned by `power_spectra`.
+    freqs : np.array
+        Frequencies of the last axis of `psd`.
+    bands : array-like
+        K x 2 array of [low, high) band edges in Hz.
+
+    Returns
+    -------
+    np.array
+        Array of shape (..., K) with the power in each band.
+    '''
+    bands = np.atleast_2d(np.asarray(bands, dtype=float))
+    df = freqs[1] - freqs[0] if freqs.shape[0] > 1 else 1.
+    cs = np.cumsum(psd, axis=-1, dtype=np.float64)
+    cs = np.concatenate((np.zeros(psd.shape[:-1] + (1,)), cs), axis=-1)
+    lo = np.searchsorted(freqs, bands[:, 0], side='left')
+    hi = np.searchsorted(freqs, bands[:, 1], side='left')
+    return ((cs[..., hi] - cs[..., lo]) * df).astype(psd.dtype, copy=False)
+
+
+@instrument
+def dominant_frequencies(psd, freqs, exclude_dc=True):
+    '''Return the frequency with the most power for every spectrum.'''
+    start = 1 if exclude_dc and freqs.shape[0] > 1 else 0
+    return freqs[start + psd[..., start:].argmax(-1)].astype(psd.dtype)
+
+
+@instrument
+@cached
+def spectral_features(signals, bands, sample_spacing=1., window='hann',
+                      segment_length=None, hop=None, dtype=np.float32):
+    '''Compute band powers, dominant frequency and total power per signal.
+
+    Parameters
+    ----------
+    signals : np.array
+        Array of shape (..., signal_length). See `power_spectra` for this and
+        the remaining spectral parameters.
+    bands : array-like
+        K x 2 array of [low, high) band edges in Hz.
+
+    Returns
+    -------
+    np.array
+        Array of shape (..., K + 2) and dtype `dtype`. The first K columns
+        are the band powers, followed by the dominant frequency and the total
+        power of the signal.
+    '''
+    psd, freqs = power_spectra(signals, sample_spacing, window,
+                               segment_length, hop, dtype)
+    features = np.empty(psd.shape[:-1] + (len(np.atleast_2d(bands)) + 2,),
+                        dtype=dtype)
+    features[..., :-2] = band_powers(psd, freqs, bands)
+    features[..., -2] = dominant_frequencies(psd, freqs)
+    df = freqs[1] - freqs[0] if freqs.shape[0] > 1 else 1.
+    features[..., -1] = psd.sum(-1, dtype=np.float64) * df
+    return features
+
+
+@instrument
+def squared_distances(X, centroids, x_sq=None, c_sq=None):
+    '''Return squared Euclidean distances between rows of X and centroids.
+
+    Notes
+    -----
+    Expands ||x - c||**2 into ||x||**2 - 2 x.c + ||c||**2 so the work is a
+    single matrix product (BLAS) and no n X k X d temporary is formed.
+    Rounding can make the expansion slightly negative; results are clipped at
+    0.
+
+    Parameters
+    ----------
+    X : np.array
+        Array of shape n X d.
+    centroids : np.array
+        Array of shape k X d.
+    x_sq, c_sq : np.array, optional
+        Precomputed squared row norms of `X` and `centroids`.
+
+    Returns
+    -------
+    np.array
+        Array of shape n X k.
+    '''
+    if x_sq is None:
+        x_sq = np.einsum('ij,ij->i', X, X)
+    if c_sq is None:
+        c_sq = np.einsum('ij,ij->i', centroids, centroids)
+    d = X.dot(centroids.T)
+    d *= -2
+    d += x_sq[:, np.newaxis]
+    d += c_sq
+    return np.maximum(d, 0, out=d)
+
+
+@instrument
+@cached
+def assign_clusters(X, centroids, chunk_size=65536):
+    '''Assign each row of `X` to its nearest centroid, streaming over rows.
+
+    Parameters
+    ----------
+    X : np.array
+        Array of shape n X d. May be a memmap; only `chunk_size` rows are
+        read into memory at a time.
+    centroids : np.array
+        Array of shape k X d.
+    chunk_size : int, optional
+        Number of rows to process at a time.
+
+    Returns
+    -------
+    labels : np.array
+        Index of the nearest centroid for each row of `X`.
+    distances : np.array
+        Squared distance from each row of `X` to its centroid.
+    '''
+    n = X.shape[0]
+    labels = np.empty(n, dtype=np.intp)
+    distances = np.empty(n, dtype=np.result_type(X.dtype, centroids.dtype))
+    c_sq = np.einsum('ij,ij->i', centroids, centroids)
+    for i in range(0, n, chunk_size):
+        d = squared_distances(np.asarray(X[i:i + chunk_size]), centroids,
+                              c_sq=c_sq)
+        labels[i:i + chunk_size] = d.argmin(1)
+        distances[i:i + chunk_size] = d[np.arange(d.shape[0]),
+                                        labels[i:i + chunk_size]]
+    return labels, distances
+
+
+def _sample_rows(X, size, rs):
+    '''Read `size` random rows of `X` (in file order, for memmaps).'''
+    if size >= X.shape[0]:
+        return np.asarray(X[:])
+    idx = np.sort(rs.choice(X.shape[0], size, replace=False))
+    return np.asarray(X[idx])
+
+
+@instrument
+def kmeans_plusplus(X, k, seed=None, sample_size=None):
+    '''Choose initial centroids with k-means++ seeding.
+
+    Parameters
+    ----------
+    X : np.array
+        Array of shape n X d.
+    k : int
+        Number of centroids.
+    seed : int or np.random.RandomState, optional
+        Seed for the random number generator.
+    sample_size : int, optional
+        If given, seed from this many randomly drawn rows of `X` rather than
+        all of them. Useful for memmapped matrices that do not fit in memory.
+
+    Returns
+    -------
+    np.array
+        Array of shape k X d with rows drawn from `X`.
+    '''
+    rs = np.random.RandomState(seed) if not isinstance(
+        seed, np.random.RandomState) else seed
+    S = _sample_rows(X, X.shape[0] if sample_size is None else sample_size, rs)
+    if S.shape[0] < k:
+        raise ValueError('Need at least `k` rows to choose centroids from.')
+    s_sq = np.einsum('ij,ij->i', S, S)
+    centroids = np.empty((k, S.shape[1]), dtype=S.dtype)
+    centroids[0] = S[rs.randint(S.shape[0])]
+    closest = squared_distances(S, centroids[:1], x_sq=s_sq)[:, 0]
+    for i in range(1, k):
+        total = closest.sum()
+        if total > 0:
+            j = np.searchsorted(np.cumsum(closest), rs.uniform(0, total))
+            j = min(j, S.shape[0] - 1)
+        else:
+            j = rs.randint(S.shape[0])
+        centroids[i] = S[j]
+        np.minimum(closest,
+                   squared_distances(S, centroids[i:i + 1], x_sq=s_sq)[:, 0],
+                   out=closest)
+    return centroids
+
+
+@instrument
+def minibatch_kmeans(X, k, batch_size=1024, n_iter=100, seed=None,
+                     init_size=None, tol=0., chunk_size=65536):
+    '''Cluster rows of `X` with mini-batch k-means.
+
+    Parameters
+    ----------
+    X : np.array
+        Array of shape n X d, e.g. the output of `trace_to_signals_matrix`
+        written to a memmap. Only batches and chunks of rows are read.
+    k : int
+        Number of clusters.
+    batch_size : int, optional
+        Number of rows drawn for each centroid update.
+    n_iter : int, optional
+        Maximum number of mini-batch updates.
+    seed : int, optional
+        Seed for the random number generator.
+    init_size : int, optional
+        Number of rows used for k-means++ seeding. Defaults to
+        max(3 * batch_size, 10 * k), capped at n.
+    tol : float, optional
+        Stop early when no centroid moves more than `tol` (Euclidean) in an
+        update.
+    chunk_size : int, optional
+        Number of rows per chunk when assigning the final labels.
+
+    Returns
+    -------
+    centroids : np.array
+        Array of shape k X d.
+    labels : np.array
+        Cluster index of each row of `X`.
+    inertia : float
+        Sum of squared distances of rows to their centroids.
+
+    Notes
+    -----
+    Each update assigns a random batch to the current centroids and moves
+    every centroid to the running mean of all rows ever assigned to it (the
+    per-center learning rate of Sculley, 2010). Empty clusters keep their
+    position.
     '''
-    nrows = data.shape[0] // signal_length
-    nd = data[:nrows * signal_length].reshape(nrows, signal_length)
-    nd = nd - np.expand_dims(nd.mean(1), axis=1)
-    return nd / (nd.std(0) + regularization_value)
+    rs = np.random.RandomState(seed)
+    n = X.shape[0]
+    if init_size is None:
+        init_size = max(3 * batch_size, 10 * k)
+    centroids = kmeans_plusplus(X, k, rs, min(init_size, n)).astype(
+        np.result_type(X.dtype, np.float32))
+    counts = np.zeros(k)
+    for _ in range(n_iter):
+        batch = _sample_rows(X, min(batch_size, n), rs)
+        labels = squared_distances(batch, centroids).argmin(1)
+        batch_counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, batch)
+        hit = batch_counts > 0
+        counts[hit] += batch_counts[hit]
+        new = centroids.copy()
+        new[hit] += (sums[hit] - batch_counts[hit, np.newaxis] *
+                     centroids[hit]) / counts[hit, np.newaxis]
+        shift = np.sqrt(((new - centroids)**2).sum(1)).max()
+        centroids = new
+        if shift <= tol:
+            break
+    labels, distances = assign_clusters(X, centroids, chunk_size)
+    return centroids, labels, float(distances.sum())
@@ -0,0 +1,646 @@
+#!/usr/bin/env python
+from __future__ import division
+
+import numpy as np
+
+'''
+Discrete hidden Markov models for behavior segmentation.
+
+Observations are integer symbols, e.g. the output of
+`bcp.preprocess.discretize_observations`. Negative symbols mark missing
+observations (e.g. recording gaps) and are treated as uninformative. Every
+function accepts a single sequence of shape (T,) or a batch of equal length
+sequences of shape (S, T), e.g. one row per cage; the batch is processed
+together. The recursions over time are split into blocks of about
+sqrt(chunk_size) steps that are advanced together, so a chunk takes a few
+times sqrt(chunk_size) Python iterations rather than chunk_size.
+
+Parameters are stored as probabilities:
+startprob : np.array
+    Array of shape (K,), the initial state distribution.
+transmat : np.array
+    Array of shape (K, K), transmat[i, j] = P(state j at t+1 | state i at t).
+emissionprob : np.array
+    Array of shape (K, M), emissionprob[i, m] = P(symbol m | state i).
+
+Examples
+--------
+>>> obs = discretize_observations(np.vstack((xs, ys)), 4)
+>>> startprob, transmat, emissionprob, ll = baum_welch(obs, 5, 16, seed=0)
+>>> states, log_prob = viterbi(obs, startprob, transmat, emissionprob)
+'''
+
+# Largest difference between the normalized Viterbi scores at the start of
+# a block and at the end of the block before it that `_viterbi_chunk`
+# accepts as agreeing.
+VITERBI_TOLERANCE = 1e-9
+
+
+def _as_batch(obs):
+    '''Return `obs` as a 2d array and whether it was one dimensional.'''
+    obs = np.asarray(obs)
+    return np.atleast_2d(obs), obs.ndim == 1
+
+
+def _emissions(emissionprob, obs, missing=1.):
+    '''Return P(obs | state) of shape obs.shape + (K,); missing obs get
+    `missing`.'''
+    em = emissionprob.T[np.where(obs < 0, 0, obs)]
+    em[obs < 0] = missing
+    return em
+
+
+def _chunks(T, chunk_size):
+    '''Return list of (start, stop) covering range(T).'''
+    if chunk_size is None:
+        chunk_size = max(T, 1)
+    if chunk_size < 1:
+        raise ValueError('`chunk_size` must be a positive integer.')
+    return [(i, min(i + chunk_size, T)) for i in range(0, T, chunk_size)]
+
+
+def _blocks(L):
+    '''Split L > 0 steps into (b, nb, last): nb blocks of b steps, of which
+    the first `last` are steps of the last block.'''
+    b = int(np.ceil(np.sqrt(L)))
+    nb = -(-L // b)
+    return b, nb, L - (nb - 1) * b
+
+
+def _block_emissions(emissionprob, obs, b, nb, missing):
+    '''Return emissionprob[:, obs] split into nb blocks of b steps.
+
+    The result has shape (b, K, S, nb), steps first and blocks last, so that
+    one step of every block is a contiguous (K, S * nb) array. Missing
+    observations and the steps padding the last block get `missing`.
+    '''
+    K, M = emissionprob.shape
+    table = np.hstack((emissionprob, np.full((K, 1), missing)))
+    S, L = obs.shape
+    symbols = np.full((S, nb * b), M, dtype=np.intp)
+    symbols[:, :L] = np.where(obs < 0, M, obs)
+    symbols = np.ascontiguousarray(
+        symbols.reshape(S, nb, b).transpose(2, 0, 1))
+    # Indices into the flattened table, so that the result is contiguous.
+    index = (np.arange(0, K * (M + 1), M + 1)[:, np.newaxis, np.newaxis] +
+             symbols[:, np.newaxis])
+    return table.ravel()[index]
+
+
+def _from_blocks(a, L):
+    '''Return the first L steps of `a`, shape (b, K, S, nb), as (S, L, K).'''
+    b, K, S, nb = a.shape
+    return a.transpose(2, 3, 0, 1).reshape(S, -1, K)[:, :L]
+
+
+def _transfer(transmat, E, last):
+    '''Return the product of transmat * E[l, :, s, j] over the steps of each
+    block j.
+
+    `E` holds emission probabilities as returned by `_block_emissions`; only
+    the first `last` steps of the last block are used. The products are
+    returned as row normalized matrices of shape (K, K, S, nb) and the log of
+    their row scales, shape (K, S, nb): row i is proportional to the
+    unnormalized forward variable at the end of the block given state i at
+    the step before it. Rows are normalized separately so that no start state
+    underflows against another.
+    '''
+    b, K, S, nb = E.shape
+    trans_t = np.ascontiguousarray(transmat.T)
+    P = np.zeros((K, K, S * nb))
+    P[np.arange(K), np.arange(K)] = 1.
+    log_scale = np.zeros((K, S * nb))
+    # Columns of the last block of each sequence.
+    pad = slice(nb - 1, None, nb)
+    for l in range(b):
+        Q = np.matmul(trans_t, P)
+        Q *= E[l].reshape(K, -1)
+        total = Q.sum(1)
+        if l >= last:
+            Q[..., pad] = P[..., pad]
+            total[:, pad] = 1.
+        with np.errstate(divide='ignore'):
+            log_scale += np.log(total)
+        total[total == 0] = 1.
+        Q /= total[:, np.newaxis]
+        P = Q
+    return P.reshape(K, K, S, nb), log_scale.reshape(K, S, nb)
+
+
+def _forward_chunk(prev, startprob, transmat, emissionprob, obs, log_c,
+                   alphas=None, starts=None):
+    '''Run the scaled forward recursion over one chunk of observations.
+
+    `prev` is the normalized forward variable of the step before the chunk
+    (None at t=0). Writes log scaling factors into `log_c` and, if given, the
+    normalized forward variables into `alphas`. Returns the last of them and
+    the normalized forward variables at the step before every block, which
+    can be passed back as `starts` to rerun the chunk without finding them
+    again.
+
+    The chunk is split into about sqrt(L) blocks of about sqrt(L) steps. The
+    forward variable at the start of every block is found from the products
+    of the block's transition and emission matrices (see `_transfer`), after
+    which the recursion runs in all blocks at once, one step of every block
+    per iteration.
+    '''
+    S, L = obs.shape
+    K = len(startprob)
+    if prev is None:
+        alpha = startprob * _emissions(emissionprob, obs[:, 0])
+        c = alpha.sum(1)
+        alpha /= c[:, np.newaxis]
+        log_c[:, 0] = np.log(c)
+        if alphas is not None:
+            alphas[:, 0] = alpha
+        if L == 1:
+            return alpha, None
+        return _forward_chunk(alpha, startprob, transmat, emissionprob,
+                              obs[:, 1:], log_c[:, 1:],
+                              None if alphas is None else alphas[:, 1:],
+                              starts)
+    b, nb, last = _blocks(L)
+    E = _block_emissions(emissionprob, obs, b, nb, 1.)
+    if starts is None:
+        starts = np.empty((K, S, nb))
+        starts[:, :, 0] = prev.T
+        if nb > 1:
+            P, log_scale = _transfer(transmat, E, last)
+            for j in range(1, nb):
+                with np.errstate(divide='ignore'):
+                    w = np.log(starts[:, :, j - 1]) + log_scale[:, :, j - 1]
+                w = np.exp(w - w.max(0))
+                a = np.einsum('is,ijs->js', w, P[..., j - 1])
+                starts[:, :, j] = a / a.sum(0)
+    trans_t = np.ascontiguousarray(transmat.T)
+    alpha = starts.reshape(K, -1)
+    pad = slice(nb - 1, None, nb)
+    C = np.empty((b, S, nb))
+    A = None if alphas is None else np.empty((b, K, S, nb))
+    for l in range(b):
+        a = trans_t.dot(alpha)
+        a *= E[l].reshape(K, -1)
+        c = a.sum(0)
+        # The padding at the end of the last block leaves it unchanged.
+        if l >= last:
+            a[:, pad] = alpha[:, pad]
+            c[pad] = 1.
+        a /= c
+        alpha = a
+        C[l] = c.reshape(S, nb)
+        if A is not None:
+            A[l] = a.reshape(K, S, nb)
+    log_c[:] = np.log(_from_blocks(C[:, np.newaxis], L)[..., 0])
+    if alphas is not None:
+        alphas[:] = _from_blocks(A, L)
+    return alpha.reshape(K, S, nb)[:, :, -1].T.copy(), starts
+
+
+def _backward_chunk(transmat, emissionprob, obs, c, alphas, beta_last, betas,
+                    w):
+    '''Run the scaled backward recursion over one chunk of observations.
+
+    `c` and `alphas` are the scaling factors and normalized forward variables
+    of the chunk's L steps, and `beta_last` the scaled backward variable of
+    its last step. Writes the scaled backward variables into `betas` and
+    em * betas / c into `w`.
+
+    As in `_forward_chunk` the recursion runs in blocks at once. The
+    backward variable at the end of every block is found from the products
+    of the following block's matrices and scaled so that its product with
+    the forward variable sums to 1, as every scaled pair does.
+    '''
+    S, L = obs.shape
+    K = len(transmat)
+    b, nb, last = _blocks(L)
+    E = _block_emissions(emissionprob, obs, b, nb, 1.)
+    beta = np.empty((K, S, nb))
+    beta[:, :, -1] = beta_last.T
+    if nb > 1:
+        P, log_scale = _transfer(transmat, E, last)
+        for j in range(nb - 2, -1, -1):
+            v = np.einsum('ijs,js->is', P[..., j + 1], beta[:, :, j + 1])
+            with np.errstate(divide='ignore'):
+                v = np.log(v) + log_scale[:, :, j + 1]
+            v = np.exp(v - v.max(0))
+            beta[:, :, j] = v / (v * alphas[:, (j + 1) * b - 1].T).sum(0)
+    C = np.ones((S, nb * b))
+    C[:, :L] = c
+    C = C.reshape(S, nb, b).transpose(2, 0, 1).reshape(b, -1)
+    beta = beta.reshape(K, -1)
+    pad = slice(nb - 1, None, nb)
+    B = np.empty((b, K, S * nb))
+    W = np.empty((b, K, S * nb))
+    for l in range(b - 1, -1, -1):
+        if l < b - 1:
+            new = transmat.dot(W[l + 1])
+            # The last block starts at its last real step.
+            if l >= last - 1:
+                new[:, pad] = beta[:, pad]
+            beta = new
+        B[l] = beta
+        W[l] = E[l].reshape(K, -1) * beta / C[l]
+    betas[:] = _from_blocks(B.reshape(b, K, S, nb), L)
+    w[:] = _from_blocks(W.reshape(b, K, S, nb), L)
+
+
+def forward(obs, startprob, transmat, emissionprob, chunk_size=65536):
+    '''Return the log likelihood of each observation sequence.
+
+    Notes
+    -----
+    Uses the scaled forward recursion: the forward variable is renormalized
+    at every step and the log of the normalizers is accumulated, which is
+    equivalent to the log space recursion without a logsumexp per step.
+    Only `chunk_size` steps of emission probabilities are held at a time.
+
+    Returns
+    -------
+    np.array or float
+        Log likelihood per sequence (a float for a single sequence).
+    '''
+    obs, single = _as_batch(obs)
+    S, T = obs.shape
+    loglik = np.zeros(S)
+    alpha = None
+    for t0, t1 in _chunks(T, chunk_size):
+        log_c = np.empty((S, t1 - t0))
+        alpha, _ = _forward_chunk(alpha, startprob, transmat, emissionprob,
+                                  obs[:, t0:t1], log_c)
+        loglik += log_c.sum(1)
+    return loglik[0] if single else loglik
+
+
+def _posterior_statistics(obs, startprob, transmat, emissionprob, chunk_size,
+                          posteriors=None):
+    '''Expected sufficient statistics via checkpointed forward-backward.
+
+    The forward pass keeps only the forward variables at the start of each
+    block of each chunk. The backward pass walks the chunks in reverse,
+    recomputes the chunk's forward variables from these checkpoints and
+    combines them with the backward variables, so memory is
+    O(S * chunk_size * K) rather than O(S * T * K). Within a chunk both
+    recursions run over blocks of steps at once (see `_forward_chunk` and
+    `_backward_chunk`).
+    '''
+    S, T = obs.shape
+    K, M = emissionprob.shape
+    chunks = _chunks(T, chunk_size)
+    log_c = np.empty((S, T))
+    checkpoints = []
+    alpha = None
+    for t0, t1 in chunks:
+        alpha, starts = _forward_chunk(alpha, startprob, transmat,
+                                       emissionprob, obs[:, t0:t1],
+                                       log_c[:, t0:t1])
+        checkpoints.append(starts)
+
+    start_counts = np.zeros(K)
+    trans_counts = np.zeros((K, K))
+    emission_counts = np.zeros((K, M))
+    # Emission weighted, scaled backward variable em * beta / c of the first
+    # step of the chunk processed previously (i.e. the step after the current
+    # chunk).
+    w_after = None
+    for (t0, t1), starts in zip(chunks[::-1], checkpoints[::-1]):
+        o = obs[:, t0:t1]
+        L = t1 - t0
+        alphas = np.empty((S, L, K))
+        _forward_chunk(None if t0 == 0 else starts[:, :, 0].T, startprob,
+                       transmat, emissionprob, o, np.empty((S, L)), alphas,
+                       starts)
+        betas = np.empty((S, L, K))
+        w = np.empty((S, L, K))
+        beta_last = (np.ones((S, K)) if w_after is None else
+                     w_after.dot(transmat.T))
+        _backward_chunk(transmat, emissionprob, o, np.exp(log_c[:, t0:t1]),
+                        alphas, beta_last, betas, w)
+        # Pairs (t, t+1) inside the chunk and the pair crossing into the
+        # following chunk.
+        trans_counts += np.einsum('sli,slj->ij', alphas[:, :-1], w[:, 1:])
+        if w_after is not None:
+            trans_counts += np.einsum('si,sj->ij', alphas[:, -1], w_after)
+        w_after = w[:, 0]
+
+        gamma = alphas * betas
+        if posteriors is not None:
+            posteriors[:, t0:t1] = gamma
+        if t0 == 0:
+            start_counts += gamma[:, 0].sum(0)
+        observed = o >= 0
+        symbols = o[observed]
+        for k in range(K):
+            emission_counts[k] += np.bincount(symbols,
+                                              weights=gamma[..., k][observed],
+                                              minlength=M)[:M]
+    trans_counts *= transmat
+    return log_c.sum(1), start_counts, trans_counts, emission_counts
+
+
+def posterior_probabilities(obs, startprob, transmat, emissionprob,
+                            chunk_size=65536, out=None):
+    '''Return P(state at t | all observations) for every step.
+
+    Parameters
+    ----------
+    obs : np.array
+        Observation sequence(s), see module docstring.
+    startprob, transmat, emissionprob : np.array
+        Model parameters, see module docstring.
+    chunk_size : int, optional
+        Number of steps processed at a time, bounding working memory.
+    out : np.array, optional
+        Array of shape obs.shape + (K,) to write the result into, e.g. a
+        memmap.
+
+    Returns
+    -------
+    np.array
+    '''
+    obs2, single = _as_batch(obs)
+    if out is None:
+        out = np.empty(obs2.shape + (emissionprob.shape[0],))
+    posteriors = out.reshape(obs2.shape + (emissionprob.shape[0],))
+    _posterior_statistics(obs2, startprob, transmat, emissionprob,
+                          chunk_size, posteriors)
+    return out
+
+
+def _normalize(counts, pseudocount):
+    '''Normalize rows of `counts` (plus `pseudocount`) to sum to 1.'''
+    counts = counts + pseudocount
+    total = counts.sum(-1, keepdims=True)
+    total[total == 0] = 1.
+    return counts / total
+
+
+def random_parameters(n_states, n_symbols, seed=None, self_transition=.9):
+    '''Draw random startprob, transmat and emissionprob.
+
+    Behaviors persist for many seconds, so the transition matrix is drawn
+    with `self_transition` of each row's mass on the diagonal; EM started
+    from near uniform transitions converges very slowly on long sequences.
+    '''
+    rs = np.random.RandomState(seed)
+    transmat = (1 - self_transition) * rs.dirichlet(np.ones(n_states),
+                                                    size=n_states)
+    transmat[np.diag_indices(n_states)] += self_transition
+    return (rs.dirichlet(np.ones(n_states)), transmat,
+            rs.dirichlet(np.ones(n_symbols), size=n_states))
+
+
+def baum_welch(obs, n_states, n_symbols=None, n_iter=20, tol=1e-4, seed=None,
+               startprob=None, transmat=None, emissionprob=None,
+               pseudocount=0., chunk_size=65536):
+    '''Fit a discrete HMM with the Baum-Welch (EM) algorithm.
+
+    Parameters
+    ----------
+    obs : np.array
+        Observation sequence(s), see module docstring.
+    n_states : int
+        Number of hidden states.
+    n_symbols : int, optional
+        Number of distinct symbols. Defaults to obs.max() + 1.
+    n_iter : int, optional
+        Maximum number of EM iterations.
+    tol : float, optional
+        Stop when the total log likelihood improves by less than `tol`.
+    seed : int, optional
+        Seed for the random initial parameters.
+    startprob, transmat, emissionprob : np.array, optional
+        Initial parameters. Any not passed are drawn at random.
+    pseudocount : float, optional
+        Added to every expected count before normalizing, which keeps
+        unseen transitions and symbols at non-zero probability.
+    chunk_size : int, optional
+        Number of steps processed at a time, bounding working memory.
+
+    Returns
+    -------
+    startprob, transmat, emissionprob : np.array
+        Fitted parameters.
+    log_likelihoods : np.array
+        Total log likelihood of the data before each parameter update.
+    '''
+    obs, _ = _as_batch(obs)
+    if n_symbols is None:
+        n_symbols = int(obs.max()) + 1
+    init = random_parameters(n_states, n_symbols, seed)
+    startprob = init[0] if startprob is None else np.asarray(startprob, float)
+    transmat = init[1] if transmat is None else np.asarray(transmat, float)
+    emissionprob = (init[2] if emissionprob is None else
+                    np.asarray(emissionprob, float))
+
+    log_likelihoods = []
+    for _ in range(n_iter):
+        loglik, start, trans, emis = _posterior_statistics(
+            obs, startprob, transmat, emissionprob, chunk_size)
+        log_likelihoods.append(loglik.sum())
+        startprob = _normalize(start, pseudocount)
+        transmat = _normalize(trans, pseudocount)
+        emissionprob = _normalize(emis, pseudocount)
+        if (len(log_likelihoods) > 1 and
+                log_likelihoods[-1] - log_likelihoods[-2] < tol):
+            break
+    return startprob, transmat, emissionprob, np.array(log_likelihoods)
+
+
+def _viterbi_blocks(starts, log_trans, LE, last, backptr=None):
+    '''Run the Viterbi recursion over blocks of steps at once.
+
+    Arrays have the state axis first and the blocks last, so that each
+    state's scores over all blocks are contiguous.
+
+    Parameters
+    ----------
+    starts : np.array
+        Normalized (maximum 0) log scores of shape (K, S, n) at the step
+        before each block.
+    log_trans : np.array
+        Log transition matrix.
+    LE : np.array
+        Log emission probabilities of shape (b, K, S, n).
+    last : int
+        Number of steps of the last block; its remaining steps are padding
+        and leave its scores unchanged.
+    backptr : np.array, optional
+        Array of shape (b, K, S * n) to write the back pointers into.
+
+    Returns
+    -------
+    delta : np.array
+        Normalized log scores at the end of each block, (K, S, n).
+    offset : np.array
+        Sum over each block of the maxima subtracted to normalize, (S, n).
+    '''
+    K, S, n = starts.shape
+    b = LE.shape[0]
+    delta = starts.reshape(K, -1)
+    offset = np.zeros(S * n)
+    # Columns of the last block of each sequence.
+    pad = slice(n - 1, None, n)
+    for l in range(b):
+        # Scores into each state j from each state i, shape (K, K, S * n).
+        scores = delta[:, np.newaxis] + log_trans[..., np.newaxis]
+        new = scores.max(0)
+        if backptr is not None:
+            # The first state with the best score, as argmax (which is slow
+            # along the first axis).
+            best = backptr[l]
+            for i in range(K - 1, -1, -1):
+                np.copyto(best, i, where=scores[i] == new)
+        new += LE[l].reshape(K, -1)
+        m = new.max(0)
+        # Impossible observations leave every score at -inf.
+        m[~np.isfinite(m)] = 0.
+        new -= m
+        if l >= last:
+            new[:, pad] = delta[:, pad]
+            m[pad] = 0.
+            if backptr is not None:
+                backptr[l][:, pad] = np.arange(K)[:, np.newaxis]
+        offset += m
+        delta = new
+    return delta.reshape(K, S, n), offset.reshape(S, n)
+
+
+def _viterbi_chunk(prev, log_trans, LE, last):
+    '''Return the scores at the step before each block of a chunk.
+
+    `prev` holds the normalized log scores of shape (S, K) of the step before
+    the chunk and `LE` the chunk's log emissions split into blocks, of shape
+    (b, K, S, nb). The blocks are first run from uniform scores; every block
+    whose start then differs from the end of the block before it is run
+    again from that end, until they agree. Once the best paths into every
+    state pass through one state the normalized scores no longer depend on
+    where they started, so in practice one rerun settles every block. Starts
+    are compared to within `VITERBI_TOLERANCE`.
+
+    Returns
+    -------
+    starts : np.array
+        Normalized log scores at the step before each block, (K, S, nb).
+    delta : np.array
+        Normalized log scores at the end of the chunk, (S, K).
+    offset : np.array
+        Sum of the maxima subtracted over the chunk.
+    '''
+    b, K, S, nb = LE.shape
+    starts = np.zeros((K, S, nb))
+    starts[:, :, 0] = prev.T
+    ends = np.empty((K, S, nb))
+    offsets = np.empty((S, nb))
+    todo = np.arange(nb)
+    while todo.size:
+        # np.take (unlike indexing) returns contiguous blocks.
+        ends[..., todo], offsets[:, todo] = _viterbi_blocks(
+            np.take(starts, todo, -1), log_trans,
+            LE if todo.size == nb else np.take(LE, todo, -1),
+            last if todo[-1] == nb - 1 else b)
+        agree = np.isclose(starts[..., 1:], ends[..., :-1], rtol=0,
+                           atol=VITERBI_TOLERANCE).all((0, 1))
+        todo = np.flatnonzero(~agree) + 1
+        starts[..., todo] = ends[..., todo - 1]
+    return starts, ends[..., -1].T, offsets.sum(1)
+
+
+def _backtrack_chunk(starts, log_trans, LE, last, end_state):
+    '''Return the best states of a chunk and of the step before it.
+
+    `starts` and `LE` are as for `_viterbi_chunk` and `end_state` is the
+    best state at the last step of the chunk. The back pointers of the
+    chunk are recomputed from `starts`. For every block and every state it
+    could end in, the path through the block is traced in all blocks at
+    once; the end state of each block is then read off the path of the
+    block after it.
+    '''
+    b, K, S, nb = LE.shape
+    dtype = np.min_scalar_type(K - 1)
+    backptr = np.empty((b, K, S * nb), dtype=dtype)
+    _viterbi_blocks(starts, log_trans, LE, last, backptr)
+    paths = np.empty((b, K, S * nb), dtype=dtype)
+    state = np.empty((K, S * nb), dtype=dtype)
+    state[:] = np.arange(K)[:, np.newaxis]
+    cols = np.arange(S * nb)
+    for l in range(b - 1, -1, -1):
+        paths[l] = state
+        state = backptr[l][state, cols]
+    state = state.reshape(K, S, nb)
+    rows = np.arange(S)
+    ends = np.empty((S, nb), dtype=np.intp)
+    ends[:, -1] = end_state
+    for j in range(nb - 1, 0, -1):
+        ends[:, j - 1] = state[ends[:, j], rows, j]
+    states = np.take_along_axis(paths.reshape(b, K, S, nb),
+                                ends[np.newaxis, np.newaxis], 1)[:, 0]
+    return (states.transpose(1, 2, 0).reshape(S, -1),
+            state[ends[:, 0], rows, 0])
+
+
+def viterbi(obs, startprob, transmat, emissionprob, chunk_size=65536):
+    '''Find the most likely state sequence(s) in log space.
+
+    Parameters
+    ----------
+    obs : np.array
+        Observation sequence(s), see module docstring.
+    startprob, transmat, emissionprob : np.array
+        Model parameters, see module docstring.
+    chunk_size : int, optional
+        Number of steps processed at a time, bounding working memory.
+
+    Returns
+    -------
+    states : np.array
+        Most likely state at each step, same shape as `obs`.
+    log_prob : np.array or float
+        Log probability of the most likely path per sequence.
+
+    Notes
+    -----
+    The forward pass keeps only the scores at the start of every block of
+    every chunk (see `_viterbi_chunk`). Back pointers are recomputed one
+    chunk at a time while tracing the path backwards, in the smallest
+    unsigned integer type that can hold a state index, so besides `states`
+    memory is O(S * chunk_size * K).
+    '''
+    obs, single = _as_batch(obs)
+    S, T = obs.shape
+    if T == 0:
+        states, log_prob = np.empty((S, 0), dtype=np.intp), np.zeros(S)
+        return (states[0], log_prob[0]) if single else (states, log_prob)
+    with np.errstate(divide='ignore'):
+        log_start = np.log(startprob)
+        log_trans = np.log(transmat)
+        log_emis = np.log(emissionprob)
+
+    delta = log_start + _emissions(log_emis, obs[:, 0], 0.)
+    log_prob = delta.max(1)
+    delta -= log_prob[:, np.newaxis]
+    # Chunks of the steps after the first.
+    chunks = [(t0 + 1, t1 + 1) for t0, t1 in _chunks(T - 1, chunk_size)]
+    checkpoints = []
+    for t0, t1 in chunks:
+        b, nb, last = _blocks(t1 - t0)
+        starts, delta, offset = _viterbi_chunk(
+            delta, log_trans,
+            _block_emissions(log_emis, obs[:, t0:t1], b, nb, 0.), last)
+        checkpoints.append(starts)
+        log_prob += offset
+    rows = np.arange(S)
+    state = delta.argmax(1)
+    log_prob += delta[rows, state]
+
+    states = np.empty((S, T), dtype=np.intp)
+    for (t0, t1), starts in zip(chunks[::-1], checkpoints[::-1]):
+        b, nb, last = _blocks(t1 - t0)
+        path, state = _backtrack_chunk(
+            starts, log_trans,
+            _block_emissions(log_emis, obs[:, t0:t1], b, nb, 0.), last,
+            state)
+        states[:, t0:t1] = path[:, :t1 - t0]
+    states[:, 0] = state
+    if single:
+        return states[0], log_prob[0]
+    return states, log_prob
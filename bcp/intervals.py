@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+from __future__ import division
+
+import numpy as np
+
+'''
+Sorted interval index for querying behavioral events.
+
+Events produced by Ethoscan (see `bcp.ethoscan.parse_ethoscan_report`) or by
+our own classifiers are half open intervals [start, end) measured in seconds
+since the start of the experiment. `IntervalIndex` sorts them once and answers
+overlap, stabbing and nearest neighbour queries with binary searches instead of
+scanning every event with boolean masks.
+
+Examples
+--------
+Find the behaviors that overlap the first hour of the experiment, and the
+fraction of each night spent in a long lounge.
+>>> starts, ends, activity = ethoscan_intervals(data)
+>>> index = IntervalIndex(starts, ends, activity)
+>>> index.labels[index.overlap(0, 3600)]
+>>> llnge = IntervalIndex(*ethoscan_intervals(data, activity=7)[:2])
+>>> llnge.coverage(nights[:, 0], nights[:, 1]) / (nights[:, 1] - nights[:, 0])
+'''
+
+def ethoscan_intervals(data, activity=None):
+    '''Return start, end and activity of parsed Ethoscan observations.
+
+    Parameters
+    ----------
+    data : np.array
+        Output of `bcp.ethoscan.parse_ethoscan_report`.
+    activity : int or list, optional
+        If passed, only observations whose activity code (see
+        `bcp.ethoscan.BEHAVIOR_CODES_TO_INT_MAP`) is in `activity` are
+        returned.
+
+    Returns
+    -------
+    starts : np.array
+        Time each behavior started.
+    ends : np.array
+        Time each behavior ended (`starts` plus the duration).
+    activities : np.array
+        Integer activity code of each behavior.
+    '''
+    if activity is not None:
+        data = data[np.isin(data[:, 1], activity)]
+    return data[:, 0], data[:, 0] + data[:, 2], data[:, 1].astype(int)
+
+
+class IntervalIndex(object):
+    '''Index of half open intervals [start, end) sorted by start.
+
+    Notes
+    -----
+    Intervals are sorted by start and a running maximum of their ends is kept.
+    Intervals that can overlap a query [qs, qe) have a start before `qe` and a
+    running maximum end after `qs`; both bounds are found with
+    `np.searchsorted`. The candidates between the bounds are then filtered on
+    their own ends. For event streams where no interval is nested inside
+    another (true of Ethoscan reports and run-length based detectors) every
+    candidate is a hit and queries are O(log n + k) for k reported intervals.
+    Deeply nested intervals degrade gracefully to scanning the candidates.
+
+    All returned indices refer to the order in which the intervals were passed
+    to the constructor.
+
+    Parameters
+    ----------
+    starts : np.array
+        One dimensional array of interval starts.
+    ends : np.array
+        One dimensional array of interval ends (exclusive).
+    labels : np.array, optional
+        Values attached to each interval, e.g. activity codes. Exposed as
+        `labels` and indexed by the indices the queries return.
+    '''
+
+    def __init__(self, starts, ends, labels=None):
+        starts = np.asarray(starts, dtype=float)
+        ends = np.asarray(ends, dtype=float)
+        if starts.shape != ends.shape or starts.ndim != 1:
+            raise ValueError('`starts` and `ends` must be one dimensional '
+                             'arrays of the same length.')
+        if (ends < starts).any():
+            raise ValueError('Some intervals end before they start.')
+        order = np.argsort(starts, kind='mergesort')
+        self._order = order
+        self._starts = starts[order]
+        self._ends = ends[order]
+        self._max_ends = np.maximum.accumulate(self._ends)
+        # Sorted position of the interval achieving the running maximum end.
+        is_max = self._ends == self._max_ends
+        self._argmax_ends = np.maximum.accumulate(
+            np.where(is_max, np.arange(order.shape[0]), 0))
+        self.starts = starts
+        self.ends = ends
+        self.labels = None if labels is None else np.asarray(labels)
+
+    def __len__(self):
+        return self._starts.shape[0]
+
+    def _candidates(self, qs, qe):
+        '''Return sorted position bounds of intervals that may overlap.'''
+        lo = np.searchsorted(self._max_ends, qs, side='right')
+        hi = np.searchsorted(self._starts, qe, side='left')
+        return lo, np.maximum(lo, hi)
+
+    def overlap(self, start, end):
+        '''Return indices of intervals overlapping [start, end).
+
+        A zero length query (start == end) behaves like `stab`.
+        '''
+        if start == end:
+            return self.stab(start)
+        lo, hi = self._candidates(start, end)
+        pos = np.arange(lo, hi)
+        pos = pos[self._ends[pos] > start]
+        return np.sort(self._order[pos])
+
+    def stab(self, t):
+        '''Return indices of intervals containing the point `t`.'''
+        lo = np.searchsorted(self._max_ends, t, side='right')
+        hi = np.searchsorted(self._starts, t, side='right')
+        pos = np.arange(lo, hi)
+        pos = pos[self._ends[pos] > t]
+        return np.sort(self._order[pos])
+
+    def within(self, start, end, distance):
+        '''Return indices of intervals within `distance` of [start, end).'''
+        return self.overlap(start - distance, end + distance)
+
+    def overlap_batch(self, starts, ends):
+        '''Find all (query, interval) overlapping pairs for many queries.
+
+        Parameters
+        ----------
+        starts : np.array
+            Starts of the query intervals.
+        ends : np.array
+            Ends (exclusive) of the query intervals. Queries where
+            start == end are treated as points.
+
+        Returns
+        -------
+        query_idx : np.array
+            Index of the query for each overlapping pair.
+        interval_idx : np.array
+            Index of the interval for each overlapping pair. Pairs are ordered
+            by query and then by interval start.
+        '''
+        qs = np.asarray(starts, dtype=float)
+        qe = np.asarray(ends, dtype=float)
+        lo = np.searchsorted(self._max_ends, qs, side='right')
+        # Points need intervals starting at `t` included.
+        hi = np.where(qs == qe,
+                      np.searchsorted(self._starts, qe, side='right'),
+                      np.searchsorted(self._starts, qe, side='left'))
+        counts = np.maximum(hi - lo, 0)
+        query_idx = np.repeat(np.arange(qs.shape[0]), counts)
+        # Position of each candidate: lo of its query plus its rank in query.
+        offsets = np.cumsum(counts) - counts
+        pos = (lo[query_idx] + np.arange(counts.sum()) -
+               np.repeat(offsets, counts))
+        keep = self._ends[pos] > qs[query_idx]
+        return query_idx[keep], self._order[pos[keep]]
+
+    def stab_batch(self, times):
+        '''Find all (query, interval) pairs where interval contains time.'''
+        times = np.asarray(times, dtype=float)
+        return self.overlap_batch(times, times)
+
+    def count_overlaps(self, starts, ends):
+        '''Return the number of intervals overlapping each query.'''
+        query_idx, _ = self.overlap_batch(starts, ends)
+        return np.bincount(query_idx, minlength=np.size(starts))
+
+    def coverage(self, starts, ends):
+        '''Return the time each query interval spends inside indexed intervals.
+
+        Notes
+        -----
+        Overlapping indexed intervals are counted once per interval, so the
+        coverage can exceed the query length if the index holds intervals that
+        overlap one another.
+        '''
+        qs = np.asarray(starts, dtype=float)
+        qe = np.asarray(ends, dtype=float)
+        query_idx, interval_idx = self.overlap_batch(qs, qe)
+        overlap = (np.minimum(qe[query_idx], self.ends[interval_idx]) -
+                   np.maximum(qs[query_idx], self.starts[interval_idx]))
+        return np.bincount(query_idx, weights=overlap, minlength=qs.shape[0])
+
+    def nearest(self, times):
+        '''Return the index of, and distance to, the nearest interval.
+
+        Parameters
+        ----------
+        times : numeric or np.array
+            Query time(s).
+
+        Returns
+        -------
+        idx : np.array
+            Index of the nearest interval to each query. Intervals containing
+            a query are at distance 0. Ties are broken in favor of the
+            interval preceding the query.
+        distance : np.array
+            Distance from each query to its nearest interval.
+        '''
+        if len(self) == 0:
+            raise ValueError('Cannot query an empty IntervalIndex.')
+        t = np.atleast_1d(np.asarray(times, dtype=float))
+        # Intervals starting at or before `t`: the one reaching furthest right
+        # is the closest of them (distance 0 if it contains `t`).
+        left = np.searchsorted(self._starts, t, side='right') - 1
+        has_left = left >= 0
+        left = np.maximum(left, 0)
+        left_end = self._max_ends[left]
+        left_dist = np.where(has_left, np.maximum(t - left_end, 0), np.inf)
+        argmax_pos = self._argmax_ends[left]
+        # Intervals starting after `t`: the first one is the closest.
+        right = left + has_left
+        has_right = right < len(self)
+        right = np.minimum(right, len(self) - 1)
+        right_dist = np.where(has_right, self._starts[right] - t, np.inf)
+        pos = np.where(left_dist <= right_dist, argmax_pos, right)
+        return self._order[pos], np.minimum(left_dist, right_dist)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+from __future__ import division
+
+import numpy as np
+
+'''
+Closed form light/dark cycle calculations.
+
+A light schedule is a 2d array with one row per schedule change. Each row is
+(time the schedule takes effect in seconds since the experiment started, hour
+lights turn on, hours of light). The first row also applies before the
+time it takes effect, so it normally takes effect at 0. A
+single (day_start, day_length) pair may be passed for an unchanging schedule.
+Hours may be fractional and the light period may span midnight.
+
+Examples
+--------
+Lights on at 7:00 for 12h, switching to lights on at 9:00 for 10h after 10
+days.
+>>> schedule = [[0, 7, 12], [10 * 86400, 9, 10]]
+>>> dark = dark_intervals(schedule, start_timestamp, total_exp_seconds)
+>>> dark_idx = intervals_to_indices(dark, times)
+'''
+
+SECONDS_PER_DAY = 24 * 3600
+
+
+def seconds_of_day(dt):
+    '''Return seconds elapsed since midnight for datetime `dt`.'''
+    return (dt.hour * 3600 + dt.minute * 60 + dt.second +
+            dt.microsecond / 1e6)
+
+
+def make_schedule(schedule):
+    '''Return `schedule` as a validated N x 3 float array.
+
+    Parameters
+    ----------
+    schedule : array-like
+        Either a (day_start, day_length) pair or rows of (change_time,
+        day_start, day_length). See module docstring.
+
+    Returns
+    -------
+    np.array
+        N x 3 array of (change_time, day_start, day_length) sorted by
+        change_time.
+    '''
+    schedule = np.atleast_2d(np.asarray(schedule, dtype=float))
+    if schedule.shape[1] == 2:
+        schedule = np.hstack((np.zeros((schedule.shape[0], 1)), schedule))
+    if schedule.shape[1] != 3:
+        raise ValueError('`schedule` rows must be (day_start, day_length) or '
+                         '(change_time, day_start, day_length).')
+    if ((schedule[:, 2] < 0) | (schedule[:, 2] > 24)).any():
+        raise ValueError('Day lengths must be between 0 and 24 hours.')
+    return schedule[np.argsort(schedule[:, 0], kind='mergesort')]
+
+
+def _merge_abutting(intervals):
+    '''Merge intervals where one ends exactly where the next begins.'''
+    if intervals.shape[0] < 2:
+        return intervals
+    new = np.hstack(([True], intervals[1:, 0] != intervals[:-1, 1]))
+    starts = intervals[new, 0]
+    ends = intervals[np.hstack((new[1:], [True])), 1]
+    return np.vstack((starts, ends)).T
+
+
+def light_intervals(schedule, start_timestamp, total_exp_seconds):
+    '''Return array of times at which cages are light.
+
+    Parameters
+    ----------
+    schedule : array-like
+        Light schedule, see `make_schedule`.
+    start_timestamp : datetime.datetime
+        The datetime object corresponding to the first recording of the
+        experiment.
+    total_exp_seconds : numeric
+        The total number of seconds in the experiment.
+
+    Returns
+    -------
+    np.array
+        Nx2 array with N light periods. The [i,0] entry is the time the ith
+        light period starts (in seconds since the experiment started) and
+        [i,1] is the time it ends. Periods are clipped to
+        [0, total_exp_seconds]; periods of zero length are dropped.
+
+    Notes
+    -----
+    Lights go on at `day_start*3600 - seconds_of_day(start_timestamp) +
+    k*86400` seconds for integer k, so every light period of a schedule
+    segment is produced with a single `np.arange`. Only `start_timestamp` is
+    converted from a datetime; daylight saving time changes are ignored.
+    '''
+    schedule = make_schedule(schedule)
+    offset = seconds_of_day(start_timestamp)
+    # The first row applies from the start, as in `is_light`.
+    seg_starts = np.hstack(([0], np.maximum(schedule[1:, 0], 0)))
+    seg_ends = np.hstack((schedule[1:, 0], [total_exp_seconds]))
+    seg_ends = np.minimum(seg_ends, total_exp_seconds)
+
+    intervals = []
+    for (_, day_start, day_length), s, e in zip(schedule, seg_starts,
+                                                seg_ends):
+        if e <= s or day_length == 0:
+            continue
+        phase = day_start * 3600 - offset
+        # First cycle whose light period ends after `s`, last that starts
+        # before `e`.
+        k0 = np.floor((s - phase - day_length * 3600) / SECONDS_PER_DAY) + 1
+        k1 = np.ceil((e - phase) / SECONDS_PER_DAY)
+        on = phase + SECONDS_PER_DAY * np.arange(k0, k1)
+        seg = np.vstack((np.clip(on, s, e),
+                         np.clip(on + day_length * 3600, s, e))).T
+        intervals.append(seg)
+    if not intervals:
+        return np.empty((0, 2))
+    intervals = np.vstack(intervals)
+    intervals = intervals[intervals[:, 1] > intervals[:, 0]]
+    return _merge_abutting(intervals)
+
+
+def complement_intervals(intervals, total_exp_seconds):
+    '''Return the gaps between sorted, disjoint `intervals` in the experiment.
+    '''
+    bounds = np.hstack(([0], intervals.ravel(), [total_exp_seconds]))
+    gaps = bounds.reshape(-1, 2)
+    return gaps[gaps[:, 1] > gaps[:, 0]]
+
+
+def dark_intervals(schedule, start_timestamp, total_exp_seconds):
+    '''Return array of times at which cages are dark.
+
+    See `light_intervals` for parameters. The return has the same layout as
+    `bcp.util.nights`.
+    '''
+    light = light_intervals(schedule, start_timestamp, total_exp_seconds)
+    return complement_intervals(light, total_exp_seconds)
+
+
+def is_light(times, schedule, start_timestamp):
+    '''Return boolean array, True where `times` fall in a light period.
+
+    Parameters
+    ----------
+    times : np.array
+        Seconds since the experiment started for each observation.
+    schedule : array-like
+        Light schedule, see `make_schedule`.
+    start_timestamp : datetime.datetime
+        The datetime object corresponding to time 0.
+
+    Returns
+    -------
+    np.array
+    '''
+    schedule = make_schedule(schedule)
+    times = np.asarray(times)
+    seg = np.maximum(np.searchsorted(schedule[:, 0], times, side='right') - 1,
+                     0)
+    day_start, day_length = schedule[seg, 1], schedule[seg, 2]
+    clock = times + seconds_of_day(start_timestamp) - day_start * 3600
+    return np.mod(clock, SECONDS_PER_DAY) < day_length * 3600
+
+
+def intervals_to_indices(intervals, times):
+    '''Convert intervals in seconds to index spans of `times`.
+
+    Parameters
+    ----------
+    intervals : np.array
+        Nx2 array of (start, end) times such as returned by
+        `light_intervals`.
+    times : np.array
+        Sorted one dimensional array of observation times.
+
+    Returns
+    -------
+    np.array
+        Nx2 integer array where times[idx[i, 0]:idx[i, 1]] are the
+        observations falling in [intervals[i, 0], intervals[i, 1]).
+    '''
+    return np.searchsorted(times, intervals, side='left')
+
+
+def interval_labels(intervals, times, fill=-1):
+    '''Return, for each entry of `times`, the index of its interval.
+
+    Observations outside every interval get `fill`. The output can be fed to
+    `np.bincount` to aggregate per interval without touching datetimes.
+    '''
+    times = np.asarray(times)
+    idx = np.searchsorted(intervals[:, 0], times, side='right') - 1
+    inside = idx >= 0
+    inside[inside] = times[inside] < intervals[idx[inside], 1]
+    return np.where(inside, idx, fill)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+from __future__ import division
+
+import numpy as np
+
+'''
+Occupancy of the cage floor from XPos/YPos beam positions.
+
+Positions are binned into an n X n grid with fixed bounds so maps from
+different cages, intervals and batches of streamed data are comparable and can
+be added together. All counting is done with a single `np.bincount` over
+linear (cage, interval, cell) indices.
+
+Examples
+--------
+Hourly occupancy for all cages, updated as new data is appended.
+>>> bounds = (0, 40, 0, 25)
+>>> labels = interval_labels_by_period(times, 3600)
+>>> counts = occupancy_maps(xs, ys, 10, bounds, labels)
+>>> counts = occupancy_maps(new_xs, new_ys, 10, bounds, new_labels,
+...                         out=counts)
+'''
+
+def grid_indices(x, y, n, bounds):
+    '''Return the linear grid cell of each (x, y) position.
+
+    Parameters
+    ----------
+    x, y : np.array
+        Arrays of positions with the same shape.
+    n : int
+        Number of bins in each dimension.
+    bounds : tuple
+        (xmin, xmax, ymin, ymax) of the grid. Positions on the max edge are
+        placed in the last bin.
+
+    Returns
+    -------
+    np.array
+        Integer array with x bin i and y bin j encoded as i*n + j. Positions
+        that are NaN or outside `bounds` get -1.
+    '''
+    xmin, xmax, ymin, ymax = bounds
+    x = np.asarray(x)
+    y = np.asarray(y)
+    with np.errstate(invalid='ignore'):
+        valid = (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+    i = np.minimum(((np.where(valid, x, xmin) - xmin) * (n / (xmax - xmin)))
+                   .astype(np.intp), n - 1)
+    j = np.minimum(((np.where(valid, y, ymin) - ymin) * (n / (ymax - ymin)))
+                   .astype(np.intp), n - 1)
+    return np.where(valid, i * n + j, -1)
+
+
+def interval_labels_by_period(times, period, offset=0):
+    '''Label each time with the index of its `period` second bin.
+
+    E.g. `period=3600` gives the hour since the experiment started. An
+    `offset` shifts the bin edges (e.g. to start hours on the clock).
+    '''
+    return np.floor_divide(np.asarray(times) + offset, period).astype(np.intp)
+
+
+def occupancy_maps(x, y, n, bounds, labels=None, n_labels=None, out=None):
+    '''Count samples spent in each grid cell, per cage and interval.
+
+    Parameters
+    ----------
+    x, y : np.array
+        Positions of shape (T,) for one cage or (C, T) for C cages recorded
+        at the same times.
+    n : int
+        Number of bins in each dimension.
+    bounds : tuple
+        (xmin, xmax, ymin, ymax) of the grid, see `grid_indices`.
+    labels : np.array, optional
+        Integer array of shape (T,) assigning each sample to an interval
+        (e.g. from `interval_labels_by_period` or
+        `bcp.light_cycle.interval_labels`). Negative labels are ignored. If
+        not passed all samples belong to a single interval.
+    n_labels : int, optional
+        Number of intervals. Defaults to labels.max() + 1, or the number of
+        intervals of `out` if that is larger. A ValueError is raised if a
+        label is not less than it.
+    out : np.array, optional
+        Existing counts to add to, for incremental updates as data streams
+        in. Updated in place and returned, unless there are more intervals
+        than it holds (e.g. the stream reached a new day): then a copy with
+        the intervals added is returned, so always use the return value.
+
+    Returns
+    -------
+    np.array
+        Counts of shape (C, n_labels, n, n), without the leading axis for a
+        single cage.
+    '''
+    cells = grid_indices(x, y, n, bounds)
+    single = cells.ndim == 1
+    cells = np.atleast_2d(cells)
+    C, T = cells.shape
+    if labels is None:
+        labels = np.zeros(T, dtype=np.intp)
+    labels = np.asarray(labels)
+    if n_labels is None:
+        n_labels = int(labels.max()) + 1 if labels.size else 0
+    elif labels.size and labels.max() >= n_labels:
+        raise ValueError('Label %d is out of range for %d intervals.'
+                         % (labels.max(), n_labels))
+    if out is not None:
+        n_labels = max(n_labels, out.shape[-3])
+    valid = (cells >= 0) & (labels >= 0)
+    cage = np.arange(C)[:, np.newaxis]
+    linear = (cage * n_labels + labels) * (n * n) + cells
+    counts = np.bincount(linear[valid], minlength=C * n_labels * n * n)
+    counts = counts.reshape(C, n_labels, n, n)
+    if single:
+        counts = counts[0]
+    if out is None:
+        return counts
+    if out.shape[-3] < n_labels:
+        grown = np.zeros(counts.shape, dtype=np.result_type(out, counts))
+        grown[..., :out.shape[-3], :, :] = out
+        out = grown
+    out += counts
+    return out
+
+
+def occupancy_fraction(counts):
+    '''Normalize occupancy counts so each map sums to 1 (0 if empty).'''
+    total = counts.sum((-2, -1), keepdims=True).astype(float)
+    total[total == 0] = 1.
+    return counts / total
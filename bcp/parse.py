@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 import numpy as np
 import datetime, time, os
+from bcp.profiling import instrument
 
 '''
 Library functions for dealing with the Promethion data.
@@ -20,7 +21,9 @@ def time_since_start(x, dt_start):
     '''Count total seconds elapsed between dt_start and x'''
     return (x - dt_start).total_seconds()
 
-def promethion_to_array(fp, cages, fields, start_timestamp=None):
+@instrument
+def promethion_to_array(fp, cages, fields, start_timestamp=None,
+                        dtype=np.float32):
     '''Convert combined Promethion files to numpy arrays.
 
     Paramaters
@@ -37,6 +40,10 @@ def promethion_to_array(fp, cages, fields, start_timestamp=None):
         If a value is passed for this paramter, the function will use it to
         calculate the time elapsed since each observation in the Promethion file
         being read. Useful if appending additional data to an existing array.
+    dtype : np.dtype, optional
+        Dtype of the returned data. A compact type can be passed when all
+        requested fields fit it, e.g. np.uint8 for 'WheelCount' only;
+        `bcp.store` picks compact storage per field when ingesting.
 
     Returns
     -------
@@ -79,8 +86,10 @@ def promethion_to_array(fp, cages, fields, start_timestamp=None):
         start_timestamp = convert_promethion_date(start_timestamp)
     times = [time_since_start(i, start_timestamp) for i in timestamps]
 
-    return np.array(data).astype(np.float32), times, keys
+    return np.array(data).astype(np.float32).astype(dtype, copy=False), \
+        times, keys
 
+@instrument
 def append_to_npy(arr, fp, append=True):
     '''Load array at `fp` and make a new array concatenating it with `arr`.'''
     old_arr = np.load(fp)
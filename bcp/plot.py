@@ -2,10 +2,11 @@
 from __future__ import division
 
 import numpy as np
-import matplotlib.pyplot as plt
 import datetime
 import copy
 from bcp.util import add_seconds
+from bcp.decimate import build_pyramid, decimated_trace
+from bcp.light_cycle import dark_intervals
 
 
 def circadian_rythm_axvspan(day_begin, day_end, start_timestamp, times):
@@ -57,8 +58,183 @@ def circadian_rythm_axvspan(day_begin, day_end, start_timestamp, times):
         night_1_end = night_1_start + delta
     
     nights = [(night_1_start, night_1_end)]
-    for _ in range(np.int(cycles)):
+    for _ in range(int(cycles)):
         n_i_start = nights[-1][1] + day_period
         n_i_end = n_i_start + night_period
         nights.append((n_i_start, n_i_end))
     return nights
+
+
+def plot_decimated(ax, times, data, pyramid=None, **kwargs):
+    '''Plot a long trace, redrawing from a decimation pyramid on zoom.
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        Axes to draw on.
+    times : np.array
+        Sorted times of each entry of `data`.
+    data : np.array
+        One dimensional data (may be a memmap).
+    pyramid : dict, optional
+        Output of `bcp.decimate.build_pyramid` or `load_pyramid` for `data`.
+        Built on the fly if not given.
+    kwargs : dict
+        Passed to `ax.plot`.
+
+    Returns
+    -------
+    matplotlib.lines.Line2D
+
+    Notes
+    -----
+    Whenever the x limits change the line's data is replaced with the
+    pyramid level matching the visible range and the axes width in pixels,
+    so zooming never sends more than ~2 points per pixel to matplotlib.
+    '''
+    if pyramid is None:
+        pyramid = build_pyramid(data)
+
+    def _visible(xmin, xmax):
+        width = max(int(ax.bbox.width), 1)
+        return decimated_trace(pyramid, data, times, xmin, xmax, width)
+
+    line, = ax.plot(*_visible(times[0], times[-1]), **kwargs)
+    ax.set_xlim(times[0], times[-1])
+
+    def _update(ax):
+        line.set_data(*_visible(*ax.get_xlim()))
+
+    ax.callbacks.connect('xlim_changed', _update)
+    return line
+
+
+def shade_intervals(ax, intervals, scale=1., color='0.85', **kwargs):
+    '''Shade vertical spans of `ax` with a single collection.
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        Axes to draw on.
+    intervals : np.array
+        Nx2 array of (start, end) x values, e.g. from
+        `bcp.light_cycle.dark_intervals`.
+    scale : float, optional
+        `intervals` are divided by this value (e.g. 3600 for hours).
+    color : matplotlib color, optional
+        Fill color.
+    kwargs : dict
+        Passed to `PolyCollection`.
+
+    Returns
+    -------
+    matplotlib.collections.PolyCollection
+
+    Notes
+    -----
+    Rectangles span the full height of the axes (x in data, y in axes
+    coordinates), replacing one `axvspan` artist per interval with one
+    artist per axes.
+    '''
+    # matplotlib is imported on first use so that importing bcp stays fast.
+    from matplotlib.collections import PolyCollection
+    from matplotlib.transforms import blended_transform_factory
+
+    x = np.asarray(intervals, dtype=float) / scale
+    verts = np.empty((x.shape[0], 4, 2))
+    verts[:, :, 0] = x[:, [0, 0, 1, 1]]
+    verts[:, :, 1] = [0, 1, 1, 0]
+    coll = PolyCollection(verts, facecolors=color, edgecolors='none',
+                          zorder=0, **kwargs)
+    coll.set_transform(blended_transform_factory(ax.transData, ax.transAxes))
+    ax.add_collection(coll, autolim=False)
+    return coll
+
+
+def multi_cage_figure(data, times, cages, fields, schedule=None,
+                      start_timestamp=None, pyramids=None, time_unit=3600.,
+                      panel_size=(8., 1.2), dpi=100, fig=None):
+    '''Draw a grid of small multiples, one row per cage and field.
+
+    Parameters
+    ----------
+    data : dict
+        Maps '<field>_<cage>' keys (the experiment directory naming, see
+        `bcp.parse._make_fp`) to one dimensional arrays or memmaps. Missing
+        keys leave their panel empty.
+    times : np.array
+        Seconds since the start of the experiment of each sample.
+    cages : list
+        Cage identifiers.
+    fields : list
+        Field names, e.g. ['Water', 'FoodA', 'WheelCount'].
+    schedule : array-like, optional
+        Light schedule (see `bcp.light_cycle`); dark periods are shaded.
+        Requires `start_timestamp`.
+    start_timestamp : datetime.datetime, optional
+        Datetime of time 0.
+    pyramids : dict, optional
+        Decimation pyramids keyed like `data` (see `bcp.decimate`). Built
+        on the fly for missing keys.
+    time_unit : float, optional
+        Seconds per x axis unit (hours by default).
+    panel_size : tuple, optional
+        (width, height) in inches of each panel.
+    dpi : int, optional
+        Resolution used to pick decimation levels and to render.
+    fig : matplotlib.figure.Figure, optional
+        Figure to draw on. A new pyplot-free figure is created if not given.
+
+    Returns
+    -------
+    matplotlib.figure.Figure
+    '''
+    from matplotlib.ticker import MaxNLocator
+
+    nrows = len(cages) * len(fields)
+    if fig is None:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=(panel_size[0], panel_size[1] * nrows), dpi=dpi)
+        FigureCanvasAgg(fig)
+    axes = fig.subplots(nrows, 1, sharex=True, squeeze=False)[:, 0]
+    pyramids = {} if pyramids is None else pyramids
+    width = int(panel_size[0] * dpi)
+    times = np.asarray(times)
+    if schedule is not None:
+        dark = dark_intervals(schedule, start_timestamp, times[-1])
+
+    for ax, (cage, field) in zip(axes, [(c, f) for c in cages
+                                        for f in fields]):
+        key = '%s_%s' % (field, cage)
+        if schedule is not None:
+            shade_intervals(ax, dark, time_unit)
+        ax.set_ylabel(key, rotation=0, ha='right', va='center', fontsize=8)
+        ax.tick_params(labelsize=7)
+        # Tick drawing dominates rendering time: the shared x axis is only
+        # drawn on the bottom panel and y axes get few ticks.
+        ax.yaxis.set_major_locator(MaxNLocator(2))
+        if ax is not axes[-1]:
+            ax.xaxis.set_visible(False)
+        if key not in data:
+            continue
+        if key not in pyramids:
+            pyramids[key] = build_pyramid(data[key])
+        x, y = decimated_trace(pyramids[key], data[key], times, times[0],
+                               times[-1], width)
+        ax.plot(x / time_unit, y, lw=.5, color='k')
+    axes[-1].set_xlim(times[0] / time_unit, times[-1] / time_unit)
+    axes[-1].set_xlabel('Time (%g s)' % time_unit)
+    fig.subplots_adjust(hspace=.1, left=.12, right=.98, top=.99, bottom=.02)
+    return fig
+
+
+def render_overview(fp, data, times, cages, fields, **kwargs):
+    '''Render `multi_cage_figure` to an image file with the Agg backend.
+
+    Works headless, independent of the pyplot backend. `kwargs` are passed
+    to `multi_cage_figure`. Returns the figure.
+    '''
+    fig = multi_cage_figure(data, times, cages, fields, **kwargs)
+    fig.savefig(fp, dpi=fig.dpi)
+    return fig
@@ -3,7 +3,12 @@ from __future__ import division
 
 import copy
 import numpy as np
+from bcp.profiling import instrument
+from bcp.cache import cached
+from bcp.body_mass import body_mass
+from bcp.util import float_dtype, output_array
 
+@instrument
 def weight_sensor_positive_spikes(data, times, threshold):
     '''Find positive spikes in the weight data due to measurement. 
 
@@ -38,7 +43,10 @@ def weight_sensor_positive_spikes(data, times, threshold):
     return (~time_diffs * data_diffs).nonzero()[0]
 
 
-def smooth_positive_spikes(data, spikes, backward_window, forward_window):
+@instrument
+@cached
+def smooth_positive_spikes(data, spikes, backward_window, forward_window,
+                           out=None):
     '''Replace positive spikes with averages of previous points in data.
 
     Parameters
@@ -52,11 +60,14 @@ def smooth_positive_spikes(data, spikes, backward_window, forward_window):
         Number of points of data prior to i to use to compute mean.
     forward_window : int
         Number of points of data after i to set to mean.
+    out : np.array, optional
+        Array to write the result into; may be `data` itself to smooth in
+        place.
 
     Returns
     -------
     s_data : np.array
-        Copy of data with spikes smoothed.
+        Copy of data (or `out`) with spikes smoothed, of the dtype of `data`.
 
     Notes
     -----
@@ -72,7 +83,6 @@ def smooth_positive_spikes(data, spikes, backward_window, forward_window):
     intervals shorter than `forward_window`, we will be using already smoothed
     data for the backward window mean calculation.
     '''
-    s_data = copy.copy(data)
     if (spikes < backward_window).any():
         raise ValueError('Some spikes occur at indices too close to the left '
                          'edge of the data (i.e. smaller than '
@@ -82,11 +92,19 @@ def smooth_positive_spikes(data, spikes, backward_window, forward_window):
         raise ValueError('Some spikes occur at indices too close to the right '
                          'edge of the data. Not all positive spikes can be '
                          'smoothed.')
+    if out is None:
+        s_data = copy.copy(data)
+    else:
+        s_data = output_array(out, data.shape, data.dtype)
+        if s_data is not data:
+            s_data[...] = data
     for i in spikes:
         s_data[i:i+forward_window] = s_data[i-backward_window:i].mean()
     return s_data
 
 
+@instrument
+@cached
 def stable_sequences(data, diff, stability_duration=1):
     '''Find sequences where consecutive entries are within `diff` of each other.
 
@@ -155,6 +173,8 @@ def stable_sequences(data, diff, stability_duration=1):
     return np.array(stable_spans)
 
 
+@instrument
+@cached
 def valued_sequences(data, value, stability_duration=1):
     '''Find sequences where consecutive entries are equal to `value`.
 
@@ -204,6 +224,8 @@ def valued_sequences(data, value, stability_duration=1):
     return np.array(stable_spans)
 
 
+@instrument
+@cached
 def unstable_sequences(data, u_diff, s_diff=None, stability_duration=10):
     '''Find unstable sequences in `data`.
 
@@ -257,6 +279,7 @@ def unstable_sequences(data, u_diff, s_diff=None, stability_duration=10):
     idx = 1
     unstable_spans = []
     n = data.size
+    stable = True
     while idx < n:
         if abs(data[idx - 1] - data[idx]) > u_diff:
             stable = False
@@ -286,7 +309,9 @@ def unstable_sequences(data, u_diff, s_diff=None, stability_duration=10):
     return np.array(unstable_spans)
 
 
-def smooth(data, radius, a_thresh, w_thresh):
+@instrument
+@cached
+def smooth(data, radius, a_thresh, w_thresh, out=None, dtype=None):
     '''Smooth data.
 
     Given an index i in data, taken all indices within radius of i, and compute
@@ -295,12 +320,18 @@ def smooth(data, radius, a_thresh, w_thresh):
     than data[i]. If that number is larger than w_thresh, record
     smoother_data[i] as np.nan. Else, record smoother_data[i] as the median of
     the points within radius of the index i.
+
+    The result has the dtype given by `bcp.util.float_dtype` (that of
+    floating point `data`) unless `dtype` is passed, and is written into
+    `out` if given, which must not overlap `data`.
     '''
     n = len(data)
     start = radius
     stop = n - radius
 
-    smoothed_data = np.zeros(n)
+    smoothed_data = output_array(out, (n,), float_dtype(data, dtype))
+    smoothed_data[:start] = 0
+    smoothed_data[max(stop, start):] = 0
     for i in range(start, stop):
         p =  (a_thresh < abs(data[i-radius:i+radius] - data[i])).sum()
         if p > w_thresh:
@@ -309,10 +340,18 @@ def smooth(data, radius, a_thresh, w_thresh):
             smoothed_data[i] = np.median(data[i-radius:i+radius])
     return smoothed_data
 
-def interpolate_between_nans(smoothed_data):
-    '''Take smoothed data with contiguous nan blocks, remove and interpolate.'''
+@instrument
+@cached
+def interpolate_between_nans(smoothed_data, out=None, dtype=None):
+    '''Take smoothed data with contiguous nan blocks, remove and interpolate.
+
+    The result has the dtype given by `bcp.util.float_dtype` unless `dtype`
+    is passed, and is written into `out` if given, which may be
+    `smoothed_data` itself.
+    '''
     n = len(smoothed_data)
-    interpolated_data = np.empty(n)
+    interpolated_data = output_array(out, (n,), float_dtype(smoothed_data,
+                                                            dtype))
 
     left_index = 0
     right_index = 0
@@ -334,10 +373,12 @@ def interpolate_between_nans(smoothed_data):
             left_index += 1
     return interpolated_data
 
+@instrument
 def find_nan_cumsum(smoothed_data):
     '''Return a vector of the cumulative sum of nans in smoother_data.'''
     return np.isnan(smoothed_data).cumsum()
 
+@instrument
 def discretize_observations(observations, n):
     '''Discretize data into n**2 bins, and flatten.
 
@@ -347,6 +388,13 @@ def discretize_observations(observations, n):
         2d array with shape 2, n.
     n : int
         Number of bins in each dimension of observations.
+
+    Returns
+    -------
+    np.array
+        Integer array where x bin i and y bin j are encoded as i*n + j, i.e.
+        each of the n**2 cells gets a distinct symbol in [0, n**2). See
+        `bcp.occupancy` for binning with fixed cage bounds.
     '''
     xmin, ymin = observations.min(1)
     xmax, ymax = observations.max(1)
@@ -356,10 +404,89 @@ def discretize_observations(observations, n):
     x = np.searchsorted(xbins, observations[0, :]) - 1
     y = np.searchsorted(ybins, observations[1, :]) - 1
 
-    d_observations = x*(x+1) + y
+    d_observations = x*n + y
     return d_observations.astype(int)
 
-def remove_artifacts_body_mass():
+def grid_index(times, period=1, start=None):
+    '''Return the index of each of `times` on a uniform grid.
+
+    Grid point k is at start + k * period; times are rounded to the nearest
+    grid point. `start` defaults to times[0].
+    '''
+    times = np.asarray(times, dtype=np.float64)
+    if start is None:
+        start = times[0] if times.shape[0] else 0
+    return np.rint((times - start) / period).astype(np.intp)
+
+@instrument
+@cached
+def resample_uniform(data, times, period=1, start=None, stop=None,
+                     fill=np.nan, axis=0):
+    '''Place irregularly recorded data on a uniform time grid.
+
+    Parameters
+    ----------
+    data : np.array
+        Data with one entry per element of `times` along `axis`, e.g. the
+        (observations, columns) array from `bcp.parse.promethion_to_array`.
+    times : np.array
+        Sorted time in seconds since the start of the experiment of each
+        observation.
+    period : numeric, optional
+        Grid spacing in seconds.
+    start, stop : numeric, optional
+        Times of the first and last grid points. Default to the first and
+        last of `times`. Observations outside [start, stop] are dropped.
+    fill : numeric, optional
+        Value of grid points without an observation.
+    axis : int, optional
+        Time axis of `data`.
+
+    Returns
+    -------
+    grid_data : np.array
+        `data` with the time axis replaced by the grid. Its dtype is
+        promoted to hold `fill` (e.g. integer data becomes at least float32
+        for NaN).
+    grid_times : np.array
+        Time of each grid point.
+    valid : np.array
+        Boolean array, True for grid points holding an observation.
+
+    Notes
+    -----
+    Each observation goes to its nearest grid point; if several share one,
+    the last is kept. Gaps in the recording become runs of `fill`, so
+    windowed functions applied to `grid_data` (e.g.
+    `bcp.stats.moving_function`) give NaN, rather than mixing data from both
+    sides, for windows that span a gap.
+    '''
+    data = np.asarray(data)
+    times = np.asarray(times, dtype=np.float64)
+    if start is None:
+        start = times[0] if times.shape[0] else 0
+    if stop is None:
+        stop = times[-1] if times.shape[0] else start - period
+    n = max(int(np.rint((stop - start) / period)) + 1, 0)
+    idx = grid_index(times, period, start)
+    keep = (idx >= 0) & (idx < n)
+    # Of observations rounded to the same grid point keep the last.
+    keep[:-1] &= idx[:-1] != idx[1:]
+    idx = idx[keep]
+    data = np.moveaxis(data, axis, 0)
+    dtype = np.promote_types(data.dtype, np.min_scalar_type(fill))
+    if dtype.kind == 'f':
+        # NaN alone promotes small integers to float16.
+        dtype = np.promote_types(dtype, np.float32)
+    grid_data = np.full((n,) + data.shape[1:], fill, dtype=dtype)
+    grid_data[idx] = data[keep]
+    valid = np.zeros(n, dtype=bool)
+    valid[idx] = True
+    return (np.moveaxis(grid_data, 0, axis), start + np.arange(n) * period,
+            valid)
+
+@instrument
+def remove_artifacts_body_mass(data, times, **kwargs):
     '''A function which processes body mass.
 
     The challenege here is that the signal is very noisy at many different
@@ -370,8 +497,26 @@ def remove_artifacts_body_mass():
     inhabiting the house some small positive weight is registered. This is easy
     to programatically eliminate, but detecting when it has gone back to in the
     house (and giving an accurate weight reading) is hard. 
+
+    Parameters
+    ----------
+    data : np.array
+        Body mass readings, one dimensional or one row per cage.
+    times : np.array
+        One dimensional array with the time in seconds since the start of the
+        experiment for each reading.
+    kwargs : dict
+        Passed to `bcp.body_mass.body_mass`, e.g. `min_mass`, `window` or
+        `statistic`.
+
+    Returns
+    -------
+    np.array
+        Estimated body mass at every reading, shaped like `data`: robust
+        estimates over windows of the stretches the mouse sits in its house,
+        interpolated in between. See `bcp.body_mass`.
     '''
-    pass
+    return body_mass(data, times, **kwargs)
 
 def remove_artifacts_water():
     '''Remove artifacts from water data.'''
@@ -381,7 +526,8 @@ def remove_artifacts_food():
     '''Remove artifacts from food hopper data.'''
     return data
 
-def remove_artifacts_wheel_running(data, max_rps=10):
+@instrument
+def remove_artifacts_wheel_running(data, max_rps=10, out=None):
     '''Remove artifacts from wheel running data.
 
     Notes
@@ -394,13 +540,24 @@ def remove_artifacts_wheel_running(data, max_rps=10):
         Wheel count data indicating number of revolutions per second.
     max_rps : int, optional
         Maximum RPS allowed in the data.
+    out : np.array, optional
+        Array to write the result into; may be `data` itself.
 
     Returns
     -------
     np.array
-        Data greater than max_rps will be reduced to max_rps.
+        Data greater than max_rps will be reduced to max_rps, with the dtype of
+        `data`.
     '''
-    return np.where(data > max_rps, max_rps, data)
+    data = np.asarray(data)
+    limit = max_rps
+    if data.dtype.kind in 'iu':
+        # Counts are whole numbers, so clipping at the largest count not
+        # above `max_rps` that the dtype holds is the same.
+        info = np.iinfo(data.dtype)
+        limit = int(min(max(np.floor(max_rps), info.min), info.max))
+    return np.minimum(data, np.array(limit, dtype=data.dtype),
+                      out=output_array(out, data.shape, data.dtype))
 
 def remove_artifacts_x_position(data):
     '''Remove artifacts from x position data.'''
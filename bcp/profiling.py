@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+from __future__ import division
+
+import functools
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+import numpy as np
+
+'''
+Opt-in stage level profiling of the bcp pipeline.
+
+Public array level functions of `bcp.parse`, `bcp.preprocess`, `bcp.stats`,
+`bcp.ethoscan` and `bcp.feature_extraction` are wrapped with `instrument`.
+While a `profiling` block is active every call records its wall time, the
+size of its array arguments and (optionally) the memory it allocated, as
+traced by `tracemalloc`. Outside such a block the wrapper only checks one
+module global before calling the function, so instrumentation is close to
+free when disabled.
+
+Times and allocations are inclusive: a function calling another instrumented
+function is charged for the callee too.
+
+Examples
+--------
+>>> with profiling() as report:
+...     data, times, keys = promethion_to_array(fp, cages, fields)
+...     spikes = weight_sensor_positive_spikes(data[:, 0], times, .2)
+>>> report.dump('run_profile.json')
+>>> print(report.summary())
+'''
+
+# The report currently being recorded into, None when profiling is disabled.
+_active = None
+
+
+def _input_size(args, kwargs):
+    '''Return (number of elements, bytes) of the array arguments of a call.
+
+    Lists and tuples count their length in elements (their contents are not
+    sized, which would cost time proportional to the input).
+    '''
+    elements = nbytes = 0
+    for a in list(args) + list(kwargs.values()):
+        if isinstance(a, np.ndarray):
+            elements += a.size
+            nbytes += a.nbytes
+        elif isinstance(a, (list, tuple)):
+            elements += len(a)
+    return elements, nbytes
+
+
+class ProfileReport(object):
+    '''Per function statistics of one profiled run.
+
+    Attributes
+    ----------
+    stats : dict
+        Keyed by qualified function name ('bcp.preprocess.smooth'). Each entry
+        holds 'calls', 'wall_time' (s), 'max_wall_time' (s), 'input_elements',
+        'input_bytes' and, when memory is traced, 'allocated_bytes' (net bytes
+        still allocated on return, summed over calls) and 'peak_bytes' (the
+        largest peak of traced memory above its level at the call).
+    trace_memory : bool
+        Whether allocations are traced.
+    '''
+
+    def __init__(self, trace_memory=True):
+        self.stats = {}
+        self.trace_memory = trace_memory
+        self.wall_time = 0.
+        # Highest traced memory seen by each active call, see _call_traced.
+        self._peaks = []
+
+    def _record(self, name, wall_time, size, allocated=None, peak=None):
+        s = self.stats.get(name)
+        if s is None:
+            s = self.stats[name] = {'calls': 0, 'wall_time': 0.,
+                                    'max_wall_time': 0., 'input_elements': 0,
+                                    'input_bytes': 0}
+            if self.trace_memory:
+                s['allocated_bytes'] = 0
+                s['peak_bytes'] = 0
+        s['calls'] += 1
+        s['wall_time'] += wall_time
+        s['max_wall_time'] = max(s['max_wall_time'], wall_time)
+        s['input_elements'] += size[0]
+        s['input_bytes'] += size[1]
+        if allocated is not None:
+            s['allocated_bytes'] += allocated
+            s['peak_bytes'] = max(s['peak_bytes'], peak)
+
+    def to_dict(self):
+        '''Return the report as a JSON serializable dict.'''
+        return {'wall_time': self.wall_time,
+                'trace_memory': self.trace_memory,
+                'functions': self.stats}
+
+    def dump(self, fp):
+        '''Write the report as JSON to the path `fp`.'''
+        with open(fp, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+
+    def summary(self):
+        '''Return a table of functions sorted by total wall time.'''
+        lines = ['%-50s %8s %10s %12s' % ('function', 'calls', 'time (s)',
+                                          'peak (MB)')]
+        for name, s in sorted(self.stats.items(),
+                              key=lambda kv: -kv[1]['wall_time']):
+            peak = s.get('peak_bytes')
+            lines.append('%-50s %8d %10.4f %12s' % (
+                name, s['calls'], s['wall_time'],
+                '-' if peak is None else '%.1f' % (peak / 2**20)))
+        return '\n'.join(lines)
+
+
+def _call_traced(report, name, func, args, kwargs):
+    '''Call `func` recording its statistics into `report`.'''
+    size = _input_size(args, kwargs)
+    if not report.trace_memory:
+        t0 = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            report._record(name, time.perf_counter() - t0, size)
+
+    # tracemalloc keeps a single peak which nested calls reset, so the highest
+    # peak seen by each active call is carried on a stack.
+    current, peak = tracemalloc.get_traced_memory()
+    if report._peaks:
+        report._peaks[-1] = max(report._peaks[-1], peak)
+    report._peaks.append(0)
+    tracemalloc.reset_peak()
+    t0 = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        wall_time = time.perf_counter() - t0
+        after, peak = tracemalloc.get_traced_memory()
+        peak = max(report._peaks.pop(), peak)
+        if report._peaks:
+            report._peaks[-1] = max(report._peaks[-1], peak)
+        report._record(name, wall_time, size, after - current,
+                       peak - current)
+
+
+def instrument(func):
+    '''Decorator recording calls of `func` while profiling is enabled.'''
+    name = '%s.%s' % (func.__module__, func.__name__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        report = _active
+        if report is None:
+            return func(*args, **kwargs)
+        return _call_traced(report, name, func, args, kwargs)
+    return wrapper
+
+
+def enabled():
+    '''Return True if a `profiling` block is active.'''
+    return _active is not None
+
+
+@contextmanager
+def profiling(trace_memory=True, fp=None):
+    '''Profile instrumented bcp functions called inside the block.
+
+    Parameters
+    ----------
+    trace_memory : bool, optional
+        Trace allocations with `tracemalloc`. This slows allocation heavy
+        code noticeably; pass False to record only calls and times.
+    fp : str, optional
+        If given, the report is written as JSON to this path on exit.
+
+    Yields
+    ------
+    ProfileReport
+    '''
+    global _active
+    if _active is not None:
+        raise RuntimeError('Profiling is already enabled.')
+    report = ProfileReport(trace_memory)
+    started = trace_memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    _active = report
+    t0 = time.perf_counter()
+    try:
+        yield report
+    finally:
+        report.wall_time = time.perf_counter() - t0
+        _active = None
+        if started:
+            tracemalloc.stop()
+        if fp is not None:
+            report.dump(fp)
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+from __future__ import division
+
+import os
+import numpy as np
+from bcp import store
+
+'''
+Pre-aggregated rollups of 1 Hz channels.
+
+A rollup holds, for consecutive time bins of `resolution` seconds aligned to
+the start of the experiment, the 'count' of non NaN samples and their 'sum',
+'sumsq' (sum of squares), 'min' and 'max'. Any window that is a multiple of
+a stored resolution (water per hour, wheel revolutions per night of whole
+hours, rearing per 10 min) can then be aggregated from a few thousand bins
+instead of millions of samples; `bcp.stats.window_aggregate` does this
+automatically.
+
+The finest resolution is computed from the samples with one `reduceat`;
+coarser ones are combined from the finest. Rollups are kept in
+`<field>_<cage>.rollup.npz` next to the channel and extended as data is
+appended (see `update_rollup`).
+
+Examples
+--------
+>>> rollups = build_rollups(water, times)
+>>> hourly_sum = rollups[3600]['sum']
+'''
+
+RESOLUTIONS = (60, 600, 3600)
+STATISTICS = ('count', 'sum', 'sumsq', 'min', 'max')
+
+
+def compute_rollup(data, times, resolution, first_bin=None):
+    '''Aggregate `data` into bins of `resolution` seconds.
+
+    Parameters
+    ----------
+    data : np.array
+        One dimensional array (may be a memmap).
+    times : np.array
+        Sorted seconds since the start of the experiment of each sample.
+    resolution : int
+        Bin width in seconds; bin k covers [k * resolution,
+        (k + 1) * resolution).
+    first_bin : int, optional
+        Index of the first bin returned. Defaults to the bin of times[0].
+
+    Returns
+    -------
+    dict
+        'first_bin' and one array per `STATISTICS` entry covering every bin
+        from `first_bin` to the bin of times[-1]; bins without samples have
+        count 0, sum 0 and NaN min and max.
+    '''
+    data = np.asarray(data, dtype=np.float64)
+    bins = (np.asarray(times) // resolution).astype(np.int64)
+    if first_bin is None:
+        first_bin = int(bins[0]) if bins.shape[0] else 0
+    n_bins = int(bins[-1]) - first_bin + 1 if bins.shape[0] else 0
+    out = {'first_bin': first_bin,
+           'count': np.zeros(n_bins, dtype=np.int64),
+           'sum': np.zeros(n_bins), 'sumsq': np.zeros(n_bins),
+           'min': np.full(n_bins, np.nan), 'max': np.full(n_bins, np.nan)}
+    if not bins.shape[0]:
+        return out
+    # Times are sorted, so each bin is a contiguous run of samples.
+    starts = np.flatnonzero(np.concatenate(([True], bins[1:] != bins[:-1])))
+    idx = bins[starts] - first_bin
+    valid = ~np.isnan(data)
+    zeroed = np.where(valid, data, 0.)
+    out['count'][idx] = np.add.reduceat(valid, starts)
+    out['sum'][idx] = np.add.reduceat(zeroed, starts)
+    out['sumsq'][idx] = np.add.reduceat(zeroed * zeroed, starts)
+    with np.errstate(invalid='ignore'):
+        out['min'][idx] = np.fmin.reduceat(data, starts)
+        out['max'][idx] = np.fmax.reduceat(data, starts)
+    return out
+
+
+def coarsen_rollup(rollup, factor):
+    '''Combine every `factor` bins of `rollup` (aligned to bin 0).'''
+    first = rollup['first_bin'] // factor
+    pad_left = rollup['first_bin'] - first * factor
+    n = rollup['count'].shape[0]
+    n_bins = -(-(pad_left + n) // factor)
+    out = {'first_bin': first}
+    for stat in STATISTICS:
+        fill = np.nan if stat in ('min', 'max') else 0
+        x = np.full(n_bins * factor, fill, dtype=rollup[stat].dtype)
+        x[pad_left:pad_left + n] = rollup[stat]
+        x = x.reshape(n_bins, factor)
+        with np.errstate(invalid='ignore'):
+            if stat == 'min':
+                out[stat] = np.fmin.reduce(x, axis=1)
+            elif stat == 'max':
+                out[stat] = np.fmax.reduce(x, axis=1)
+            else:
+                out[stat] = x.sum(1)
+    return out
+
+
+def build_rollups(data, times, resolutions=RESOLUTIONS):
+    '''Return dict mapping each of `resolutions` to its rollup.
+
+    Every resolution must be a multiple of the first (finest) one.
+    '''
+    resolutions = sorted(resolutions)
+    finest = compute_rollup(data, times, resolutions[0])
+    out = {resolutions[0]: finest}
+    for r in resolutions[1:]:
+        if r % resolutions[0]:
+            raise ValueError('Resolutions must be multiples of the finest.')
+        out[r] = coarsen_rollup(finest, r // resolutions[0])
+    return out
+
+
+def merge_rollups(old, new):
+    '''Return `old` extended by `new`, which starts at or after its last bin.
+
+    The bin shared by the end of `old` and the start of `new` (data appended
+    in the middle of a bin) is combined; bins between them (a recording gap)
+    are empty.
+    '''
+    if not old['count'].shape[0]:
+        return new
+    if not new['count'].shape[0]:
+        return old
+    overlap = old['first_bin'] + old['count'].shape[0] - new['first_bin']
+    if overlap > 1:
+        raise ValueError('`new` must start at or after the last bin of `old`.')
+    out = {'first_bin': old['first_bin']}
+    for stat in STATISTICS:
+        a, b = old[stat], new[stat]
+        if overlap == 1:
+            b = b.copy()
+            with np.errstate(invalid='ignore'):
+                if stat == 'min':
+                    b[0] = np.fmin(a[-1], b[0])
+                elif stat == 'max':
+                    b[0] = np.fmax(a[-1], b[0])
+                else:
+                    b[0] += a[-1]
+            a = a[:-1]
+        fill = np.nan if stat in ('min', 'max') else 0
+        empty = np.full(-overlap if overlap < 0 else 0, fill, dtype=a.dtype)
+        out[stat] = np.concatenate((a, empty, b))
+    return out
+
+
+def rollup_statistic(rollup, statistic='sum'):
+    '''Return `statistic` of every bin of `rollup` starting from bin 0.
+
+    Parameters
+    ----------
+    rollup : dict
+        See `compute_rollup`.
+    statistic : {'sum', 'count', 'mean', 'std', 'min', 'max'}, optional
+        'std' is the population standard deviation.
+
+    Returns
+    -------
+    np.array
+        Bins before `rollup['first_bin']` and bins without samples are NaN
+        (0 for 'sum' and 'count').
+    '''
+    count = rollup['count']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if statistic in ('sum', 'count', 'min', 'max'):
+            values = rollup[statistic]
+        elif statistic == 'mean':
+            values = rollup['sum'] / count
+        elif statistic == 'std':
+            mean = rollup['sum'] / count
+            values = np.sqrt(np.maximum(rollup['sumsq'] / count - mean ** 2,
+                                        0))
+        else:
+            raise ValueError('Unknown statistic %r.' % statistic)
+    fill = 0 if statistic in ('sum', 'count') else np.nan
+    out = np.full(rollup['first_bin'] + count.shape[0], fill,
+                  dtype=np.result_type(values, type(fill)))
+    out[rollup['first_bin']:] = values
+    return out
+
+
+def rollup_path(channel_fp):
+    '''Return the path of the rollups of the channel at `channel_fp`.'''
+    return os.path.splitext(channel_fp)[0] + '.rollup.npz'
+
+
+def save_rollups(fp, rollups, n):
+    '''Save `rollups` of the first `n` samples of a channel to `fp`.'''
+    arrays = {'n': n}
+    for r, rollup in rollups.items():
+        arrays['first_bin_%d' % r] = rollup['first_bin']
+        for stat in STATISTICS:
+            arrays['%s_%d' % (stat, r)] = rollup[stat]
+    tmp = fp + '.tmp.npz'
+    np.savez(tmp, **arrays)
+    os.replace(tmp, fp)
+
+
+def read_rollups(fp):
+    '''Return (rollups, n) saved with `save_rollups`.'''
+    with np.load(fp) as f:
+        resolutions = [int(k.split('_')[-1]) for k in f.files
+                       if k.startswith('first_bin_')]
+        rollups = {}
+        for r in sorted(resolutions):
+            rollups[r] = {'first_bin': int(f['first_bin_%d' % r])}
+            for stat in STATISTICS:
+                rollups[r][stat] = f['%s_%d' % (stat, r)]
+        return rollups, int(f['n'])
+
+
+def update_rollup(channel_fp, times, length=None, resolutions=RESOLUTIONS,
+                  data=None):
+    '''Bring the rollups of a channel up to date with the channel file.
+
+    Only samples the stored rollups do not cover yet are aggregated; the
+    rollups are rebuilt if they are missing, use other resolutions or cover
+    samples that may have changed since.
+
+    Parameters
+    ----------
+    channel_fp : str
+        Path of the channel's .npy file.
+    times : np.array
+        Sample times of the whole experiment (may be a memmap).
+    length : int, optional
+        Number of leading samples of the channel unchanged since the rollups
+        were last updated, e.g. the store length before an append (which
+        discards the entries of an interrupted append). Defaults to the whole
+        channel.
+    resolutions : tuple, optional
+        Bin widths in seconds, see `build_rollups`.
+    data : np.array, optional
+        The channel's values, read with `bcp.store.load_channel_file` if not
+        given.
+
+    Returns
+    -------
+    dict
+        The up to date rollups.
+    '''
+    if data is None:
+        data = store.load_channel_file(channel_fp)
+    if length is None:
+        length = data.shape[0]
+    fp = rollup_path(channel_fp)
+    start = 0
+    old = None
+    if os.path.exists(fp):
+        old, n = read_rollups(fp)
+        if n <= length and sorted(old) == sorted(resolutions):
+            start = n
+        else:
+            old = None
+    if old is not None and start == data.shape[0]:
+        return old
+    new = build_rollups(data[start:], times[start:data.shape[0]], resolutions)
+    if old is not None:
+        new = {r: merge_rollups(old[r], new[r]) for r in resolutions}
+    save_rollups(fp, new, data.shape[0])
+    return new
+
+
+def load_rollups(channel_fp):
+    '''Return the stored rollups of a channel if they are up to date.
+
+    Returns None when there are none or the channel has more samples than
+    they cover.
+    '''
+    fp = rollup_path(channel_fp)
+    if not os.path.exists(fp):
+        return None
+    rollups, n = read_rollups(fp)
+    if n != np.load(channel_fp, mmap_mode='r').shape[0]:
+        return None
+    return rollups
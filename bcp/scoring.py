@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+from __future__ import division
+
+import numpy as np
+
+'''
+Scoring detected events against reference events.
+
+Events are intervals of sample indices, given as arrays of shape (K, 2)
+whose rows are [start, stop). `sequence_intervals` converts the (start,
+length) sequences of `bcp.preprocess` and `mask_intervals` the runs of a
+boolean mask. Two events overlap when they share at least one sample (or
+come within `tolerance` samples of each other).
+
+Overlaps are found by sorting one set of events by start and keeping a
+running maximum of their stops; `np.searchsorted` then finds for every
+event of the other set the events starting before it ends, so no pair of
+events is compared and scoring takes O((n + m) log(n + m)).
+
+`precision_recall` counts the events overlapping any event of the other set.
+`match_events` pairs detected and reference events one to one, by
+decreasing intersection over union (IoU), and returns the IoU and the onset
+and offset errors of each match; `event_scores` summarizes a matching and
+`confusion` counts matched, missed and spurious events per class. Matching
+considers only the overlapping pairs, which number at most n + m - 1 when
+the events of each set are disjoint.
+
+Examples
+--------
+>>> detected = sequence_intervals(unstable_sequences(water, .05, .02, 10))
+>>> precision, recall, f1 = precision_recall(detected, labels, tolerance=2)
+>>> matches = match_events(detected, labels)
+>>> np.percentile(matches['onset_error'], [5, 50, 95])
+'''
+
+MATCH_DTYPE = [('detected', 'i8'), ('reference', 'i8'), ('iou', 'f8'),
+               ('onset_error', 'i8'), ('offset_error', 'i8')]
+
+
+def as_intervals(intervals):
+    '''Return `intervals` as an int64 array of shape (K, 2).'''
+    return np.asarray(intervals, dtype=np.int64).reshape(-1, 2)
+
+
+def sequence_intervals(sequences):
+    '''Return the [start, stop) intervals of (start, length) `sequences`.'''
+    sequences = as_intervals(sequences)
+    return np.column_stack((sequences[:, 0],
+                            sequences[:, 0] + sequences[:, 1]))
+
+
+def mask_intervals(mask):
+    '''Return the [start, stop) intervals of the runs of True in `mask`.'''
+    d = np.diff(np.concatenate(([0], np.asarray(mask).astype(np.int8), [0])))
+    return np.column_stack(((d == 1).nonzero()[0], (d == -1).nonzero()[0]))
+
+
+def overlaps_any(intervals, other, tolerance=0):
+    '''Return for each of `intervals` whether it overlaps one of `other`.
+
+    Parameters
+    ----------
+    intervals, other : np.array
+        Arrays of shape (K, 2) and (M, 2) of [start, stop) rows, in any
+        order; the events of either set may overlap each other.
+    tolerance : int, optional
+        Events less than `tolerance` samples apart also count as
+        overlapping.
+
+    Returns
+    -------
+    np.array
+        Boolean array of shape (K,).
+    '''
+    intervals, other = as_intervals(intervals), as_intervals(other)
+    if other.shape[0] == 0:
+        return np.zeros(intervals.shape[0], dtype=bool)
+    order = np.argsort(other[:, 0], kind='stable')
+    starts = other[order, 0] - tolerance
+    # Furthest stop of the events starting at or before each one.
+    reach = np.maximum.accumulate(other[order, 1] + tolerance)
+    # Number of events of `other` starting before each interval stops.
+    n = np.searchsorted(starts, intervals[:, 1], side='left')
+    found = n > 0
+    found[found] = reach[n[found] - 1] > intervals[found, 0]
+    return found
+
+
+def precision_recall(detected, reference, tolerance=0):
+    '''Return event level (precision, recall, f1) of `detected` events.
+
+    Precision is the fraction of detected events overlapping a reference
+    event and recall the fraction of reference events overlapping a
+    detected event (see `overlaps_any`). A score with an empty denominator
+    is 0.
+    '''
+    detected, reference = as_intervals(detected), as_intervals(reference)
+    precision = recall = f1 = 0.
+    if detected.shape[0]:
+        precision = overlaps_any(detected, reference, tolerance).mean()
+    if reference.shape[0]:
+        recall = overlaps_any(reference, detected, tolerance).mean()
+    if precision + recall:
+        f1 = 2 * precision * recall / (precision + recall)
+    return float(precision), float(recall), float(f1)
+
+
+def overlap_pairs(intervals, other, tolerance=0):
+    '''Return the indices (i, j) of all pairs of overlapping events.
+
+    intervals[i] overlaps other[j] (see `overlaps_any`) for each returned
+    pair, and every overlapping pair is returned once, ordered by i. For
+    each interval only the events of `other` (sorted by start) from the
+    first whose running maximum stop passes its start to the last starting
+    before its end are looked at, so the cost is proportional to the number
+    of pairs when the events of `other` are disjoint.
+    '''
+    intervals, other = as_intervals(intervals), as_intervals(other)
+    if intervals.shape[0] == 0 or other.shape[0] == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    order = np.argsort(other[:, 0], kind='stable')
+    starts = other[order, 0] - tolerance
+    stops = other[order, 1] + tolerance
+    reach = np.maximum.accumulate(stops)
+    # Candidates of interval i are the sorted events lo[i]..hi[i] - 1.
+    lo = np.searchsorted(reach, intervals[:, 0], side='right')
+    hi = np.searchsorted(starts, intervals[:, 1], side='left')
+    counts = np.maximum(hi - lo, 0)
+    i = np.repeat(np.arange(intervals.shape[0]), counts)
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    k = np.repeat(lo, counts) + np.arange(i.shape[0]) - first
+    keep = stops[k] > intervals[i, 0]
+    return i[keep], order[k[keep]]
+
+
+def interval_iou(a, b):
+    '''Return the intersection over union of the rows of `a` and `b`.'''
+    a, b = as_intervals(a), as_intervals(b)
+    inter = np.maximum(np.minimum(a[:, 1], b[:, 1]) -
+                       np.maximum(a[:, 0], b[:, 0]), 0)
+    union = (a[:, 1] - a[:, 0]) + (b[:, 1] - b[:, 0]) - inter
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(union > 0, inter / union, 0.)
+
+
+def match_events(detected, reference, tolerance=0, min_iou=0.):
+    '''Pair detected and reference events one to one.
+
+    Parameters
+    ----------
+    detected, reference : np.array
+        Arrays of shape (K, 2) and (M, 2) of [start, stop) rows.
+    tolerance : int, optional
+        Events less than `tolerance` samples apart can be matched (with an
+        IoU of 0).
+    min_iou : float, optional
+        Smallest IoU of a match.
+
+    Returns
+    -------
+    np.array
+        Structured array with dtype `MATCH_DTYPE` sorted by reference:
+        indices of the matched events, their IoU, and the onset and offset
+        errors (detected minus reference start and stop).
+
+    Notes
+    -----
+    The matching is the greedy one taking pairs by decreasing IoU (ties by
+    smaller onset plus offset error, then by index). It is built in rounds:
+    every pair ranked first among the remaining pairs of both its events is
+    matched, which the greedy matching would also do, and the pairs of the
+    matched events are removed.
+    '''
+    detected, reference = as_intervals(detected), as_intervals(reference)
+    i, j = overlap_pairs(detected, reference, tolerance)
+    iou = interval_iou(detected[i], reference[j])
+    keep = iou >= min_iou
+    i, j, iou = i[keep], j[keep], iou[keep]
+    error = (np.abs(detected[i, 0] - reference[j, 0]) +
+             np.abs(detected[i, 1] - reference[j, 1]))
+    rank = np.lexsort((j, i, error, -iou))
+    i, j, iou = i[rank], j[rank], iou[rank]
+    used_i = np.zeros(detected.shape[0], dtype=bool)
+    used_j = np.zeros(reference.shape[0], dtype=bool)
+    # Positions in the ranked pairs of the remaining and the matched pairs.
+    pos = np.arange(i.shape[0])
+    taken = [pos[:0]]
+    while pos.shape[0]:
+        # Pairs are in rank order, so the first remaining pair of an event
+        # is its best.
+        pi, pj = i[pos], j[pos]
+        best_i = np.zeros(pos.shape[0], dtype=bool)
+        best_i[np.unique(pi, return_index=True)[1]] = True
+        best_j = np.zeros(pos.shape[0], dtype=bool)
+        best_j[np.unique(pj, return_index=True)[1]] = True
+        take = best_i & best_j
+        taken.append(pos[take])
+        used_i[pi[take]] = True
+        used_j[pj[take]] = True
+        pos = pos[~(used_i[pi] | used_j[pj])]
+    taken = np.concatenate(taken)
+    taken = taken[np.argsort(j[taken], kind='stable')]
+    out = np.empty(taken.shape[0], dtype=MATCH_DTYPE)
+    out['detected'] = i[taken]
+    out['reference'] = j[taken]
+    out['iou'] = iou[taken]
+    out['onset_error'] = detected[i[taken], 0] - reference[j[taken], 0]
+    out['offset_error'] = detected[i[taken], 1] - reference[j[taken], 1]
+    return out
+
+
+def event_scores(detected, reference, tolerance=0, min_iou=0.):
+    '''Return a summary of `match_events`.
+
+    Returns
+    -------
+    dict
+        'n_detected', 'n_reference' and 'n_matched'; 'precision', 'recall'
+        and 'f1' of the one to one matching (0 for an empty denominator);
+        'mean_iou' of the matches (NaN without matches); 'onset_error' and
+        'offset_error', the median absolute errors of the matches (NaN
+        without matches); and 'matches', the output of `match_events`.
+    '''
+    detected, reference = as_intervals(detected), as_intervals(reference)
+    matches = match_events(detected, reference, tolerance, min_iou)
+    n = matches.shape[0]
+    precision = n / detected.shape[0] if detected.shape[0] else 0.
+    recall = n / reference.shape[0] if reference.shape[0] else 0.
+    f1 = 2 * precision * recall / (precision + recall) if n else 0.
+    if n:
+        mean_iou = float(matches['iou'].mean())
+        onset = float(np.median(np.abs(matches['onset_error'])))
+        offset = float(np.median(np.abs(matches['offset_error'])))
+    else:
+        mean_iou = onset = offset = np.nan
+    return {'n_detected': detected.shape[0],
+            'n_reference': reference.shape[0], 'n_matched': n,
+            'precision': precision, 'recall': recall, 'f1': f1,
+            'mean_iou': mean_iou, 'onset_error': onset,
+            'offset_error': offset, 'matches': matches}
+
+
+def confusion(detected, detected_classes, reference, reference_classes,
+              tolerance=0, min_iou=0., classes=None):
+    '''Count matched, missed and spurious events per class.
+
+    Parameters
+    ----------
+    detected, reference : np.array
+        Arrays of shape (K, 2) and (M, 2) of [start, stop) rows.
+    detected_classes, reference_classes : np.array
+        Class of each detected and reference event, e.g. the event codes
+        of `bcp.sweep.read_classifications`.
+    tolerance, min_iou
+        Passed to `match_events`; events are matched regardless of class.
+    classes : list, optional
+        Classes in the order of the rows and columns. Defaults to the
+        sorted classes of both sets.
+
+    Returns
+    -------
+    matrix : np.array
+        Integer array of shape (C + 1, C + 1). matrix[r, d] counts the
+        reference events of class r matched to a detected event of class d;
+        the last column counts the missed reference events of each class and
+        the last row the unmatched detected events of each class.
+    classes : list
+    '''
+    detected_classes = np.asarray(detected_classes)
+    reference_classes = np.asarray(reference_classes)
+    if classes is None:
+        classes = sorted(set(detected_classes.tolist()) |
+                         set(reference_classes.tolist()))
+    classes = list(classes)
+    c = len(classes)
+    matches = match_events(detected, reference, tolerance, min_iou)
+    d = _class_index(classes, detected_classes)
+    r = _class_index(classes, reference_classes)
+    missed = np.ones(r.shape[0], dtype=bool)
+    missed[matches['reference']] = False
+    spurious = np.ones(d.shape[0], dtype=bool)
+    spurious[matches['detected']] = False
+    matrix = np.zeros((c + 1, c + 1), dtype=np.int64)
+    np.add.at(matrix, (r[matches['reference']], d[matches['detected']]), 1)
+    np.add.at(matrix, (r[missed], c), 1)
+    np.add.at(matrix, (c, d[spurious]), 1)
+    return matrix, classes
+
+
+def _class_index(classes, values):
+    '''Return the position in `classes` of each of `values`.'''
+    order = np.argsort(classes, kind='stable')
+    ordered = np.asarray(classes)[order]
+    k = np.searchsorted(ordered, values)
+    found = k < len(classes)
+    found[found] = ordered[k[found]] == values[found]
+    if not found.all():
+        raise ValueError('Classes %r not in `classes`.' %
+                         sorted(set(values[~found].tolist())))
+    return order[k]
@@ -2,6 +2,12 @@
 from __future__ import division
 
 import numpy as np
+from bcp import store
+from bcp.profiling import instrument
+from bcp.util import float_dtype, output_array
+from bcp.cache import cached
+from bcp.rollup import (compute_rollup, coarsen_rollup, rollup_statistic,
+                        load_rollups)
 
 '''
 Code for calculating statistics on Promethion data.
@@ -11,9 +17,18 @@ Examples
 To calculate the number of rearing events over a moving window.
 >>> zs_binary = (zs > 0).astype(float)
 >>> moving_function(zs_binary, window, 'sum', 1)
+
+Water drunk per hour, read from the experiment's stored rollups.
+>>> water, hours = channel_aggregate('data/exp1', 'Water', '3', 3600)
 '''
 
-def moving_function(data, window, function='sum', boundary=1):
+# Samples `moving_function` convolves at a time.
+MOVING_CHUNK = 2 ** 16
+
+@instrument
+@cached
+def moving_function(data, window, function='sum', boundary=1, out=None,
+                    dtype=None):
     '''Calculate moving average or sum of data.
 
     Parameters
@@ -29,6 +44,12 @@ def moving_function(data, window, function='sum', boundary=1):
         where the function cannot be calculated because there are not enough
         points on both sides of the center. If 2, replace the edges of the
         computed data with values from the raw `data`.
+    out : np.array, optional
+        Array to write the result into; may be `data` itself. The result is
+        computed into it in chunks, without another full size array.
+    dtype : np.dtype, optional
+        Dtype of the computation and result. Defaults to that of floating
+        point `data` (see `bcp.util.float_dtype`).
 
     Returns
     -------
@@ -46,22 +67,42 @@ def moving_function(data, window, function='sum', boundary=1):
     calculation and then a series of additions and subtractions. For large
     input `data` (~1e6 points), the convolution code is ~2X slower.
     '''
+    dtype = float_dtype(data, dtype)
     if function == 'sum':
-        ma_data = np.convolve(np.ones(window, dtype=float), data, 'same')
+        kernel = np.ones(window, dtype=dtype)
     elif function == 'average':
-        ma_data = np.convolve(np.ones(window, dtype=float)/window, data, 'same')
-    if boundary == 1:
-        return ma_data
-    elif boundary == 2:
-        full_overlaps = (len(data) - window) + 1
-        partial_overlaps = len(data) - full_overlaps
+        kernel = np.full(window, 1. / window, dtype=dtype)
+    n = len(data)
+    if boundary == 2:
+        full_overlaps = (n - window) + 1
+        partial_overlaps = n - full_overlaps
         # If `window` is even we need to have a different amount of boundary 
         # points rescaled as described in notes.
-        _left = np.ceil(partial_overlaps/2.)
-        _right = np.floor(partial_overlaps/2.)
-        ma_data[:_left] = data[:_left]
-        ma_data[-_right:] = data[-_right:]
-        return ma_data
+        _left = int(np.ceil(partial_overlaps/2.))
+        _right = int(np.floor(partial_overlaps/2.))
+        # Copied now as `out` may be `data`.
+        left = np.array(data[:_left], dtype=dtype)
+        right = np.array(data[n - _right:], dtype=dtype)
+    ma_data = output_array(out, (n,), dtype)
+    # ma_data[i] is the dot product of `kernel` and data[i - a:i + b + 1] as
+    # in np.convolve(kernel, data, 'same'). It is computed `MOVING_CHUNK`
+    # samples at a time so that only `out` is full size; the `a` samples
+    # before a chunk are kept from the previous one in case `out` is `data`.
+    b = (window - 1) // 2
+    a = window - 1 - b
+    carry = np.empty(0, dtype=dtype)
+    for start in range(0, n, MOVING_CHUNK):
+        stop = min(start + MOVING_CHUNK, n)
+        seg = np.concatenate((carry, np.asarray(data[start:min(stop + b, n)],
+                                                dtype=dtype)))
+        lo = start - carry.shape[0]
+        full = np.convolve(kernel, seg, 'full')
+        carry = seg[max(stop - a, lo) - lo:stop - lo].copy()
+        ma_data[start:stop] = full[start + b - lo:stop + b - lo]
+    if boundary == 2:
+        ma_data[:_left] = left
+        ma_data[n - _right:] = right
+    return ma_data
     # Code which is faster given large enough input. Note that `r` will have to
     # be adjusted given the way the convolution code is written; i.e. this code
     # does not return equivalent results with the function. 
@@ -72,6 +113,7 @@ def moving_function(data, window, function='sum', boundary=1):
     #     ma_data[i] = ma_data[i-1] + data[i+r] - data[i-(r+1)]
     # return ma_data/float(2*r + 1)
 
+@instrument
 def distance_traveled_1d(data):
     '''Calculate (Manhattan) distance traveled from coordinate `data`.
 
@@ -86,6 +128,7 @@ def distance_traveled_1d(data):
     '''
     return abs(data[1:] - data[:-1]).sum()
 
+@instrument
 def distance_traveled_2d(x_data, y_data):
     '''Calculate (Euclidean) distance traveled from coordinate data.
 
@@ -102,3 +145,51 @@ def distance_traveled_2d(x_data, y_data):
     '''
     return (((x_data[1:] - x_data[:-1])**2 +
              (y_data[1:] - y_data[:-1])**2)**.5).sum()
+
+@instrument
+def window_aggregate(data, times, window, statistic='sum', rollups=None):
+    '''Aggregate `data` over consecutive windows of `window` seconds.
+
+    Parameters
+    ----------
+    data : np.array
+        One dimensional array of data (may be a memmap).
+    times : np.array
+        Sorted seconds since the start of the experiment of each sample.
+    window : int
+        Window size in seconds. Window k covers [k * window,
+        (k + 1) * window).
+    statistic : {'sum', 'count', 'mean', 'std', 'min', 'max'}, optional
+        Computed over the non NaN samples of each window.
+    rollups : dict, optional
+        Rollups of `data` (see `bcp.rollup`). If `window` is a multiple of
+        one of their resolutions, the largest such rollup is combined
+        instead of reading `data`.
+
+    Returns
+    -------
+    values : np.array
+        One value per window from the window at time 0 to the window of the
+        last sample. Windows without samples are 0 for 'sum' and 'count' and
+        NaN otherwise.
+    window_starts : np.array
+        Start time of each window.
+    '''
+    usable = [r for r in (rollups or {}) if window % r == 0]
+    if usable:
+        r = max(usable)
+        agg = coarsen_rollup(rollups[r], window // r)
+    else:
+        agg = compute_rollup(data, times, window)
+    values = rollup_statistic(agg, statistic)
+    return values, np.arange(values.shape[0]) * window
+
+def channel_aggregate(exp_dir, field, cage, window, statistic='sum'):
+    '''Aggregate a channel of an experiment store with `window_aggregate`.
+
+    The channel's stored rollups are used if they are up to date.
+    '''
+    fp = store.channel_path(exp_dir, field, cage)
+    times = np.load(store.time_path(exp_dir), mmap_mode='r')
+    return window_aggregate(store.load_channel_file(fp), times, window,
+                            statistic, load_rollups(fp))
@@ -0,0 +1,406 @@
+#!/usr/bin/env python
+from __future__ import division
+
+import json
+import os
+import re
+from io import BytesIO
+import numpy as np
+from bcp.parse import _make_fp
+
+'''
+Helpers for reading and writing an experiment store.
+
+An experiment store is a directory holding one `<field>_<cage>.npy` file per
+channel (see `bcp.parse._make_fp`), `time.npy` with the seconds since the
+experiment started of every sample, and `manifest.json` recording what has
+been ingested. Every channel has one entry per entry of `time.npy`.
+
+Channels of discrete fields (beam positions in quarter or half cm, wheel
+counts, RT counters) are stored in compact integer types: values are
+multiplied by a `scale` (1, 2 or 4) and stored in the narrowest integer type
+holding them, with the extreme value of the type marking missing (NaN)
+samples. The encoding of each such channel is recorded in the manifest under
+'encodings', and `load_channel` returns them as `EncodedChannel`s that
+decode to float32 only the samples indexed. Channels without an encoding are
+plain float .npy files.
+
+Channels written by processing the store (see `bcp.cli`) are kept next to
+the raw ones with a suffix on the field, e.g. `WaterClean_2.npy`; their
+fields end with one of `DERIVED_SUFFIXES` and `channels` leaves them out
+unless asked for them.
+
+Examples
+--------
+>>> channels('data/exp1')
+{'BodyMass': ['1', '2'], 'Water': ['1', '2'], ...}
+>>> water = load_channel('data/exp1', 'Water', 2)
+>>> x = load_channel('data/exp1', 'XPos', 2)[:86400]  # float32, in cm
+'''
+
+TIME_FILE = 'time.npy'
+MANIFEST_FILE = 'manifest.json'
+_CHANNEL_RE = re.compile(r'^(.+)_([^_.]+)\.npy$')
+ENCODING_SCALES = (1, 2, 4)
+ENCODING_DTYPES = ('u1', 'i1', 'u2', 'i2', 'u4', 'i4')
+# Storage of fields that are never encoded (weights read with 4 decimals);
+# `ingest_channel` infers the encoding of any other field from its data.
+FIELD_ENCODINGS = {'Water': None, 'FoodA': None, 'BodyMass': None}
+# Field suffixes of cleaned channels, window labels and cluster centroids.
+DERIVED_SUFFIXES = ('Clean', 'Class', 'Centroids')
+
+
+def channel_path(exp_dir, field, cage):
+    '''Return the path of the channel `field` of `cage` in `exp_dir`.'''
+    return _make_fp(exp_dir, field, cage)
+
+
+def time_path(exp_dir):
+    '''Return the path of the sample times of `exp_dir`.'''
+    return os.path.join(exp_dir, TIME_FILE)
+
+
+def is_derived(field):
+    '''Return whether `field` is written by processing rather than ingested.
+    '''
+    return field.endswith(DERIVED_SUFFIXES)
+
+
+def channels(exp_dir, derived=False):
+    '''Return dict mapping each field in `exp_dir` to its sorted cages.
+
+    Derived fields (see `is_derived`) are only included if `derived`.
+    '''
+    out = {}
+    for name in os.listdir(exp_dir):
+        m = _CHANNEL_RE.match(name)
+        if m and (derived or not is_derived(m.group(1))):
+            out.setdefault(m.group(1), []).append(m.group(2))
+    for cages in out.values():
+        cages.sort(key=lambda c: (len(c), c))
+    return out
+
+
+def read_manifest(exp_dir):
+    '''Return the manifest of `exp_dir`, empty if it has none.'''
+    fp = os.path.join(exp_dir, MANIFEST_FILE)
+    if not os.path.exists(fp):
+        return {}
+    with open(fp) as f:
+        return json.load(f)
+
+
+def write_manifest(exp_dir, manifest):
+    '''Atomically replace the manifest of `exp_dir`.'''
+    fp = os.path.join(exp_dir, MANIFEST_FILE)
+    with open(fp + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(fp + '.tmp', fp)
+
+
+def save_array(fp, arr):
+    '''Save `arr` to the .npy file `fp`, replacing it atomically.'''
+    tmp = fp + '.tmp.npy'
+    np.save(tmp, arr)
+    os.replace(tmp, fp)
+
+
+def _npy_header(shape, dtype, version):
+    '''Return the bytes of a .npy header.'''
+    header = {'descr': np.lib.format.dtype_to_descr(dtype),
+              'fortran_order': False, 'shape': shape}
+    buf = BytesIO()
+    if version == (1, 0):
+        np.lib.format.write_array_header_1_0(buf, header)
+    else:
+        np.lib.format.write_array_header_2_0(buf, header)
+    return buf.getvalue()
+
+
+def append_array(fp, arr, length=None, fill=np.nan):
+    '''Append the one dimensional `arr` to the .npy file at `fp`.
+
+    Parameters
+    ----------
+    fp : str
+        Path of a one dimensional .npy file. Created if missing.
+    arr : np.array
+        Values to append, cast to the dtype of the stored array.
+    length : int, optional
+        Number of stored entries to keep before appending. Entries beyond it
+        (e.g. written by an append that was interrupted before the manifest
+        was updated) are discarded; a missing or shorter file is padded with
+        `fill`.
+    fill : scalar, optional
+        Padding value, e.g. the missing value of an integer channel.
+
+    Notes
+    -----
+    NumPy pads .npy headers so a growing shape fits in place. When it does,
+    only the new values and the header are written; otherwise (and for files
+    not written by NumPy) the file is rewritten. The values are written
+    before the header, so an interrupted append leaves a readable file of
+    the old length.
+    '''
+    arr = np.asarray(arr)
+    if not os.path.exists(fp):
+        old = np.full(length or 0, fill, dtype=arr.dtype)
+        save_array(fp, np.concatenate((old, arr)))
+        return
+    with open(fp, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+        n = shape[0] if length is None else length
+        header = _npy_header((n + arr.shape[0],), dtype, version)
+        if (len(shape) == 1 and not fortran and not dtype.hasobject and
+                n <= shape[0] and len(header) == offset):
+            f.seek(offset + n * dtype.itemsize)
+            f.truncate()
+            f.write(arr.astype(dtype, copy=False).tobytes())
+            f.flush()
+            f.seek(0)
+            f.write(header)
+            return
+    old = np.load(fp)
+    if length is not None:
+        if length <= old.shape[0]:
+            old = old[:length]
+        else:
+            pad = np.full(length - old.shape[0], fill, dtype=old.dtype)
+            old = np.concatenate((old, pad))
+    save_array(fp, np.concatenate((old, arr.astype(old.dtype, copy=False))))
+
+
+def missing_value(dtype):
+    '''Return the stored value marking a missing sample for `dtype`.'''
+    info = np.iinfo(dtype)
+    return info.max if info.min == 0 else info.min
+
+
+def infer_encoding(values, scales=ENCODING_SCALES, dtypes=ENCODING_DTYPES):
+    '''Return the most compact encoding representing `values` exactly.
+
+    Parameters
+    ----------
+    values : np.array
+        Floating point values; NaNs are stored as missing.
+    scales, dtypes : tuple, optional
+        Candidate scales and integer types (as dtype strings), tried from
+        the narrowest type and smallest scale.
+
+    Returns
+    -------
+    dict or None
+        {'dtype': str, 'scale': int}, or None if the values must stay float
+        (infinite values, or no candidate represents them).
+    '''
+    values = np.asarray(values)
+    finite = values[~np.isnan(values)]
+    if not np.isfinite(finite).all():
+        return None
+    for scale in scales:
+        scaled = finite.astype(np.float64) * scale
+        if not (scaled == np.round(scaled)).all():
+            continue
+        lo = scaled.min() if scaled.size else 0
+        hi = scaled.max() if scaled.size else 0
+        for dtype in sorted(dtypes, key=lambda d: np.dtype(d).itemsize):
+            info = np.iinfo(dtype)
+            missing = missing_value(dtype)
+            if (info.min <= lo and hi <= info.max and
+                    not lo <= missing <= hi):
+                return {'dtype': np.dtype(dtype).str, 'scale': scale}
+        return None
+    return None
+
+
+def encode_values(values, encoding):
+    '''Return `values` stored with `encoding`.
+
+    Raises ValueError if a value is not represented exactly.
+    '''
+    values = np.asarray(values)
+    dtype = np.dtype(encoding['dtype'])
+    missing = missing_value(dtype)
+    nan = np.isnan(values)
+    scaled = np.where(nan, 0, values).astype(np.float64) * encoding['scale']
+    info = np.iinfo(dtype)
+    if ((scaled != np.round(scaled)).any() or (scaled < info.min).any() or
+            (scaled > info.max).any() or (scaled[~nan] == missing).any()):
+        raise ValueError('Values not representable with %r.' % encoding)
+    out = scaled.astype(dtype)
+    out[nan] = missing
+    return out
+
+
+def decode_values(stored, encoding, dtype=np.float32):
+    '''Return the values of `stored` (encoded with `encoding`) as `dtype`.'''
+    stored = np.asarray(stored)
+    out = stored.astype(dtype)
+    out[stored == missing_value(stored.dtype)] = np.nan
+    if encoding['scale'] != 1:
+        out /= encoding['scale']
+    return out
+
+
+class EncodedChannel(object):
+    '''Read only, array like view decoding a compactly stored channel.
+
+    Indexing decodes only the entries indexed; `np.asarray(channel)`
+    decodes the whole channel.
+
+    Attributes
+    ----------
+    raw : np.array
+        The stored integers (usually a memmap).
+    encoding : dict
+    shape : tuple
+    dtype : np.dtype
+        Dtype of decoded values, float32.
+    '''
+
+    dtype = np.dtype(np.float32)
+
+    def __init__(self, raw, encoding):
+        self.raw = raw
+        self.encoding = encoding
+        self.shape = raw.shape
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __getitem__(self, key):
+        return decode_values(self.raw[key], self.encoding, self.dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        return decode_values(self.raw[:], self.encoding,
+                             self.dtype if dtype is None else dtype)
+
+
+def _encoding_key(fp):
+    return os.path.splitext(os.path.basename(fp))[0]
+
+
+def load_channel_file(fp, mmap_mode='r', manifest=None):
+    '''Return the channel at `fp`, decoded lazily if compactly stored.
+
+    Parameters
+    ----------
+    fp : str
+        Path of a channel of an experiment store.
+    mmap_mode : str, optional
+        Passed to `np.load`.
+    manifest : dict, optional
+        Manifest of the store, read from the channel's directory if not
+        given.
+
+    Returns
+    -------
+    np.array or EncodedChannel
+    '''
+    if manifest is None:
+        manifest = read_manifest(os.path.dirname(fp))
+    raw = np.load(fp, mmap_mode=mmap_mode)
+    encoding = manifest.get('encodings', {}).get(_encoding_key(fp))
+    return raw if encoding is None else EncodedChannel(raw, encoding)
+
+
+def load_channel(exp_dir, field, cage, mmap_mode='r', manifest=None):
+    '''Return channel `field` of `cage`, see `load_channel_file`.'''
+    return load_channel_file(channel_path(exp_dir, field, cage), mmap_mode,
+                             manifest)
+
+
+def ingest_channel(exp_dir, field, cage, values, length, manifest,
+                   encoding='infer'):
+    '''Append `values` to a channel, storing it compactly where possible.
+
+    Parameters
+    ----------
+    exp_dir, field, cage : str
+        Channel to append to, created if missing.
+    values : np.array
+        Values to append.
+    length : int
+        Samples of the channel to keep before appending, see
+        `append_array`.
+    manifest : dict
+        Manifest of the store. Its 'encodings' are updated in place; the
+        caller writes it.
+    encoding : dict, None or 'infer', optional
+        Encoding of a new channel; None stores float32. By default it is
+        taken from `FIELD_ENCODINGS` or inferred from `values`.
+
+    Notes
+    -----
+    If later values do not fit the encoding of a channel (e.g. a counter
+    outgrowing its type) the channel is rewritten with an encoding inferred
+    from all its values, or as float32.
+    '''
+    fp = channel_path(exp_dir, field, cage)
+    encodings = manifest.setdefault('encodings', {})
+    key = _encoding_key(fp)
+    values = np.asarray(values, dtype=np.float32)
+    # A file holding no samples to keep may be left from an interrupted
+    # first ingest whose encoding never reached the manifest.
+    if not os.path.exists(fp) or length == 0:
+        if encoding == 'infer':
+            encoding = FIELD_ENCODINGS.get(field, 'infer')
+        if encoding == 'infer':
+            encoding = infer_encoding(values)
+        _save_encoded(fp, values, length, encoding, encodings, key)
+        return
+    encoding = encodings.get(key)
+    if encoding is None:
+        append_array(fp, values, length)
+        return
+    try:
+        stored = encode_values(values, encoding)
+    except ValueError:
+        old = decode_values(np.load(fp)[:length], encoding)
+        values = np.concatenate((old, np.full(length - old.shape[0], np.nan,
+                                              np.float32), values))
+        _save_encoded(fp, values, 0, infer_encoding(values), encodings, key)
+        # Written right away so the manifest matches the rewritten file;
+        # the samples beyond `length` are dropped by the next ingest if this
+        # one is interrupted.
+        write_manifest(exp_dir, manifest)
+        return
+    append_array(fp, stored, length, fill=missing_value(stored.dtype))
+
+
+def _save_encoded(fp, values, pad, encoding, encodings, key):
+    '''Save `pad` missing samples then `values` to `fp` with `encoding`.'''
+    encodings.pop(key, None)
+    if encoding is None:
+        save_array(fp, np.concatenate((np.full(pad, np.nan, np.float32),
+                                       values)))
+        return
+    stored = encode_values(values, encoding)
+    encodings[key] = encoding
+    save_array(fp, np.concatenate((np.full(pad, missing_value(stored.dtype),
+                                           stored.dtype), stored)))
+
+
+def is_stale(outputs, inputs, since=None):
+    '''Return True if any of `outputs` must be (re)computed from `inputs`.
+
+    Outputs are stale when one is missing or older than the newest input. If
+    `since` (seconds since the epoch) is given, inputs last modified before
+    it are treated as unchanged, so only work on newer data is done.
+    '''
+    newest = max(os.path.getmtime(fp) for fp in inputs)
+    if since is not None and newest < since:
+        return False
+    for fp in outputs:
+        if not os.path.exists(fp) or os.path.getmtime(fp) < newest:
+            return True
+    return False
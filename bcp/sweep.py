@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+from __future__ import division
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from bcp.bouts import extract_bouts
+from bcp.preprocess import smooth
+from bcp.scoring import (as_intervals, sequence_intervals, mask_intervals,
+                         precision_recall, event_scores)
+
+'''
+Parameter sweeps of event detectors against hand labelled events.
+
+`data/sensor_validation/v2` and `v3` hold the water and food traces of cage
+2 recorded while the cage was filmed, and `classifications.txt`, the frames
+of each event annotated on the video. Frame 0 is sample `FRAME_OFFSETS[v]`
+of the traces and frames are one second apart; `read_classifications`
+converts frames to [start, stop) sample intervals.
+
+`sweep` runs a detector (see `DETECTORS`) with every setting of a parameter
+grid and scores the detected events against the labelled ones. Everything
+that does not depend on the parameters (differences of consecutive samples,
+recording gaps and the prefix sums of the labelled samples) is computed
+once by `prepare` and handed to each worker process once, so a task only
+carries its parameters. Each setting is scored with the precision, recall
+and f1 of the one to one matching of `bcp.scoring.event_scores` and the
+mean IoU of its matches. The settings are ranked by that f1, so that a
+detector splitting one event into many is not rewarded for it. The many
+to one scores of `bcp.scoring.precision_recall` ('overlap_precision',
+'overlap_recall' and 'overlap_f1') and the fractions of detected samples
+that are labelled ('sample_precision') and of labelled samples that are
+detected ('sample_recall') are reported alongside.
+
+Examples
+--------
+>>> grid = {'u_diff': [.02, .05, .1], 's_diff': [.01, .02],
+...         'stability_duration': [5, 10, 20]}
+>>> table = validation_sweep('v3', 'Water', 'unstable_sequences', grid,
+...                          jobs=4, tolerance=2)
+>>> table[:3]  # best settings by f1
+'''
+
+VALIDATION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              os.pardir, 'data', 'sensor_validation')
+FRAME_OFFSETS = {'v2': 2000, 'v3': 11900}
+# Labelled events each weight channel should detect.
+FIELD_EVENTS = {'Water': ('d',), 'FoodA': ('e', 'el')}
+LABEL_DTYPE = [('start', 'i8'), ('stop', 'i8'), ('event', 'U4')]
+SCORE_DTYPE = [('n_detected', 'i8'), ('precision', 'f8'), ('recall', 'f8'),
+               ('f1', 'f8'), ('mean_iou', 'f8'), ('overlap_precision', 'f8'),
+               ('overlap_recall', 'f8'), ('overlap_f1', 'f8'),
+               ('sample_precision', 'f8'), ('sample_recall', 'f8')]
+
+# The prepared data of the sweep run by a worker process.
+_shared = None
+
+
+def read_classifications(fp, offset=0):
+    '''Read hand labelled events.
+
+    Parameters
+    ----------
+    fp : str
+        Tab separated file with a header and rows of frame_start, frame_end
+        (inclusive) and event code. Lines may end in \\r or \\n.
+    offset : int, optional
+        Sample of frame 0.
+
+    Returns
+    -------
+    np.array
+        Structured array with dtype `LABEL_DTYPE` of [start, stop) samples.
+        Rows ending before they start (annotation typos) are dropped.
+    '''
+    with open(fp) as f:
+        rows = [l.split('\t') for l in f.read().splitlines()[1:] if l.strip()]
+    labels = np.array([(int(s) + offset, int(e) + offset + 1, c.strip())
+                       for s, e, c in rows], dtype=LABEL_DTYPE)
+    return labels[labels['stop'] > labels['start']]
+
+
+def load_validation(version, field, validation_dir=VALIDATION_DIR):
+    '''Return (data, times, labels) of a sensor validation recording.
+
+    `labels` is the output of `read_classifications` for `version`.
+    '''
+    d = os.path.join(validation_dir, version)
+    data = np.load(os.path.join(d, '%s_2.npy' % field))
+    times = np.load(os.path.join(d, 'time.npy'))
+    labels = read_classifications(os.path.join(d, 'classifications.txt'),
+                                  FRAME_OFFSETS[version])
+    return data, times, labels
+
+
+def unstable_intervals(absdiff, u_diff, s_diff=None, stability_duration=10):
+    '''Return `bcp.preprocess.unstable_sequences` computed from differences.
+
+    Parameters
+    ----------
+    absdiff : np.array
+        np.abs(np.diff(data)), shared by all calls on `data`.
+    u_diff, s_diff, stability_duration
+        See `unstable_sequences`.
+
+    Returns
+    -------
+    np.array
+        The sequences of unstable_sequences(data, ...), shape (K, 2).
+
+    Notes
+    -----
+    Only the start of each sequence is looked for in a loop: the triggering
+    differences and the differences ending `stability_duration` small ones
+    are found with array operations and each sequence is two
+    `np.searchsorted` calls.
+    '''
+    if s_diff is None:
+        s_diff = u_diff
+    v = absdiff - s_diff
+    # Compared with a tolerance as in `unstable_sequences`.
+    small = (v < 0) | (np.abs(v) <= 1e-8)
+    k = np.arange(small.shape[0])
+    # Number of consecutive small differences ending at each difference.
+    run = k - np.maximum.accumulate(np.where(small, -1, k))
+    ends = np.flatnonzero(run >= stability_duration)
+    triggers = np.flatnonzero(absdiff > u_diff) + 1
+    need = max(stability_duration, 1) - 1
+    spans = []
+    idx = 1
+    while True:
+        i = np.searchsorted(triggers, idx)
+        if i == triggers.shape[0]:
+            break
+        idx = triggers[i]
+        j = np.searchsorted(ends, idx + need)
+        if j == ends.shape[0]:
+            # Unstable up to the end of the data.
+            spans.append((idx, absdiff.shape[0] - idx))
+            break
+        spans.append((idx, ends[j] - idx + 1))
+        idx = ends[j] + 2
+    return as_intervals(spans)
+
+
+def _unstable_detector(prepared, u_diff, s_diff=None, stability_duration=10):
+    return sequence_intervals(unstable_intervals(
+        prepared['absdiff'], u_diff, s_diff, stability_duration))
+
+
+def _bouts_detector(prepared, u_diff, s_diff=None, stability_duration=10):
+    bouts = extract_bouts(prepared['data'], prepared['times'], u_diff, s_diff,
+                          stability_duration)
+    return np.column_stack((bouts['start'], bouts['stop']))
+
+
+def _spikes_detector(prepared, threshold, max_separation=0):
+    # As `bcp.preprocess.weight_sensor_positive_spikes`; each spike is the
+    # sample after the jump, and spikes at most `max_separation` samples
+    # apart form one event.
+    spikes = np.flatnonzero((prepared['diffs'] >= threshold) &
+                            ~prepared['gaps']) + 1
+    if spikes.shape[0] == 0:
+        return as_intervals([])
+    breaks = np.flatnonzero(np.diff(spikes) > max_separation + 1) + 1
+    return np.column_stack((spikes[np.concatenate(([0], breaks))],
+                            spikes[np.concatenate((breaks - 1, [-1]))] + 1))
+
+
+def _smooth_detector(prepared, radius, a_thresh, w_thresh):
+    # Samples `smooth` discards as disturbed.
+    return mask_intervals(np.isnan(smooth(prepared['data'], radius, a_thresh,
+                                          w_thresh)))
+
+
+# Maps detector names to functions called as func(prepared, **params)
+# returning the detected [start, stop) intervals.
+DETECTORS = {'unstable_sequences': _unstable_detector,
+             'bouts': _bouts_detector,
+             'spikes': _spikes_detector,
+             'smooth': _smooth_detector}
+
+
+def prepare(data, times, labels, events=None, span=None):
+    '''Return the parameter independent arrays used by every setting.
+
+    Parameters
+    ----------
+    data, times : np.array
+        One dimensional trace and its times in seconds.
+    labels : np.array
+        Output of `read_classifications`.
+    events : iterable, optional
+        Event codes to detect; all labels by default.
+    span : tuple, optional
+        Samples [start, stop) that were labelled; detections outside it
+        are not scored. Defaults to the extent of `labels`.
+
+    Returns
+    -------
+    dict
+    '''
+    data = np.asarray(data)
+    if events is not None:
+        labels = labels[np.isin(labels['event'], list(events))]
+    reference = np.column_stack((labels['start'], labels['stop']))
+    if span is None:
+        span = (int(labels['start'].min()), int(labels['stop'].max()))
+    span = (max(span[0], 0), min(span[1], data.shape[0]))
+    mask = np.zeros(data.shape[0], dtype=bool)
+    for start, stop in reference:
+        mask[start:stop] = True
+    diffs = np.diff(data)
+    return {'data': data, 'times': times, 'diffs': diffs,
+            'absdiff': np.abs(diffs), 'gaps': np.diff(times) > 1,
+            'reference': reference, 'span': span,
+            'labelled': np.concatenate(([0], np.cumsum(mask)))}
+
+
+def score(prepared, detected, tolerance=0):
+    '''Return the scores of `detected` intervals as a tuple of the fields
+    of `SCORE_DTYPE`.'''
+    detected = as_intervals(detected)
+    lo, hi = prepared['span']
+    detected = np.clip(detected[(detected[:, 1] > lo) & (detected[:, 0] < hi)],
+                       lo, hi)
+    one = event_scores(detected, prepared['reference'], tolerance)
+    overlap = precision_recall(detected, prepared['reference'], tolerance)
+    cum = prepared['labelled']
+    # Assumes the detected intervals are disjoint, as for every detector.
+    hit = (cum[detected[:, 1]] - cum[detected[:, 0]]).sum()
+    n = (detected[:, 1] - detected[:, 0]).sum()
+    labelled = cum[hi] - cum[lo]
+    sample_precision = hit / n if n else 0.
+    sample_recall = hit / labelled if labelled else 0.
+    return ((detected.shape[0], one['precision'], one['recall'], one['f1'],
+             one['mean_iou']) + overlap +
+            (float(sample_precision), float(sample_recall)))
+
+
+def evaluate(prepared, detector, params, tolerance=0):
+    '''Run `detector` with `params` on `prepared` and `score` it.'''
+    return score(prepared, DETECTORS[detector](prepared, **params), tolerance)
+
+
+def parameter_grid(grid):
+    '''Return a list with a dict of parameters for every combination of the
+    values in `grid` (a dict mapping parameter names to lists of values).'''
+    names = sorted(grid)
+    return [dict(zip(names, values))
+            for values in itertools.product(*[grid[n] for n in names])]
+
+
+def _init_worker(prepared):
+    global _shared
+    _shared = prepared
+
+
+def _evaluate_shared(detector, params, tolerance):
+    return evaluate(_shared, detector, params, tolerance)
+
+
+def sweep(prepared, detector, grid, jobs=1, tolerance=0):
+    '''Score `detector` for every setting of `grid`.
+
+    Parameters
+    ----------
+    prepared : dict
+        Output of `prepare`.
+    detector : str
+        Key of `DETECTORS`.
+    grid : dict
+        Maps each parameter of the detector to the values to try.
+    jobs : int, optional
+        Number of worker processes; each receives `prepared` once.
+    tolerance : int, optional
+        Passed to `bcp.scoring.event_scores` and
+        `bcp.scoring.precision_recall`.
+
+    Returns
+    -------
+    np.array
+        Structured array with one field per parameter followed by the fields
+        of `SCORE_DTYPE`, one row per setting, sorted by decreasing one to
+        one f1 (then decreasing precision).
+    '''
+    settings = parameter_grid(grid)
+    n = len(settings)
+    if jobs == 1 or n < 2:
+        scores = [evaluate(prepared, detector, p, tolerance)
+                  for p in settings]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                 initargs=(prepared,)) as pool:
+            scores = list(pool.map(_evaluate_shared, [detector] * n,
+                                   settings, [tolerance] * n,
+                                   chunksize=max(n // (4 * jobs), 1)))
+    names = sorted(grid)
+    dtype = ([(name, np.asarray(grid[name]).dtype) for name in names] +
+             SCORE_DTYPE)
+    table = np.array([tuple(p[name] for name in names) + s
+                      for p, s in zip(settings, scores)], dtype=dtype)
+    return table[np.lexsort((-table['precision'], -table['f1']))]
+
+
+def validation_sweep(version, field, detector, grid, jobs=1, tolerance=0,
+                     validation_dir=VALIDATION_DIR):
+    '''`sweep` over a sensor validation recording.
+
+    The events of `FIELD_EVENTS[field]` are the reference, and the detected
+    events are scored from the first filmed sample to the end of the last
+    label.
+    '''
+    data, times, labels = load_validation(version, field, validation_dir)
+    prepared = prepare(data, times, labels, FIELD_EVENTS[field],
+                       (FRAME_OFFSETS[version], int(labels['stop'].max())))
+    return sweep(prepared, detector, grid, jobs, tolerance)
@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+from __future__ import division
+
+import datetime
+import io
+import numpy as np
+
+from bcp.ethoscan import BEHAVIOR_CODES, BEHAVIOR_CODES_TO_INT_MAP
+from bcp.light_cycle import is_light
+
+'''
+Synthetic Promethion exports and Ethoscan reports for scale testing.
+
+The simulated mouse is more active in the dark. While active it walks (XY
+beam positions in 0.25 cm steps), rears, runs on the wheel in bursts and has
+drinking and feeding bouts: during a bout the sensor is noisy with positive
+spikes and afterwards its level has dropped by the uptake. While inactive it
+mostly sits in the habitat, whose mass sensor then reads the body mass (with
+noise and slow drift) instead of a small positive offset. The recording has
+gaps where the machine was stopped.
+
+Everything is generated in chunks of `chunk_size` seconds so exports far
+larger than memory can be written.
+
+Examples
+--------
+Write a week of data for 8 cages and the Ethoscan report of cage 1.
+>>> events = write_promethion_csv('week.csv', 7 * 86400, seed=0)
+>>> write_ethoscan_report('cage1.txt', events[1], 1, DEFAULT_START)
+'''
+
+CAGE_FIELDS = ['XPos', 'YPos', 'ZPos', 'XBreak', 'YBreak', 'ZBreak',
+               'WheelCount', 'FoodA', 'Water', 'BodyMass']
+RT_FIELDS = ['RT_FoodA', 'RT_Water', 'RT_WheelCount']
+TRAILING_FIELDS = ['CommMS', 'ElSeconds', 'Markers']
+DEFAULT_START = datetime.datetime(2015, 6, 11, 18, 41, 56)
+CAGE_BOUNDS = (0., 40., 0., 24.)
+EVENT_DTYPE = [('start', 'f8'), ('end', 'f8'), ('activity', 'i4'),
+               ('amount', 'f8')]
+
+
+def promethion_header(cages):
+    '''Return the column names of a Promethion export for `cages`.'''
+    header = ['Date    Time']
+    header += ['%s_%s' % (f, c) for c in cages for f in CAGE_FIELDS]
+    header += ['%s_%s' % (f, c) for c in cages for f in RT_FIELDS]
+    return header + TRAILING_FIELDS
+
+
+def _bouts(rs, n, rate, min_len, max_len, allowed):
+    '''Return a boolean mask of random bouts starting where `allowed`.'''
+    starts = ((rs.uniform(size=n) < rate) & allowed).nonzero()[0]
+    ends = np.minimum(starts + rs.randint(min_len, max_len + 1,
+                                          size=starts.shape[0]), n)
+    marks = np.zeros(n + 1, dtype=int)
+    np.add.at(marks, starts, 1)
+    np.add.at(marks, ends, -1)
+    return marks.cumsum()[:n] > 0
+
+
+def _runs(mask):
+    '''Return starts and (exclusive) ends of runs of True in `mask`.'''
+    d = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return (d == 1).nonzero()[0], (d == -1).nonzero()[0]
+
+
+class _CageState(object):
+    '''State carried between chunks for one simulated cage.'''
+
+    def __init__(self, rs):
+        self.x = rs.uniform(CAGE_BOUNDS[0], CAGE_BOUNDS[1])
+        self.y = rs.uniform(CAGE_BOUNDS[2], CAGE_BOUNDS[3])
+        self.food = rs.uniform(360, 390)
+        self.water = rs.uniform(320, 350)
+        self.mass = rs.uniform(20, 30)
+
+
+def _simulate_cage(rs, state, t, light):
+    '''Simulate one chunk of one cage.
+
+    Returns the columns (in `CAGE_FIELDS` then `RT_FIELDS` order) and a
+    structured array of the behavioral events in the chunk.
+    '''
+    n = t.shape[0]
+    active = rs.uniform(size=n) < np.where(light, .15, .6)
+    # Smooth activity into bouts of behavior lasting tens of seconds.
+    active = np.convolve(active, np.ones(30) / 30., 'same') > .4
+
+    # XY random walk in quarter cm steps while active.
+    step = rs.choice([-.25, 0, .25], size=(2, n)) * active
+    x = np.clip(state.x + np.cumsum(step[0] * 4), CAGE_BOUNDS[0],
+                CAGE_BOUNDS[1])
+    y = np.clip(state.y + np.cumsum(step[1] * 4), CAGE_BOUNDS[2],
+                CAGE_BOUNDS[3])
+    x = np.round(x * 4) / 4
+    y = np.round(y * 4) / 4
+    rearing = active & (rs.uniform(size=n) < .1)
+    z = np.where(rearing, np.round(rs.uniform(1, 20, size=n) * 4) / 4, 0)
+    # X and Y break positions are reported in half cm, Z in whole cm.
+    breaks = np.where(active, rs.randint(0, 50, size=(3, n)) / 2., 0)
+    breaks[2] = np.floor(breaks[2])
+
+    wheel_bouts = _bouts(rs, n, .002, 30, 600, active)
+    wheel = np.where(wheel_bouts, rs.randint(1, 9, size=n), 0)
+
+    free = active & ~wheel_bouts
+    drinking = _bouts(rs, n, .0015, 3, 60, free)
+    feeding = _bouts(rs, n, .0015, 5, 120, free & ~drinking)
+    in_home = ~active & ~drinking & ~feeding & ~wheel_bouts
+
+    events = []
+    levels = []
+    for mask, name, level, code in [(drinking, 'water', state.water, 'DWATR'),
+                                    (feeding, 'food', state.food, 'EFODA')]:
+        starts, ends = _runs(mask)
+        uptake = rs.uniform(.005, .08, size=starts.shape[0])
+        drop = np.zeros(n)
+        drop[np.minimum(ends, n - 1)] = uptake
+        trace = (level - np.cumsum(drop) + rs.normal(0, .002, size=n) +
+                 mask * np.abs(rs.normal(0, .3, size=n)))
+        spikes = mask & (rs.uniform(size=n) < .2)
+        trace[spikes] += rs.uniform(.5, 5, size=spikes.sum())
+        levels.append(trace)
+        setattr(state, name, level - uptake.sum())
+        events.append((starts, ends, BEHAVIOR_CODES_TO_INT_MAP[code], uptake))
+    water, food = levels
+
+    # Body mass drifts slowly; the habitat reads it only when occupied.
+    state.mass += rs.normal(0, .01)
+    drift = .4 * np.sin(2 * np.pi * t / 3600. + rs.uniform(0, 2 * np.pi))
+    body = np.where(in_home, state.mass + drift + rs.normal(0, .3, size=n),
+                    rs.uniform(0, .5, size=n))
+
+    starts, ends = _runs(wheel_bouts)
+    revs = np.add.reduceat(wheel, starts) if starts.size else np.empty(0)
+    events.append((starts, ends, BEHAVIOR_CODES_TO_INT_MAP['WHEEL'], revs))
+    starts, ends = _runs(in_home)
+    long_enough = ends - starts >= 10
+    starts, ends = starts[long_enough], ends[long_enough]
+    events.append((starts, ends, BEHAVIOR_CODES_TO_INT_MAP['IHOME'],
+                   state.mass + np.zeros(starts.shape[0])))
+
+    state.x, state.y = x[-1], y[-1]
+    columns = [x, y, z, breaks[0], breaks[1], breaks[2], wheel, food, water,
+               body, np.zeros(n), np.zeros(n), wheel]
+    ev = np.empty(sum(e[0].shape[0] for e in events), dtype=EVENT_DTYPE)
+    i = 0
+    for starts, ends, code, amount in events:
+        j = i + starts.shape[0]
+        ev['start'][i:j] = t[starts]
+        ev['end'][i:j] = t[ends - 1] + 1
+        ev['activity'][i:j] = code
+        ev['amount'][i:j] = amount
+        i = j
+    return columns, ev
+
+
+def recording_gaps(n_seconds, seed=None, rate=1 / 86400., min_length=600,
+                   max_length=3600):
+    '''Return Nx2 array of [start, end) seconds where recording stopped.'''
+    rs = np.random.RandomState(seed)
+    n = rs.poisson(rate * n_seconds)
+    starts = np.sort(rs.uniform(0, n_seconds, size=n))
+    return np.vstack((starts, starts + rs.uniform(min_length, max_length,
+                                                  size=n))).T
+
+
+def simulate_promethion(n_seconds, cages=range(1, 9),
+                        start_timestamp=DEFAULT_START, seed=None,
+                        schedule=(7, 12), gaps=None, chunk_size=86400):
+    '''Simulate a Promethion recording, yielding it in chunks.
+
+    Parameters
+    ----------
+    n_seconds : int
+        Length of the experiment in seconds (1 Hz sampling).
+    cages : list, optional
+        Cage identifiers.
+    start_timestamp : datetime.datetime, optional
+        Time of the first sample.
+    seed : int, optional
+        Seed for the random number generator.
+    schedule : array-like, optional
+        Light schedule, see `bcp.light_cycle`.
+    gaps : np.array, optional
+        Nx2 array of [start, end) seconds without recording. Defaults to
+        `recording_gaps(n_seconds, seed)`.
+    chunk_size : int, optional
+        Seconds simulated per chunk.
+
+    Yields
+    ------
+    times : np.array
+        Seconds since `start_timestamp` of each recorded sample.
+    values : np.array
+        Array of shape len(times) X (len(header) - 1) of column values in
+        `promethion_header(cages)` order (without the date column).
+    events : dict
+        Maps each cage to a structured array (`EVENT_DTYPE`) of the drinking,
+        feeding, wheel and habitat events in the chunk.
+    '''
+    rs = np.random.RandomState(seed)
+    if gaps is None:
+        gaps = recording_gaps(n_seconds, seed)
+    gaps = np.asarray(gaps, dtype=float).reshape(-1, 2)
+    states = [_CageState(rs) for _ in cages]
+    for t0 in range(0, n_seconds, chunk_size):
+        t = np.arange(t0, min(t0 + chunk_size, n_seconds), dtype=float)
+        light = is_light(t, schedule, start_timestamp)
+        cage_cols, rt_cols, events = [], [], {}
+        for cage, state in zip(cages, states):
+            columns, ev = _simulate_cage(rs, state, t, light)
+            cage_cols.extend(columns[:len(CAGE_FIELDS)])
+            rt_cols.extend(columns[len(CAGE_FIELDS):])
+            events[cage] = ev
+        n = t.shape[0]
+        trailing = [np.full(n, 255.), np.round(rs.uniform(0, .01, size=n), 3),
+                    np.full(n, -1.)]
+        values = np.vstack(cage_cols + rt_cols + trailing).T
+
+        recorded = np.ones(n, dtype=bool)
+        for s, e in gaps:
+            recorded[(t >= s) & (t < e)] = False
+        # The first reading after a gap often jumps as drops fall off the
+        # sensors; add a positive spike to the weight channels there.
+        after_gap = np.diff(np.concatenate(([1], recorded.astype(int)))) == 1
+        if after_gap.any():
+            for i, name in enumerate(promethion_header(cages)[1:]):
+                if name.split('_')[0] in ('Water', 'FoodA'):
+                    values[after_gap, i] += rs.uniform(
+                        .5, 3, size=after_gap.sum())
+        for cage in cages:
+            ev = events[cage]
+            events[cage] = ev[np.interp(ev['start'], t, recorded) > 0]
+        yield t[recorded], values[recorded], events
+
+
+def _format_timestamps(start_timestamp, times):
+    '''Format seconds since `start_timestamp` as Promethion date strings.'''
+    dt = (np.datetime64(start_timestamp, 's') +
+          np.asarray(times).astype('timedelta64[s]'))
+    days = dt.astype('M8[D]')
+    months = dt.astype('M8[M]')
+    years = dt.astype('M8[Y]')
+    day = (days - months).astype(int) + 1
+    month = (months - years).astype(int) + 1
+    year = years.astype(int) + 1970
+    sec = (dt - days).astype(int)
+    return ['%d/%d/%d %02d:%02d:%02d' % v for v in
+            zip(month, day, year, sec // 3600, sec // 60 % 60, sec % 60)]
+
+
+def _format_datetime(dt):
+    '''Format `dt` as a Promethion date string (M/D/YYYY HH:MM:SS).'''
+    return '%d/%d/%d %s' % (dt.month, dt.day, dt.year, dt.strftime('%H:%M:%S'))
+
+
+def write_promethion_csv(fp, n_seconds, cages=range(1, 9),
+                         start_timestamp=DEFAULT_START, seed=None, **kwargs):
+    '''Write a synthetic Promethion export to `fp`.
+
+    Parameters
+    ----------
+    fp : str
+        Path of the file to write.
+    n_seconds, cages, start_timestamp, seed, kwargs
+        See `simulate_promethion`.
+
+    Returns
+    -------
+    events : dict
+        Maps each cage to a structured array of its simulated events, in
+        seconds since `start_timestamp`.
+    '''
+    cages = list(cages)
+    header = promethion_header(cages)
+    fmt = []
+    for name in header[1:]:
+        field = name.rsplit('_', 1)[0] if name[-1].isdigit() else name
+        fmt.append('%.4f' if field in ('FoodA', 'Water', 'BodyMass') else
+                   '%.3f' if field == 'ElSeconds' else '%g')
+    events = {c: [] for c in cages}
+    with open(fp, 'w') as f:
+        f.write(','.join(header) + '\n')
+        for times, values, ev in simulate_promethion(
+                n_seconds, cages, start_timestamp, seed, **kwargs):
+            buf = io.StringIO()
+            np.savetxt(buf, values, fmt=fmt, delimiter=',')
+            rows = buf.getvalue().splitlines()
+            stamps = _format_timestamps(start_timestamp, times)
+            f.write(''.join('%s,%s\n' % (s, r) for s, r in zip(stamps, rows)))
+            for c in cages:
+                events[c].append(ev[c])
+    return {c: np.concatenate(v) for c, v in events.items()}
+
+
+def ethoscan_report_lines(events, cage, start_timestamp, report_start=0.):
+    '''Return the lines of an Ethoscan report for simulated `events`.
+
+    Time between the given events is filled with short (5-60 s) and long
+    (> 60 s) lounges, as in Ethoscan output. The 78 header lines carry the
+    behavior code table; `bcp.ethoscan.parse_ethoscan_report` reads the
+    behavior list that follows them.
+
+    Parameters
+    ----------
+    events : np.array
+        Structured array (`EVENT_DTYPE`) of events for one cage.
+    cage : str or int
+        Cage identifier used in the header.
+    start_timestamp : datetime.datetime
+        Datetime of time 0 of `events`.
+    report_start : float, optional
+        Time (seconds since `start_timestamp`) the report starts; the first
+        behavior is classified one second later.
+    '''
+    ev = np.sort(events[events['start'] >= report_start + 1], order='start')
+    # Drop events overlapping the previous one; Ethoscan behaviors tile time.
+    keep = np.ones(ev.shape[0], dtype=bool)
+    last_end = -np.inf
+    for i in range(ev.shape[0]):
+        keep[i] = ev['start'][i] >= last_end
+        if keep[i]:
+            last_end = ev['end'][i]
+    ev = ev[keep]
+    gap_starts = np.concatenate(([report_start + 1], ev['end']))
+    gap_ends = np.concatenate((ev['start'], [gap_starts[-1]]))
+    lounge = gap_ends - gap_starts >= 5
+    lounges = np.empty(lounge.sum(), dtype=EVENT_DTYPE)
+    lounges['start'] = gap_starts[lounge]
+    lounges['end'] = gap_ends[lounge]
+    lounges['activity'] = np.where(
+        lounges['end'] - lounges['start'] > 60,
+        BEHAVIOR_CODES_TO_INT_MAP['LLNGE'], BEHAVIOR_CODES_TO_INT_MAP['SLNGE'])
+    lounges['amount'] = lounges['end'] - lounges['start']
+    ev = np.sort(np.concatenate((ev, lounges)), order='start')
+
+    start = start_timestamp + datetime.timedelta(seconds=report_start)
+    stop = start_timestamp + datetime.timedelta(
+        seconds=float(ev['end'][-1]) if ev.shape[0] else report_start)
+    header = ['EthoScan: Data for cage %s, from file synthetic.exp.' % cage,
+              'Analyzed from %s to %s' % (_format_datetime(start),
+                                          _format_datetime(stop)),
+              '*' * 113, '',
+              'Behavior codes (not all may be present in this recording):']
+    header += ['%s,Synthetic behavior' % c for c in BEHAVIOR_CODES]
+    header += [''] * (76 - len(header))
+    header += ["Behavior list follows. 'Amount' is cm (SLNGE, LLNGE), "
+               "revolutions (WHEEL), grams (EFODx, IHOME) or mL (DWATR)",
+               ' Sample,Start_Date,Start_Time,End_Time,Durat_Sec,Activity,'
+               'Amount,Rear%,X_cm,Y_cm,S_cm']
+    lines = [h + '\r\n' for h in header]
+    for s, e, code, amount in ev:
+        t0 = start_timestamp + datetime.timedelta(seconds=float(s))
+        t1 = start_timestamp + datetime.timedelta(seconds=float(e) - 1)
+        lines.append(' %06d,%d/%d/%d\t%s,%s,%d,%s,%.3f,00.0,0.0,0.0,000\r\n' %
+                     (s - report_start, t0.month, t0.day, t0.year,
+                      t0.strftime('%H:%M:%S'), t1.strftime('%H:%M:%S'),
+                      e - s, BEHAVIOR_CODES[code], amount))
+    return lines
+
+
+def write_ethoscan_report(fp, events, cage, start_timestamp, report_start=0.):
+    '''Write `ethoscan_report_lines` to `fp`.'''
+    with open(fp, 'w', newline='') as f:
+        f.writelines(ethoscan_report_lines(events, cage, start_timestamp,
+                                           report_start))
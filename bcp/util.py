@@ -1,5 +1,5 @@
 #!/usr/bin/env python
-from bcp.parse import convert_promethion_date
+from bcp.light_cycle import dark_intervals
 import datetime
 import numpy as np
 
@@ -42,41 +42,14 @@ def nights(day_start, day_length, start_timestamp, total_exp_seconds):
         2xN array with N nights. The [i,0] entry is the time the ith night
         starts (in seconds since the experiment started) and [i,1] is the time
         the ith night ends.
+
+    Notes
+    -----
+    Thin wrapper around `bcp.light_cycle.dark_intervals`, which also handles
+    days spanning midnight and schedules that change during the experiment.
     '''
-    # Ensure that midnight occurs during 'night'; e.g. the day must change
-    # during the night cycle or this function will break.
-    assert day_start + day_length < 24
-    
-    day_end = day_start + day_length
-    day_length = day_length * 3600 
-
-    # Determine where the first timepoint is. 
-    a = seconds_till(start_timestamp, hour = day_start, minute = 0, second = 0)
-    b = seconds_till(start_timestamp, hour = day_end, minute = 0, second = 0)
-    if (a > 0 and b > 0):
-        n0s = 0
-        n0e = a
-    elif (a < 0 and b <= 0):
-        n0s = 0
-        n0e = seconds_till(start_timestamp, day = start_timestamp.day + 1,
-                           hour = day_start, minute = 0, second = 0 )
-    elif (a <= 0 and b > 0):
-        n0s = seconds_till(start_timestamp, hour = day_end, minute = 0,
-                           second = 0 )
-        n0e = n0s + 24*3600 - day_length
-    nights = [[n0s, n0e]]
-    
-    # Add entries to night and day until we surpass the total seconds elapsed 
-    # for the experiment. Break and return.
-    while nights[-1][1] < total_exp_seconds:
-        nns = nights[-1][1] + day_length
-        nne = nights[-1][1] + 24*3600
-        if nns > total_exp_seconds:
-            break
-        elif nne > total_exp_seconds:
-            nne = total_exp_seconds
-        nights.append([nns, nne])
-    return np.array(nights)
+    return dark_intervals((day_start, day_length), start_timestamp,
+                          total_exp_seconds)
 
 def days(nights, total_exp_seconds):
     '''Return array of times at which cages are light.
@@ -95,6 +68,10 @@ def days(nights, total_exp_seconds):
         (in seconds since the experiment started) and [i,1] is the time
         the ith day ends.
     '''
+    nights = np.asarray(nights).reshape(-1, 2)
+    if nights.shape[0] == 0:
+        # Constant light.
+        return np.array([[0, total_exp_seconds]])[:int(total_exp_seconds > 0)]
     days = np.vstack((nights[:-1, 1], nights[1:, 0])).T
     if nights[0, 0] > 0:
         days = np.vstack((np.array([0, nights[0, 0]]), days))
@@ -122,3 +99,42 @@ def binary_rearing(data):
         broken, i.e. rearing, 0 otherwise.
     '''
     return np.where(data > 0, 1, 0)
+
+def float_dtype(data, dtype=None):
+    '''Return the dtype computations on `data` should produce.
+
+    Notes
+    -----
+    bcp functions keep the dtype of floating point input (e.g. the float32
+    arrays from `bcp.parse.promethion_to_array`) rather than promoting to
+    float64, so a pipeline over a whole experiment does not double its
+    memory at every stage. Other input (integers, booleans) gives float64.
+    Passing `dtype` overrides this, e.g. dtype=np.float64 for extra precision
+    on float32 input.
+
+    Parameters
+    ----------
+    data : np.array
+        Input of the computation.
+    dtype : np.dtype, optional
+        Requested dtype.
+
+    Returns
+    -------
+    np.dtype
+    '''
+    if dtype is not None:
+        return np.dtype(dtype)
+    data_dtype = np.asarray(data).dtype
+    if data_dtype.kind == 'f':
+        return data_dtype
+    return np.dtype(np.float64)
+
+def output_array(out, shape, dtype):
+    '''Return `out` after checking its shape, or a new empty array.'''
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    if out.shape != tuple(shape):
+        raise ValueError('`out` has shape %s, expected %s.' %
+                         (out.shape, tuple(shape)))
+    return out
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+from __future__ import division
+
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from bcp.parse import promethion_to_array
+from bcp.preprocess import (stable_sequences, valued_sequences,
+                            unstable_sequences, smooth,
+                            interpolate_between_nans)
+from bcp.stats import moving_function
+from bcp.feature_extraction import trace_to_signals_matrix
+
+'''
+Benchmarks for the preprocessing and parsing hot paths.
+
+Classes follow the asv conventions (`params`, `setup`, `time_*` and
+`peakmem_*` methods) and are run by `benchmarks/run.py`, which records wall
+time and peak traced memory per benchmark and size. Each benchmark is run on
+synthetic traces of the sizes in `SIZES` (up to its `max_size`; several
+functions are pure Python loops) and on the `data/sensor_validation` arrays.
+'''
+
+SIZES = [10**4, 10**5, 10**6, 10**7]
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                        'data', 'sensor_validation')
+VALIDATION = ['v1/Water_2', 'v2/Water_2', 'v2/FoodA_2', 'v3/Water_2',
+              'v3/FoodA_2']
+
+
+def synthetic_weight_trace(n, seed=0):
+    '''Return a float32 water/food style weight trace of length `n`.
+
+    The trace is a slowly falling level with sensor noise, occasional
+    drinking steps and positive spikes when the mouse touches the sensor.
+    '''
+    rs = np.random.RandomState(seed)
+    steps = np.zeros(n)
+    steps[rs.randint(0, n, size=max(n // 2000, 1))] = -rs.uniform(
+        .01, .1, size=max(n // 2000, 1))
+    trace = 350 + np.cumsum(steps) + rs.normal(0, .002, size=n)
+    spikes = rs.randint(0, n, size=max(n // 500, 1))
+    trace[spikes] += rs.uniform(.5, 5, size=spikes.shape[0])
+    return trace.astype(np.float32)
+
+
+def load_trace(param):
+    '''Return the trace for a benchmark parameter (a size or dataset name).'''
+    if isinstance(param, str):
+        return np.load(os.path.join(DATA_DIR, param + '.npy'))
+    return synthetic_weight_trace(param)
+
+
+class _TraceBenchmark(object):
+    '''Base class for benchmarks over one dimensional traces.'''
+    params = SIZES + VALIDATION
+    param_names = ['trace']
+    max_size = 10**7
+
+    def setup(self, param):
+        if not isinstance(param, str) and param > self.max_size:
+            raise NotImplementedError  # asv's way of skipping a parameter.
+        self.data = load_trace(param)
+        if self.data.shape[0] > self.max_size:
+            raise NotImplementedError
+
+
+class StableSequences(_TraceBenchmark):
+    max_size = 10**6
+
+    def time_stable_sequences(self, param):
+        stable_sequences(self.data, .005, 10)
+
+    def peakmem_stable_sequences(self, param):
+        stable_sequences(self.data, .005, 10)
+
+
+class ValuedSequences(_TraceBenchmark):
+    max_size = 10**6
+
+    def setup(self, param):
+        _TraceBenchmark.setup(self, param)
+        self.data = (np.abs(np.diff(self.data)) < .005).astype(np.float32)
+
+    def time_valued_sequences(self, param):
+        valued_sequences(self.data, 1, 10)
+
+    def peakmem_valued_sequences(self, param):
+        valued_sequences(self.data, 1, 10)
+
+
+class UnstableSequences(_TraceBenchmark):
+    max_size = 10**6
+
+    def time_unstable_sequences(self, param):
+        unstable_sequences(self.data, .05, .01, 10)
+
+    def peakmem_unstable_sequences(self, param):
+        unstable_sequences(self.data, .05, .01, 10)
+
+
+class Smooth(_TraceBenchmark):
+    max_size = 10**5
+
+    def time_smooth(self, param):
+        smooth(self.data, 200, .05, 20)
+
+    def peakmem_smooth(self, param):
+        smooth(self.data, 200, .05, 20)
+
+
+class InterpolateBetweenNans(_TraceBenchmark):
+    max_size = 10**6
+
+    def setup(self, param):
+        _TraceBenchmark.setup(self, param)
+        self.data = self.data.astype(float)
+        n = self.data.shape[0]
+        rs = np.random.RandomState(1)
+        for i in rs.randint(1, max(n - 60, 2), size=max(n // 1000, 1)):
+            self.data[i:i + 50] = np.nan
+        self.data[0] = self.data[-1] = 0
+
+    def time_interpolate_between_nans(self, param):
+        interpolate_between_nans(self.data)
+
+    def peakmem_interpolate_between_nans(self, param):
+        interpolate_between_nans(self.data)
+
+
+class MovingFunction(_TraceBenchmark):
+
+    def time_moving_sum(self, param):
+        moving_function(self.data, 60, 'sum', 1)
+
+    def peakmem_moving_sum(self, param):
+        moving_function(self.data, 60, 'sum', 1)
+
+    def time_moving_average(self, param):
+        moving_function(self.data, 601, 'average', 1)
+
+
+class TraceToSignalsMatrix(_TraceBenchmark):
+
+    def time_non_overlapping(self, param):
+        trace_to_signals_matrix(self.data, 200)
+
+    def peakmem_non_overlapping(self, param):
+        trace_to_signals_matrix(self.data, 200)
+
+    def time_overlapping(self, param):
+        trace_to_signals_matrix(self.data, 200, hop=50)
+
+
+class PromethionToArray(object):
+    '''Parse a synthetic Promethion export with `n` rows for 8 cages.'''
+    params = [10**3, 10**4, 10**5]
+    param_names = ['rows']
+    max_size = 10**5
+    fields = ['XPos', 'YPos', 'ZPos', 'XBreak', 'YBreak', 'ZBreak',
+              'WheelCount', 'FoodA', 'Water', 'BodyMass']
+
+    def setup(self, n):
+        self.tmp = tempfile.mkdtemp()
+        self.fp = os.path.join(self.tmp, 'export.csv')
+        rs = np.random.RandomState(0)
+        cages = range(1, 9)
+        header = ['Date    Time'] + ['%s_%d' % (f, c) for c in cages
+                                     for f in self.fields]
+        values = rs.uniform(0, 400, size=(n, len(header) - 1))
+        with open(self.fp, 'w') as f:
+            f.write(','.join(header) + '\n')
+            for i, row in enumerate(values):
+                h, m, s = i // 3600 % 24, i // 60 % 60, i % 60
+                f.write('6/11/2015 %d:%02d:%02d,' % (h, m, s) +
+                        ','.join('%.4f' % v for v in row) + '\n')
+
+    def teardown(self, n):
+        shutil.rmtree(self.tmp)
+
+    def time_promethion_to_array(self, n):
+        promethion_to_array(self.fp, range(1, 9), self.fields)
+
+    def peakmem_promethion_to_array(self, n):
+        promethion_to_array(self.fp, range(1, 9), self.fields)
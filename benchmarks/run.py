@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+from __future__ import division
+
+import argparse
+import datetime
+import inspect
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+'''
+Run the benchmarks in `benchmarks/benchmarks.py` and record the results.
+
+For every benchmark method and parameter this records the best wall time over
+`--repeat` runs (`time_*` methods) and the peak memory traced by tracemalloc
+during one run (`peakmem_*` methods; NumPy reports its buffers to tracemalloc).
+Results are written as JSON so runs can be compared for regressions:
+
+    python benchmarks/run.py --output before.json
+    python benchmarks/run.py --output after.json --compare before.json
+'''
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchmarks
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _benchmark_classes(pattern):
+    for name, cls in inspect.getmembers(benchmarks, inspect.isclass):
+        if name.startswith('_') or cls.__module__ != benchmarks.__name__:
+            continue
+        for method in sorted(vars(cls)):
+            if method.startswith(('time_', 'peakmem_')):
+                full = '%s.%s' % (name, method)
+                if pattern is None or pattern in full:
+                    yield full, cls, method
+
+
+def run_one(cls, method, param, repeat):
+    '''Return the measurement of `cls.method(param)` or None if skipped.'''
+    bench = cls()
+    try:
+        bench.setup(param)
+    except NotImplementedError:
+        return None
+    try:
+        func = getattr(bench, method)
+        if method.startswith('time_'):
+            best = np.inf
+            for _ in range(repeat):
+                start = time.perf_counter()
+                func(param)
+                best = min(best, time.perf_counter() - start)
+            return best
+        tracemalloc.start()
+        try:
+            func(param)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    finally:
+        if hasattr(bench, 'teardown'):
+            bench.teardown(param)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run the bcp benchmarks and record the results.')
+    parser.add_argument('--filter', help='Only run benchmarks whose '
+                        'Class.method name contains this string.')
+    parser.add_argument('--max-size', type=float, default=None,
+                        help='Skip synthetic traces larger than this.')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='Write results to this JSON file.')
+    parser.add_argument('--compare', help='JSON results to compare against.')
+    args = parser.parse_args(argv)
+
+    results = {'meta': {'date': datetime.datetime.now().isoformat(),
+                        'commit': _git_revision(),
+                        'python': platform.python_version(),
+                        'numpy': np.__version__,
+                        'machine': platform.machine()},
+               'results': {}}
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    for full, cls, method in _benchmark_classes(args.filter):
+        for param in cls.params:
+            if (args.max_size is not None and not isinstance(param, str) and
+                    param > args.max_size):
+                continue
+            value = run_one(cls, method, param, args.repeat)
+            if value is None:
+                continue
+            key = '%s[%s]' % (full, param)
+            results['results'][key] = value
+            unit = 's' if method.startswith('time_') else 'B'
+            line = '%-60s %12.4g %s' % (key, value, unit)
+            if baseline is not None and key in baseline:
+                line += '  x%.2f' % (value / baseline[key])
+            print(line)
+            sys.stdout.flush()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+from unittest import TestCase, main
+import os
+import shutil
+import tempfile
+import numpy as np
+from bcp.archive import (encode_chunk, decode_chunk, write_channel,
+                         ArchivedChannel, archive_experiment,
+                         restore_experiment, open_channel, open_times)
+from bcp.store import save_array, write_manifest, read_manifest
+
+
+class TestArchive(TestCase):
+    '''Test the compressed experiment archive.'''
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        rs = np.random.RandomState(0)
+        # Beam position: random walk in 0.25 cm steps.
+        self.xpos = np.clip(np.cumsum(rs.randint(-1, 2, 10000)) / 4., 0,
+                            40).astype(np.float32)
+        self.wheel = np.where(rs.uniform(size=10000) < .1,
+                              rs.randint(0, 8, 10000), 0).astype(np.float32)
+        # Weights read with 4 decimals.
+        self.water = np.float32(np.round(
+            320 + rs.normal(0, .01, 10000).cumsum(), 4))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def roundtrip(self, chunk):
+        meta, buf = encode_chunk(chunk)
+        obs = decode_chunk(meta, buf, chunk.dtype, chunk.shape[0])
+        np.testing.assert_array_equal(obs, chunk)
+        self.assertEqual(obs.dtype, chunk.dtype)
+        return meta
+
+    def test_encode_chunk(self):
+        self.assertEqual(self.roundtrip(self.xpos)['scale'], 4)
+        self.assertEqual(self.roundtrip(self.wheel)['scale'], 1)
+        self.assertEqual(self.roundtrip(self.water)['scale'], 10000)
+        self.assertEqual(self.roundtrip(np.arange(5))['delta_dtype'], '|i1')
+        self.assertEqual(self.roundtrip(np.array([1.5]))['mode'], 'delta')
+        nan = self.xpos.copy()
+        nan[3] = np.nan
+        self.assertEqual(self.roundtrip(nan)['mode'], 'shuffle')
+        self.assertEqual(self.roundtrip(np.array([np.pi, 1e300]))['mode'],
+                         'shuffle')
+
+    def test_channel(self):
+        fp = os.path.join(self.tmp, 'XPos_1.bca')
+        size = write_channel(fp, self.xpos, chunk_size=1000)
+        self.assertTrue(self.xpos.nbytes / size > 5)
+        ch = ArchivedChannel(fp)
+        self.assertEqual(ch.shape, (10000,))
+        self.assertEqual(len(ch), 10000)
+        self.assertEqual(ch.dtype, np.float32)
+        np.testing.assert_array_equal(ch[:], self.xpos)
+        np.testing.assert_array_equal(ch[999:2001], self.xpos[999:2001])
+        np.testing.assert_array_equal(ch[-5:], self.xpos[-5:])
+        np.testing.assert_array_equal(ch[5:5], [])
+        np.testing.assert_array_equal(ch[::7], self.xpos[::7])
+        np.testing.assert_array_equal(np.asarray(ch), self.xpos)
+
+        fp = os.path.join(self.tmp, 'WheelCount_1.bca')
+        size = write_channel(fp, self.wheel, chunk_size=1000, codec='lzma')
+        self.assertTrue(self.wheel.nbytes / size > 5)
+        np.testing.assert_array_equal(ArchivedChannel(fp)[3500:3600],
+                                      self.wheel[3500:3600])
+
+        with open(os.path.join(self.tmp, 'bad.bca'), 'wb') as f:
+            f.write(b'not an archive')
+        self.assertRaises(ValueError, ArchivedChannel,
+                          os.path.join(self.tmp, 'bad.bca'))
+
+    def test_archive_experiment(self):
+        exp = os.path.join(self.tmp, 'exp')
+        os.mkdir(exp)
+        save_array(os.path.join(exp, 'time.npy'), np.arange(10000.))
+        save_array(os.path.join(exp, 'XPos_1.npy'), self.xpos)
+        save_array(os.path.join(exp, 'Water_1.npy'), self.water)
+        save_array(os.path.join(exp, 'WaterCentroids_1.npy'),
+                   np.zeros((3, 2)))
+        write_manifest(exp, {'n': 10000})
+        arch = os.path.join(self.tmp, 'arch')
+        sizes = archive_experiment(exp, arch, chunk_size=4096)
+        self.assertEqual(sorted(sizes), ['Water_1.bca', 'XPos_1.bca',
+                                         'time.bca'])
+        np.testing.assert_array_equal(open_channel(arch, 'Water', 1)[:],
+                                      self.water)
+        np.testing.assert_array_equal(open_times(arch)[10:20],
+                                      np.arange(10., 20.))
+
+        restored = os.path.join(self.tmp, 'restored')
+        restore_experiment(arch, restored)
+        np.testing.assert_array_equal(
+            np.load(os.path.join(restored, 'XPos_1.npy')), self.xpos)
+        self.assertEqual(read_manifest(restored), {'n': 10000})
+
+# run unit tests if run from command-line
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+from unittest import TestCase, main
+import numpy as np
+from bcp.body_mass import (grouped_median, grouped_trimmed_mean, occupied,
+                           window_estimates, body_mass, hourly_body_mass)
+
+
+class TestBodyMass(TestCase):
+    '''Test body mass estimation.'''
+
+    def setUp(self):
+        # Out of the habitat for 100 s, in for 300 s (mass 25 drifting up by
+        # .5 g, with noise and a few wild readings), out for 100 s, in again.
+        rs = np.random.RandomState(0)
+        self.t = np.arange(800.)
+        mass = 25 + self.t / 800.
+        inside = ((self.t >= 100) & (self.t < 400)) | (self.t >= 500)
+        noise = rs.normal(0, .3, 800)
+        noise[rs.randint(0, 800, 20)] += 5
+        self.data = np.where(inside, mass + noise, rs.uniform(0, 1, 800))
+        self.mass = mass
+
+    def test_grouped_statistics(self):
+        rs = np.random.RandomState(1)
+        values = rs.normal(size=200)
+        groups = np.sort(rs.randint(0, 6, 200))
+        groups[groups == 4] = 5
+        obs_med = grouped_median(values, groups, 7)
+        obs_trim = grouped_trimmed_mean(values, groups, 7, .2)
+        for g in range(7):
+            v = np.sort(values[groups == g])
+            if v.shape[0] == 0:
+                self.assertTrue(np.isnan(obs_med[g]))
+                self.assertTrue(np.isnan(obs_trim[g]))
+                continue
+            k = int(np.floor(v.shape[0] * .2))
+            np.testing.assert_allclose(obs_med[g], np.median(v))
+            np.testing.assert_allclose(obs_trim[g], v[k:v.shape[0] - k].mean())
+        np.testing.assert_array_equal(grouped_median(np.array([]),
+                                                     np.array([], int), 2),
+                                      [np.nan, np.nan])
+
+    def test_occupied(self):
+        data = np.array([0, 20, 20, 20, 20, 20, 0, 20, 20, 20, 20, 20, 20])
+        t = np.array([0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 20, 21, 22])
+        mask, run, position = occupied(data, t, min_duration=3, trim=1)
+        # The second run is split by the gap after t=9 into runs of 3 and 3.
+        np.testing.assert_array_equal(
+            mask, [0, 0, 1, 1, 1, 0, 0, 0, 1, 0, 0, 1, 0])
+        np.testing.assert_array_equal(
+            run, [-1, -1, 0, 0, 0, -1, -1, -1, 1, -1, -1, 2, -1])
+        np.testing.assert_array_equal(
+            position, [-1, -1, 0, 1, 2, -1, -1, -1, 0, -1, -1, 0, -1])
+
+    def test_window_estimates(self):
+        est = window_estimates(self.data, self.t, window=50)
+        # Runs of 300 and 300 samples less 5 trimmed at both ends.
+        np.testing.assert_array_equal(est['n'], [50] * 5 + [40] + [50] * 5 +
+                                      [40])
+        np.testing.assert_array_equal(est['cage'], 0)
+        truth = 25 + est['time'] / 800.
+        self.assertTrue(np.abs(est['mass'] - truth).max() < .15)
+        est = window_estimates(self.data, self.t, window=50,
+                               statistic='trimmed_mean', proportion=.2)
+        self.assertTrue(np.abs(est['mass'] - 25 - est['time'] / 800.).max() <
+                        .15)
+        self.assertRaises(ValueError, window_estimates, self.data, self.t,
+                          statistic='mean')
+
+    def test_body_mass(self):
+        obs = body_mass(self.data, self.t, window=50)
+        self.assertEqual(obs.shape, (800,))
+        self.assertTrue(np.abs(obs - self.mass)[100:].max() < .2)
+        # Several cages at once, one of which is never occupied.
+        data = np.vstack((self.data, self.data[::-1], np.zeros(800)))
+        obs = body_mass(data, self.t, window=50)
+        np.testing.assert_array_equal(obs[0], body_mass(self.data, self.t,
+                                                        window=50))
+        np.testing.assert_array_equal(
+            obs[1], body_mass(self.data[::-1], self.t, window=50))
+        self.assertTrue(np.isnan(obs[2]).all())
+
+    def test_window_estimates_dtype(self):
+        est = window_estimates(self.data.astype(np.float32), self.t,
+                               window=50)
+        self.assertEqual(est['mass'].dtype, np.float32)
+        exp = window_estimates(self.data.astype(np.float32), self.t,
+                               window=50, dtype=np.float64)
+        self.assertEqual(exp['mass'].dtype, np.float64)
+        np.testing.assert_array_equal(est['mass'],
+                                      exp['mass'].astype(np.float32))
+
+    def test_body_mass_dtype_and_out(self):
+        data = np.vstack((self.data, np.zeros(800))).astype(np.float32)
+        obs = body_mass(data, self.t, window=50)
+        self.assertEqual(obs.dtype, np.float32)
+        exp = body_mass(data, self.t, window=50, dtype=np.float64)
+        self.assertEqual(exp.dtype, np.float64)
+        np.testing.assert_array_equal(obs, exp.astype(np.float32))
+        # In place, including the cage without any estimate.
+        self.assertIs(body_mass(data, self.t, out=data, window=50), data)
+        np.testing.assert_array_equal(data, obs)
+        self.assertRaises(ValueError, body_mass, data, self.t,
+                          out=np.empty(800))
+
+    def test_hourly_body_mass(self):
+        mass, starts = hourly_body_mass(self.data, self.t, bin_seconds=200,
+                                        window=50)
+        np.testing.assert_array_equal(starts, [0, 200, 400, 600])
+        np.testing.assert_allclose(mass, [25.2, 25.375, 25.7, 25.875],
+                                   atol=.15)
+        data = np.vstack((self.data, np.zeros(800)))
+        mass, _ = hourly_body_mass(data, self.t, bin_seconds=200, window=50)
+        self.assertEqual(mass.shape, (2, 4))
+        self.assertTrue(np.isnan(mass[1]).all())
+
+    def test_never_occupied(self):
+        # A sensor that is off (or a mouse never entering the habitat).
+        data = np.zeros((2, 800))
+        mask, run, position = occupied(data, self.t)
+        self.assertFalse(mask.any())
+        self.assertTrue((run == -1).all() and (position == -1).all())
+        self.assertTrue(np.isnan(body_mass(data[0], self.t)).all())
+        mass, _ = hourly_body_mass(data, self.t, bin_seconds=200)
+        self.assertTrue(np.isnan(mass).all())
+
+# run unit tests if run from command-line
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+from unittest import TestCase, main
+import os
+import shutil
+import tempfile
+import numpy as np
+from bcp.bouts import extract_bouts, channel_bouts
+from bcp.store import save_array
+
+
+class TestBouts(TestCase):
+    '''Test bout extraction.'''
+
+    def setUp(self):
+        self.x = np.array([5, 5, 5, 5, 5, 5.5, 4.9, 4, 4, 4, 4, 4, 3, 3, 3,
+                           3])
+        self.t = np.arange(16)
+
+    def test_extract_bouts(self):
+        obs = extract_bouts(self.x, self.t, .3, .01, 3, level_window=2)
+        np.testing.assert_array_equal(obs['cage'], [0, 0])
+        np.testing.assert_array_equal(obs['start'], [5, 12])
+        np.testing.assert_array_equal(obs['stop'], [8, 13])
+        np.testing.assert_array_equal(obs['start_time'], [5, 12])
+        np.testing.assert_array_equal(obs['stop_time'], [7, 12])
+        np.testing.assert_array_equal(obs['pre_level'], [5, 4])
+        np.testing.assert_array_equal(obs['post_level'], [4, 3])
+        np.testing.assert_array_equal(obs['uptake'], [1, 1])
+        np.testing.assert_array_equal(obs['gap'], [False, False])
+
+    def test_extract_bouts_level_window(self):
+        x = np.array([6, 6, 5, 5, 5, 9, 4, 4, 4, 2, 2, 2], dtype=float)
+        obs = extract_bouts(x, np.arange(12), 1, 0, 2, level_window=3)
+        # Stable levels are [6, 6] (too short), [5, 5, 5], [4, 4, 4] and
+        # [2, 2, 2]; the drop from 6 to 5 is not above u_diff.
+        np.testing.assert_array_equal(obs['start'], [5, 9])
+        np.testing.assert_array_equal(obs['pre_level'], [5, 4])
+        np.testing.assert_array_equal(obs['post_level'], [4, 2])
+
+    def test_small_differences(self):
+        # Differences between s_diff and u_diff do not start a bout.
+        x = np.array([1, 1, 1, 1.2, 1.4, 1.4, 1.4, 1.4])
+        self.assertEqual(extract_bouts(x, np.arange(8), .3, .1, 2).shape,
+                         (0,))
+        # Round off does not break stability.
+        x = np.array([.7, .9, 1.1, 1.3, 2, 2.2, 2.4, 2.6])
+        obs = extract_bouts(x, np.arange(8), .5, .2, 3)
+        np.testing.assert_array_equal(obs['start'], [4])
+        np.testing.assert_array_equal(obs['stop'], [5])
+
+    def test_positive_spikes(self):
+        # An isolated spike is not a bout and does not split the level.
+        x = np.array([5, 5, 5, 5, 5.6, 5, 5, 5, 4, 4, 4, 4])
+        obs = extract_bouts(x, np.arange(12), .3, .01, 3, level_window=8)
+        np.testing.assert_array_equal(obs['start'], [8])
+        np.testing.assert_array_equal(obs['pre_level'], [5])
+        np.testing.assert_array_equal(obs['uptake'], [1])
+        # Neither is a spike into a recording gap, nor a rise that does not
+        # come back to the level before it.
+        t = np.array([0, 1, 2, 3, 4, 9, 10, 11, 12, 13, 14, 15])
+        obs = extract_bouts(x, t, .3, .01, 2)
+        np.testing.assert_array_equal(obs['start'], [4, 8])
+        x[5:8] = 5.2
+        obs = extract_bouts(x, np.arange(12), .3, .01, 2)
+        np.testing.assert_array_equal(obs['start'], [4, 8])
+
+    def test_edges_and_gaps(self):
+        x = np.array([3, 1, 1, 1, 1, 2, 2, 2, 2, 0.])
+        t = np.array([0, 1, 2, 3, 4, 10, 11, 12, 13, 14])
+        obs = extract_bouts(x, t, .5, 0, 2)
+        np.testing.assert_array_equal(obs['start'], [1, 5, 9])
+        np.testing.assert_array_equal(obs['gap'], [False, True, False])
+        self.assertTrue(np.isnan(obs['pre_level'][0]))
+        self.assertTrue(np.isnan(obs['post_level'][2]))
+        np.testing.assert_array_equal(obs['uptake'][1], -1)
+
+    def test_multiple_cages(self):
+        rs = np.random.RandomState(0)
+        data = np.round(np.cumsum(rs.normal(0, .1, (4, 2000)), 1), 1)
+        t = np.arange(2000)
+        obs = extract_bouts(data, t, .15, .1, 4)
+        for c in range(4):
+            single = extract_bouts(data[c], t, .15, .1, 4)
+            batch = obs[obs['cage'] == c]
+            for name in ['start', 'stop', 'pre_level', 'post_level', 'gap']:
+                np.testing.assert_array_equal(batch[name], single[name])
+
+    def test_channel_bouts(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            save_array(os.path.join(tmp, 'time.npy'), self.t.astype(float))
+            save_array(os.path.join(tmp, 'Water_1.npy'),
+                       self.x.astype(np.float32))
+            save_array(os.path.join(tmp, 'Water_2.npy'),
+                       np.full(16, 3, dtype=np.float32))
+            obs, cages = channel_bouts(tmp, 'Water', u_diff=.3, s_diff=.01,
+                                       stability_duration=3)
+            self.assertEqual(cages, ['1', '2'])
+            np.testing.assert_array_equal(obs['cage'], [0, 0])
+            np.testing.assert_array_equal(obs['uptake'], [1, 1])
+        finally:
+            shutil.rmtree(tmp)
+
+# run unit tests if run from command-line
+if __name__ == '__main__':
+    main()
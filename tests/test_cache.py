@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+from unittest import TestCase, main
+import importlib.util
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from bcp.cache import (cached, caching, enabled, call_key, ResultCache,
+                       Uncacheable)
+from bcp.preprocess import smooth, unstable_sequences
+from bcp.feature_extraction import power_spectra, trace_to_signals_matrix
+
+_calls = []
+
+
+@cached
+def _count(data, n=1, label=None):
+    _calls.append(n)
+    return data * n, float(n)
+
+
+def _smooth_in(directory, seed):
+    data = np.random.RandomState(seed).rand(2000)
+    with caching(directory) as cache:
+        result = np.array(smooth(data, 5, .3, 3))
+    return result, cache.hits
+
+
+class TestCache(TestCase):
+    '''Test the on-disk result cache.'''
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.data = np.random.RandomState(0).rand(1000)
+        del _calls[:]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_disabled(self):
+        self.assertFalse(enabled())
+        _count(self.data)
+        _count(self.data)
+        self.assertEqual(_calls, [1, 1])
+        self.assertEqual(os.listdir(self.tmp), [])
+
+    def test_call_key(self):
+        key = call_key(smooth, (self.data, 5, .3, 3), {})
+        self.assertEqual(key, call_key(smooth, (self.data.copy(),),
+                                       {'radius': 5, 'a_thresh': .3,
+                                        'w_thresh': 3}))
+        self.assertNotEqual(key, call_key(smooth, (self.data, 6, .3, 3), {}))
+        self.assertNotEqual(key, call_key(smooth, (self.data[::-1], 5, .3,
+                                                   3), {}))
+        self.assertNotEqual(key, call_key(smooth, (self.data.astype(
+            np.float32), 5, .3, 3), {}))
+        self.assertNotEqual(key, call_key(unstable_sequences,
+                                          (self.data, 5, .3, 3), {}))
+        self.assertRaises(Uncacheable, call_key, _count,
+                          (self.data, 1, object()), {})
+        # Arrays without a buffer interface are hashed over their bytes.
+        seconds = np.arange(4).astype('m8[s]')
+        self.assertNotEqual(call_key(_count, (seconds,), {}),
+                            call_key(_count, (seconds.astype('m8[ms]'),), {}))
+
+    def test_source_digest(self):
+        # Editing a helper, not the cached function itself, changes the key.
+        fp = os.path.join(self.tmp, 'mod.py')
+        source = 'def helper(x):\n    return x + %s\n\n' \
+                 'def func(x):\n    return helper(x)\n'
+        keys = []
+        for offset in ['1', '10']:
+            with open(fp, 'w') as f:
+                f.write(source % offset)
+            spec = importlib.util.spec_from_file_location('mod', fp)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+            keys.append(call_key(mod.func, (self.data,), {}))
+        self.assertNotEqual(keys[0], keys[1])
+
+    def test_caching(self):
+        with caching(self.tmp) as cache:
+            self.assertTrue(enabled())
+            exp = _count(self.data, 2)
+            obs = _count(self.data, 2)
+            self.assertEqual(_calls, [2])
+            self.assertEqual(cache.hits, 1)
+            self.assertIsInstance(obs[0], np.memmap)
+            self.assertFalse(obs[0].flags.writeable)
+            np.testing.assert_array_equal(obs[0], exp[0])
+            self.assertEqual(obs[1], 2.)
+            _count(self.data, 3)
+            # Unhashable arguments run uncached.
+            _count(self.data, 2, object())
+            _count(self.data, 2, object())
+            self.assertEqual(_calls, [2, 3, 2, 2])
+            # Library functions, including ones writing into `out`.
+            spikes = unstable_sequences(self.data, .5, .1, 3)
+            np.testing.assert_array_equal(
+                unstable_sequences(self.data, .5, .1, 3), spikes)
+            psd, freqs = power_spectra(self.data.reshape(10, 100))
+            np.testing.assert_array_equal(
+                power_spectra(self.data.reshape(10, 100))[0], psd)
+            out = np.empty((10, 100))
+            self.assertIs(trace_to_signals_matrix(self.data, 100, out=out),
+                          out)
+            self.assertEqual(cache.hits, 3)
+        self.assertFalse(enabled())
+
+    def test_datetime(self):
+        data = np.arange(5).astype('M8[s]') - np.datetime64(0, 's')
+        with caching(self.tmp) as cache:
+            exp = _count(data, 3)
+            obs = _count(data, 3)
+            self.assertEqual(cache.hits, 1)
+        np.testing.assert_array_equal(obs[0], exp[0])
+        self.assertEqual(obs[0].dtype, np.dtype('m8[s]'))
+
+    def test_evict(self):
+        cache = ResultCache(self.tmp, max_bytes=13 * 10 ** 5)
+        for i in range(3):
+            cache.put('k%d' % i, np.zeros(50000))
+            os.utime(os.path.join(self.tmp, 'k%d' % i), (i, i))
+        # Using an entry makes it the most recent.
+        self.assertTrue(cache.get('k0')[0])
+        cache.put('k3', np.zeros(50000))
+        self.assertEqual(sorted(e[2] for e in cache.entries()),
+                         ['k0', 'k2', 'k3'])
+        self.assertEqual(cache.get('k1'), (False, None))
+        cache.clear()
+        self.assertEqual(cache.entries(), [])
+
+    def test_processes(self):
+        # Several processes filling and reading one cache.
+        with ProcessPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(_smooth_in, [self.tmp] * 8,
+                                    [0, 1] * 4))
+        for i, (result, hits) in enumerate(results):
+            exp = smooth(np.random.RandomState(i % 2).rand(2000), 5, .3, 3)
+            np.testing.assert_array_equal(result, exp)
+        self.assertEqual(len(ResultCache(self.tmp).entries()), 2)
+        self.assertEqual(len(os.listdir(self.tmp)), 2)
+
+
+# run unit tests if run from command-line
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+from unittest import TestCase, main
+import os
+import shutil
+import tempfile
+import numpy as np
+from bcp.chunked import (chunk_bounds, map_overlap, chunked_smooth,
+                         chunked_moving_function, chunked_stable_sequences,
+                         chunked_valued_sequences, chunked_unstable_sequences)
+from bcp.preprocess import (smooth, stable_sequences, valued_sequences,
+                            unstable_sequences)
+from bcp.stats import moving_function
+
+
+class TestChunked(TestCase):
+    '''Test that chunked execution matches whole array results.'''
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        rng = np.random.RandomState(0)
+        # Stretches of constant levels with noisy bouts of varying length,
+        # some much longer than a chunk.
+        lengths = rng.randint(1, 400, 60)
+        levels = np.repeat(rng.randint(0, 3, 60) * .5, lengths)
+        noisy = np.repeat(rng.rand(60) < .4, lengths)
+        self.data = levels + noisy * rng.rand(levels.shape[0])
+        fp = os.path.join(self.tmp, 'Water_1.npy')
+        np.save(fp, self.data)
+        self.memmap = np.load(fp, mmap_mode='r')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_chunk_bounds(self):
+        self.assertEqual(list(chunk_bounds(10, 4, 1)),
+                         [(0, 0, 4, 5), (3, 4, 8, 9), (7, 8, 10, 10)])
+
+    def test_map_overlap(self):
+        exp = smooth(self.data, 7, .2, 3)
+        for chunk_size in (50, 333, 10 ** 6):
+            obs = chunked_smooth(self.memmap, 7, .2, 3, chunk_size=chunk_size)
+            np.testing.assert_array_equal(obs, exp)
+        out = np.lib.format.open_memmap(os.path.join(self.tmp, 'out.npy'),
+                                        'w+', np.float64, self.data.shape)
+        obs = chunked_moving_function(self.memmap, 9, 'average',
+                                      chunk_size=1000, out=out, jobs=2)
+        self.assertIs(obs, out)
+        np.testing.assert_array_equal(out, moving_function(self.data, 9,
+                                                           'average'))
+        # Too small a halo changes the results at chunk boundaries.
+        obs = map_overlap(moving_function, self.data, 2, chunk_size=100,
+                          window=9)
+        self.assertFalse(np.array_equal(obs, moving_function(self.data, 9)))
+
+    def test_stable_sequences(self):
+        for stability_duration in (1, 5, 150):
+            exp = stable_sequences(self.data, .1, stability_duration)
+            for chunk_size in (64, 1000):
+                obs = chunked_stable_sequences(
+                    self.memmap, .1, stability_duration,
+                    chunk_size=chunk_size, halo=8)
+                np.testing.assert_array_equal(obs, exp)
+
+    def test_valued_sequences(self):
+        for stability_duration in (1, 300):
+            exp = valued_sequences(self.data, .5, stability_duration)
+            obs = chunked_valued_sequences(self.memmap, .5,
+                                           stability_duration, chunk_size=97,
+                                           halo=4)
+            np.testing.assert_array_equal(obs, exp)
+
+    def test_unstable_sequences(self):
+        exp = unstable_sequences(self.data, .3, .05, 10)
+        for chunk_size in (64, 1000):
+            obs = chunked_unstable_sequences(self.memmap, .3, .05, 10,
+                                             chunk_size=chunk_size, halo=8)
+            np.testing.assert_array_equal(obs, exp)
+        # Data ending in an unstable sequence.
+        data = self.data[:np.flatnonzero(np.diff(self.data) > .3)[-1] + 3]
+        np.testing.assert_array_equal(
+            chunked_unstable_sequences(data, .3, .05, 10, chunk_size=64),
+            unstable_sequences(data, .3, .05, 10))
+
+
+# run unit tests if run from command-line
+if __name__ == '__main__':
+    main()
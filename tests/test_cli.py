@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+from unittest import TestCase, main
+import datetime
+import os
+import shutil
+import tempfile
+from contextlib import redirect_stdout
+from io import StringIO
+import numpy as np
+from bcp.cli import main as bcp_main, parse_since, daily_summary, _cages
+from bcp.store import read_manifest, load_channel, channels, is_derived
+from bcp.rollup import load_rollups
+from bcp.synthetic import write_promethion_csv, DEFAULT_START
+
+
+def run(*argv):
+    out = StringIO()
+    with redirect_stdout(out):
+        status = bcp_main(list(argv))
+    return status, out.getvalue().split()
+
+
+class TestCLI(TestCase):
+    '''Test the bcp batch runner.'''
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.raw = os.path.join(self.tmp, 'raw')
+        self.exp = os.path.join(self.tmp, 'exp')
+        os.mkdir(self.raw)
+        write_promethion_csv(os.path.join(self.raw, 'a.csv'), 3000, [1, 2],
+                             seed=0, gaps=[])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_parse_since(self):
+        self.assertEqual(parse_since('2d', now=10 ** 6), 10 ** 6 - 172800)
+        self.assertEqual(parse_since('1.5h', now=10 ** 6), 10 ** 6 - 5400)
+        self.assertEqual(parse_since('2016-05-25T12:00'),
+                         parse_since('2016-05-25') + 43200)
+
+    def test_daily_summary(self):
+        times = np.array([0, 1, 86400, 86401, 3 * 86400])
+        data = np.array([5, 3, 1, np.nan, 2])
+        obs = daily_summary(data, times)
+        np.testing.assert_array_equal(obs['day'], [0, 1, 3])
+        np.testing.assert_array_equal(obs['n'], [2, 1, 1])
+        np.testing.assert_array_equal(obs['mean'], [4, 1, 2])
+        np.testing.assert_array_equal(obs['min'], [3, 1, 2])
+        np.testing.assert_array_equal(obs['change'][[0, 2]], [2, 0])
+        # An experiment without samples yet.
+        obs = daily_summary(np.empty(0), np.empty(0))
+        self.assertEqual(sorted(obs), ['change', 'day', 'max', 'mean', 'min',
+                                       'n', 'sum'])
+        for value in obs.values():
+            self.assertEqual(value.shape, (0,))
+
+    def test_pipeline(self):
+        self.assertEqual(run('ingest', self.exp), (1, []))
+        self.assertEqual(run('ingest', self.exp, '--raw', self.raw),
+                         (0, ['a.csv']))
+        # Nothing new.
+        self.assertEqual(run('ingest', self.exp), (0, []))
+        start = DEFAULT_START + datetime.timedelta(seconds=2500)
+        write_promethion_csv(os.path.join(self.raw, 'b.csv'), 1000, [1, 2],
+                             start, seed=1, gaps=[])
+        self.assertEqual(run('ingest', self.exp), (0, ['b.csv']))
+        times = np.load(os.path.join(self.exp, 'time.npy'))
+        # The overlapping rows of b.csv are dropped.
+        np.testing.assert_array_equal(times, np.arange(3500))
+        self.assertEqual(read_manifest(self.exp)['n'], 3500)
+        water = np.load(os.path.join(self.exp, 'Water_2.npy'))
+        self.assertEqual(water.shape, (3500,))
+        # Discrete fields are stored compactly and decoded on read.
+        self.assertEqual(np.load(os.path.join(self.exp,
+                                              'WheelCount_2.npy')).dtype,
+                         np.uint8)
+        self.assertEqual(water.dtype, np.float32)
+        self.assertEqual(load_channel(self.exp, 'XPos', 2)[:].shape, (3500,))
+        # Rollups are kept up to date across ingests.
+        rollups = load_rollups(os.path.join(self.exp, 'Water_2.npy'))
+        np.testing.assert_allclose(rollups[600]['sum'],
+                                   np.add.reduceat(water, [0, 600, 1200, 1800,
+                                                           2400, 3000]))
+
+        status, written = run('preprocess', self.exp, '--jobs', '2')
+        self.assertEqual(len(written), 6)
+        self.assertEqual(run('preprocess', self.exp), (0, []))
+        self.assertEqual(len(run('preprocess', self.exp, '--force')[1]), 6)
+
+        status, written = run('classify', self.exp, '-k', '3',
+                              '--signal-length', '50')
+        self.assertEqual(len(written), 8)
+        labels = np.load(os.path.join(self.exp, 'WaterClass_1.npy'))
+        self.assertEqual(labels.shape, (70,))
+
+        summary = os.path.join(self.exp, 'summary.tsv')
+        self.assertEqual(run('summarize', self.exp), (0, [summary]))
+        self.assertEqual(run('summarize', self.exp), (0, []))
+        with open(summary) as f:
+            lines = f.readlines()
+        self.assertEqual(lines[0].split(), ['cage', 'field', 'day', 'n',
+                                            'mean', 'min', 'max', 'sum',
+                                            'change'])
+        self.assertTrue(any(l.startswith('2\tWater\t0\t3500\t')
+                            for l in lines))
+        # Outputs of preprocess and classify are neither summarized nor
+        # taken for cages.
+        fields = set(l.split('\t')[1] for l in lines[1:])
+        self.assertEqual(fields, set(channels(self.exp)))
+        self.assertFalse(any(is_derived(f) for f in fields))
+        self.assertIn('WaterClass', channels(self.exp, derived=True))
+        self.assertEqual(_cages(self.exp), ['1', '2'])
+
+        output = os.path.join(self.tmp, 'archive')
+        self.assertEqual(run('archive', self.exp, '--output', output),
+                         (0, [os.path.join(output, 'exp')]))
+        self.assertEqual(run('archive', self.exp, '--output', output),
+                         (0, []))
+        self.assertTrue(os.path.exists(os.path.join(output, 'exp',
+                                                    'Water_2.bca')))
+        self.assertFalse(os.path.exists(os.path.join(output, 'exp',
+                                                     'WaterClean_2.bca')))
+
+# run unit tests if run from command-line
+if __name__ == '__main__':
+    main()
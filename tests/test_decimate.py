@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+from unittest import TestCase, main
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from bcp.decimate import (build_pyramid, select_level, decimated_trace,
+                          pyramid_path, load_pyramid, read_pyramid)
+
+
+class TestDecimate(TestCase):
+    '''Test decimation pyramids.'''
+
+    def setUp(self):
+        rs = np.random.RandomState(0)
+        self.data = rs.normal(size=1000).astype(np.float32)
+        self.data[500:520] = np.nan
+        self.times = np.arange(1000.)
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_build_pyramid(self):
+        pyramid = build_pyramid(self.data, factor=4)
+        self.assertEqual(pyramid['n'], 1000)
+        self.assertEqual([len(m) for m in pyramid['mins']],
+                         [250, 63, 16, 4, 1])
+        for k, (lo, hi) in enumerate(zip(pyramid['mins'], pyramid['maxs'])):
+            bucket = 4 ** (k + 1)
+            for b in range(len(lo)):
+                chunk = self.data[b * bucket:(b + 1) * bucket]
+                if np.isnan(chunk).all():
+                    self.assertTrue(np.isnan(lo[b]) and np.isnan(hi[b]))
+                else:
+                    self.assertEqual(lo[b], np.nanmin(chunk))
+                    self.assertEqual(hi[b], np.nanmax(chunk))
+            self.assertEqual(lo.dtype, np.float32)
+        self.assertRaises(ValueError, build_pyramid, self.data, 1)
+
+    def test_build_pyramid_integer(self):
+        # Padding the last bucket must not leak into integer extremes.
+        for dtype in (np.uint8, np.int64):
+            data = np.arange(10, 20).astype(dtype)
+            pyramid = build_pyramid(data, factor=4)
+            self.assertEqual(pyramid['mins'][0].tolist(), [10, 14, 18])
+            self.assertEqual(pyramid['maxs'][0].tolist(), [13, 17, 19])
+            self.assertEqual(pyramid['mins'][0].dtype, dtype)
+            self.assertEqual(pyramid['mins'][1].tolist(), [10])
+            self.assertEqual(pyramid['maxs'][1].tolist(), [19])
+
+    def test_select_level(self):
+        pyramid = build_pyramid(self.data, factor=4)
+        self.assertEqual(select_level(pyramid, 0, 200, 100), 0)
+        self.assertEqual(select_level(pyramid, 0, 1000, 250), 1)
+        self.assertEqual(select_level(pyramid, 0, 1000, 100), 2)
+        self.assertEqual(select_level(pyramid, 0, 1000, 1), 5)
+
+    def test_decimated_trace(self):
+        pyramid = build_pyramid(self.data, factor=4)
+        x, y = decimated_trace(pyramid, self.data, self.times, 100, 150, 50)
+        np.testing.assert_array_equal(x, self.times[99:151])
+        np.testing.assert_array_equal(y, self.data[99:151])
+
+        x, y = decimated_trace(pyramid, self.data, self.times, 0, 999, 100)
+        # Level 2: buckets of 16 samples, two points per bucket.
+        self.assertEqual(x.shape, (2 * 63,))
+        np.testing.assert_array_equal(x[:4], [0, 0, 16, 16])
+        self.assertEqual(np.nanmin(y), np.nanmin(self.data))
+        self.assertEqual(np.nanmax(y), np.nanmax(self.data))
+
+    def test_load_pyramid(self):
+        fp = os.path.join(self.tmp, 'Water_2.npy')
+        np.save(fp, self.data)
+        pyramid = load_pyramid(fp)
+        self.assertTrue(os.path.exists(pyramid_path(fp)))
+        self.assertEqual(pyramid_path(fp),
+                         os.path.join(self.tmp, 'Water_2.pyramid.npz'))
+        cached = read_pyramid(pyramid_path(fp))
+        for a, b in zip(pyramid['mins'], cached['mins']):
+            np.testing.assert_array_equal(a, b)
+
+        # Rebuilt once the channel changes.
+        np.save(fp, self.data[:100])
+        future = time.time() + 10
+        os.utime(fp, (future, future))
+        self.assertEqual(load_pyramid(fp)['n'], 100)
+        # Rebuilt for a different factor.
+        self.assertEqual(load_pyramid(fp, factor=2)['factor'], 2)
+
+# run unit tests if run from command-line
+if __name__ == '__main__':
+    main()
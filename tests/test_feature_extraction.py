@@ -1,8 +1,15 @@
 #!/usr/bin/env python
 
 from unittest import TestCase, main
+import os
+import tempfile
 import numpy as np
-from bcp.feature_extraction import (trace_to_signals_matrix)
+from scipy.signal import welch
+from bcp.feature_extraction import (trace_to_signals_matrix, signal_windows,
+                                    power_spectra, band_powers,
+                                    dominant_frequencies, spectral_features,
+                                    squared_distances, assign_clusters,
+                                    kmeans_plusplus, minibatch_kmeans)
 
 
 class TestFeatureExtraction(TestCase):
@@ -39,6 +46,147 @@ class TestFeatureExtraction(TestCase):
         exp = exp / (exp.std(0) + regularization_value)
         np.testing.assert_array_equal(obs, exp)
 
+    def test_trace_to_signals_matrix_hop(self):
+        data = np.random.uniform(size=1000)
+        signal_length = 10
+        hop = 3
+        obs = trace_to_signals_matrix(data, signal_length, 1e-4, hop=hop)
+        exp = np.array([data[i:i + 10] for i in range(0, 991, 3)])
+        exp = exp - exp.mean(1).reshape(-1, 1)
+        exp = exp / (exp.std(0) + 1e-4)
+        self.assertEqual(obs.shape, (331, 10))
+        np.testing.assert_array_almost_equal(obs, exp)
+
+        # Chunked computation writing into a float32 buffer.
+        out = np.empty((331, 10), dtype=np.float32)
+        obs = trace_to_signals_matrix(data, signal_length, 1e-4, hop=hop,
+                                      out=out, chunk_size=50)
+        self.assertTrue(obs is out)
+        np.testing.assert_allclose(obs, exp, rtol=1e-4, atol=1e-5)
+
+        self.assertRaises(ValueError, trace_to_signals_matrix, data, 10,
+                          out=np.empty((5, 10)))
+        self.assertRaises(ValueError, trace_to_signals_matrix, data, 10,
+                          chunk_size=0)
+
+    def test_trace_to_signals_matrix_dtype(self):
+        data = np.random.uniform(size=1000).astype(np.float32)
+        obs = trace_to_signals_matrix(data, 10)
+        self.assertEqual(obs.dtype, np.float32)
+        exp = trace_to_signals_matrix(data, 10, dtype=np.float64)
+        self.assertEqual(exp.dtype, np.float64)
+        np.testing.assert_allclose(obs, exp, rtol=1e-4, atol=1e-5)
+        obs = trace_to_signals_matrix(np.arange(100), 10)
+        self.assertEqual(obs.dtype, np.float64)
+
+    def test_trace_to_signals_matrix_short(self):
+        # Traces shorter than one signal give no rows.
+        for chunk_size in (None, 4):
+            obs = trace_to_signals_matrix(np.arange(5.), 10,
+                                          chunk_size=chunk_size)
+            self.assertEqual(obs.shape, (0, 10))
+
+    def test_signal_windows(self):
+        data = np.arange(10)
+        obs = signal_windows(data, 4, 2)
+        np.testing.assert_array_equal(obs, [[0, 1, 2, 3], [2, 3, 4, 5],
+                                            [4, 5, 6, 7], [6, 7, 8, 9]])
+        self.assertTrue(np.shares_memory(obs, data))
+        np.testing.assert_array_equal(signal_windows(data, 4),
+                                      [[0, 1, 2, 3], [4, 5, 6, 7]])
+        self.assertEqual(signal_windows(data, 11).shape, (0, 11))
+        self.assertRaises(ValueError, signal_windows, data, 4, 0)
+
+    def test_power_spectra(self):
+        rs = np.random.RandomState(0)
+        signals = rs.normal(size=(2, 3, 256))
+        obs, freqs = power_spectra(signals, .5, dtype=np.float64)
+        exp_freqs, exp = welch(signals, fs=2, window='hann', nperseg=256)
+        np.testing.assert_array_almost_equal(freqs, exp_freqs)
+        np.testing.assert_array_almost_equal(obs, exp)
+
+        # Welch averaging over overlapping segments.
+        obs, freqs = power_spectra(signals, segment_length=64, hop=16,
+                                   dtype=np.float64)
+        exp_freqs, exp = welch(signals, fs=1, window='hann', nperseg=64,
+                               noverlap=48)
+        np.testing.assert_array_almost_equal(obs, exp)
+
+        obs, _ = power_spectra(signals.astype(np.float32))
+        self.assertEqual(obs.dtype, np.float32)
+        self.assertRaises(ValueError, power_spectra, signals, window='bad')
+
+    def test_band_powers(self):
+        freqs = np.array([0, .1, .2, .3, .4, .5])
+        psd = np.array([[1, 2, 3, 4, 5, 6.], [0, 0, 0, 0, 10, 0]])
+        obs = band_powers(psd, freqs, [[0, .2], [.2, .45], [0, 1]])
+        exp = np.array([[.3, 1.2, 2.1], [0, 1., 1.]])
+        np.testing.assert_array_almost_equal(obs, exp)
+        np.testing.assert_array_almost_equal(
+            dominant_frequencies(psd, freqs), [.5, .4])
+
+    def test_spectral_features(self):
+        t = np.arange(4 * 128)
+        signals = np.vstack((np.sin(2 * np.pi * t / 8.),
+                             np.sin(2 * np.pi * t / 32.))).reshape(2, 4, 128)
+        obs = spectral_features(signals, [[0, .1], [.1, .5]])
+        self.assertEqual(obs.shape, (2, 4, 4))
+        self.assertEqual(obs.dtype, np.float32)
+        np.testing.assert_array_almost_equal(obs[0, :, 2], 1 / 8.)
+        np.testing.assert_array_almost_equal(obs[1, :, 2], 1 / 32.)
+        self.assertTrue((obs[0, :, 1] > obs[0, :, 0]).all())
+        self.assertTrue((obs[1, :, 0] > obs[1, :, 1]).all())
+        np.testing.assert_allclose(obs[..., :2].sum(-1), obs[..., 3],
+                                   rtol=1e-5)
+
+    def test_squared_distances(self):
+        rs = np.random.RandomState(0)
+        X = rs.normal(size=(50, 7))
+        C = rs.normal(size=(4, 7))
+        exp = ((X[:, np.newaxis, :] - C[np.newaxis, :, :])**2).sum(2)
+        np.testing.assert_array_almost_equal(squared_distances(X, C), exp)
+        labels, dists = assign_clusters(X, C, chunk_size=7)
+        np.testing.assert_array_equal(labels, exp.argmin(1))
+        np.testing.assert_array_almost_equal(dists, exp.min(1))
+
+    def test_kmeans_plusplus(self):
+        rs = np.random.RandomState(0)
+        X = np.vstack([rs.normal(c, .1, size=(100, 2))
+                       for c in [(0, 0), (10, 0), (0, 10)]])
+        centroids = kmeans_plusplus(X, 3, seed=1)
+        # Rows of X, one from each blob.
+        self.assertTrue(all((X == c).all(1).any() for c in centroids))
+        blobs = np.abs(centroids[:, np.newaxis] -
+                       np.array([[0, 0], [10, 0], [0, 10]])).sum(2).argmin(1)
+        np.testing.assert_array_equal(np.sort(blobs), [0, 1, 2])
+        self.assertRaises(ValueError, kmeans_plusplus, X[:2], 3)
+
+    def test_minibatch_kmeans(self):
+        rs = np.random.RandomState(0)
+        centers = np.array([[0, 0, 0], [5, 5, 0], [0, 5, 5], [5, 0, 5.]])
+        X = np.vstack([rs.normal(c, .2, size=(500, 3)) for c in centers])
+        X = X[rs.permutation(X.shape[0])].astype(np.float32)
+        tmp = tempfile.mkdtemp()
+        fp = os.path.join(tmp, 'windows.npy')
+        np.save(fp, X)
+        mm = np.load(fp, mmap_mode='r')
+        centroids, labels, inertia = minibatch_kmeans(mm, 4, batch_size=100,
+                                                      n_iter=50, seed=0,
+                                                      chunk_size=300)
+        self.assertEqual(centroids.dtype, np.float32)
+        match = np.abs(centers[:, np.newaxis] - centroids).sum(2).argmin(1)
+        np.testing.assert_array_equal(np.sort(match), np.arange(4))
+        np.testing.assert_allclose(centroids[match], centers, atol=.1)
+        # Each true blob is a single cluster.
+        truth = np.abs(X[:, np.newaxis] - centers).sum(2).argmin(1)
+        for t in range(4):
+            self.assertEqual(len(np.unique(labels[truth == t])), 1)
+        np.testing.assert_allclose(
+            inertia, ((X - centroids[labels])**2).sum(), rtol=1e-3)
+        del mm
+        os.remove(fp)
+        os.rmdir(tmp)
+
 # run unit tests if run from command-line
 if __name__ == '__main__':
     main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+from unittest import TestCase, main
+import itertools
+import numpy as np
+from bcp.hmm import (forward, posterior_probabilities, baum_welch, viterbi,
+                     random_parameters)
+
+
+class TestHMM(TestCase):
+    '''Test hidden Markov model functions.'''
+
+    def setUp(self):
+        self.startprob, self.transmat, self.emissionprob = \
+            random_parameters(3, 4, seed=1)
+        rs = np.random.RandomState(0)
+        self.obs = rs.randint(0, 4, size=(2, 7))
+        self.obs[0, 3] = -1
+
+    def _paths(self, obs):
+        '''Return every state path and its joint log probability.'''
+        paths = np.array(list(itertools.product(range(3), repeat=len(obs))))
+        p = self.startprob[paths[:, 0]]
+        for t in range(len(obs)):
+            if t > 0:
+                p = p * self.transmat[paths[:, t - 1], paths[:, t]]
+            if obs[t] >= 0:
+                p = p * self.emissionprob[paths[:, t], obs[t]]
+        return paths, p
+
+    def test_forward(self):
+        exp = [np.log(self._paths(o)[1].sum()) for o in self.obs]
+        for chunk_size in [None, 1, 3]:
+            obs = forward(self.obs, self.startprob, self.transmat,
+                          self.emissionprob, chunk_size)
+            np.testing.assert_array_almost_equal(obs, exp)
+        obs = forward(self.obs[1], self.startprob, self.transmat,
+                      self.emissionprob)
+        self.assertAlmostEqual(obs, exp[1])
+
+    def test_posterior_probabilities(self):
+        for chunk_size in [None, 2, 5]:
+            obs = posterior_probabilities(self.obs, self.startprob,
+                                          self.transmat, self.emissionprob,
+                                          chunk_size)
+            self.assertEqual(obs.shape, (2, 7, 3))
+            for s in range(2):
+                paths, p = self._paths(self.obs[s])
+                exp = np.array([np.bincount(paths[:, t], weights=p,
+                                            minlength=3) for t in range(7)])
+                np.testing.assert_array_almost_equal(obs[s],
+                                                     exp / p.sum())
+        out = np.empty((7, 3))
+        obs = posterior_probabilities(self.obs[0], self.startprob,
+                                      self.transmat, self.emissionprob,
+                                      out=out)
+        self.assertTrue(obs is out)
+        np.testing.assert_array_almost_equal(out.sum(1), np.ones(7))
+
+    def test_viterbi(self):
+        states, log_prob = viterbi(self.obs, self.startprob, self.transmat,
+                                   self.emissionprob, chunk_size=3)
+        for s in range(2):
+            paths, p = self._paths(self.obs[s])
+            np.testing.assert_array_equal(states[s], paths[p.argmax()])
+            self.assertAlmostEqual(log_prob[s], np.log(p.max()))
+        states, log_prob = viterbi(self.obs[1], self.startprob, self.transmat,
+                                   self.emissionprob)
+        self.assertEqual(states.shape, (7,))
+
+    def test_chunk_size(self):
+        rs = np.random.RandomState(1)
+        obs = rs.randint(-1, 4, size=(3, 2000))
+        args = self.startprob, self.transmat, self.emissionprob
+        exp_ll = forward(obs, *args, chunk_size=None)
+        exp_post = posterior_probabilities(obs, *args, chunk_size=None)
+        exp_states, exp_lp = viterbi(obs, *args, chunk_size=None)
+        for chunk_size in [1, 7, 500, 1999]:
+            np.testing.assert_allclose(forward(obs, *args, chunk_size),
+                                       exp_ll)
+            np.testing.assert_allclose(
+                posterior_probabilities(obs, *args, chunk_size), exp_post,
+                atol=1e-10)
+            states, log_prob = viterbi(obs, *args, chunk_size)
+            np.testing.assert_array_equal(states, exp_states)
+            np.testing.assert_allclose(log_prob, exp_lp)
+        self.assertRaises(ValueError, forward, obs, *args, chunk_size=0)
+        self.assertRaises(ValueError, viterbi, obs, *args, chunk_size=0)
+
+    def test_empty(self):
+        args = self.startprob, self.transmat, self.emissionprob
+        obs = np.zeros((2, 0), dtype=int)
+        np.testing.assert_array_equal(forward(obs, *args), [0, 0])
+        self.assertEqual(posterior_probabilities(obs, *args).shape,
+                         (2, 0, 3))
+        states, log_prob = viterbi(obs, *args)
+        self.assertEqual(states.shape, (2, 0))
+        np.testing.assert_array_equal(log_prob, [0, 0])
+        states, log_prob = viterbi(obs[0], *args)
+        self.assertEqual(states.shape, (0,))
+
+    def test_baum_welch(self):
+        rs = np.random.RandomState(0)
+        transmat = np.array([[.98, .02], [.03, .97]])
+        emissionprob = np.array([[.7, .2, .1], [.1, .2, .7]])
+        T = 3000
+        states = np.zeros((2, T), dtype=int)
+        obs = np.zeros((2, T), dtype=int)
+        for t in range(T):
+            if t > 0:
+                u = rs.uniform(size=2)
+                states[:, t] = (u < transmat[states[:, t - 1], 1]).astype(int)
+            u = rs.uniform(size=2)
+            cdf = emissionprob[states[:, t]].cumsum(1)
+            obs[:, t] = (u[:, np.newaxis] > cdf).sum(1)
+
+        sp, tm, ep, ll = baum_welch(obs, 2, n_iter=100, tol=1e-6, seed=0,
+                                    chunk_size=500)
+        self.assertTrue((np.diff(ll) > -1e-6).all())
+        order = np.argsort(ep[:, 0])[::-1]
+        np.testing.assert_allclose(tm[order][:, order], transmat, atol=.02)
+        np.testing.assert_allclose(ep[order], emissionprob, atol=.05)
+        decoded, _ = viterbi(obs, sp, tm, ep)
+        self.assertTrue((np.argsort(order)[decoded] == states).mean() > .9)
+
+# run unit tests if run from command-line
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+from unittest import TestCase, main
+import json
+import subprocess
+import sys
+
+# Seconds `import bcp.parse, bcp.preprocess` may take once numpy is loaded.
+IMPORT_BUDGET = .25
+
+_SCRIPT = '''
+import json, sys, time
+import numpy
+t0 = time.perf_counter()
+import %s
+elapsed = time.perf_counter() - t0
+heavy = sorted(m for m in sys.modules
+               if m.split('.')[0] in ('matplotlib', 'scipy', 'pandas'))
+print(json.dumps([elapsed, heavy]))
+'''
+
+
+def import_in_subprocess(modules):
+    '''Return (seconds, heavy modules loaded) for importing `modules`.'''
+    out = subprocess.check_output([sys.executable, '-c',
+                                   _SCRIPT % ', '.join(modules)])
+    return json.loads(out)
+
+
+class TestImports(TestCase):
+    '''Test that importing bcp stays fast.'''
+
+    def test_import_budget(self):
+        # Best of a few runs to ignore a cold disk cache.
+        elapsed = min(import_in_subprocess(['bcp.parse', 'bcp.preprocess'])[0]
+                      for _ in range(3))
+        self.assertTrue(elapsed < IMPORT_BUDGET,
+                        'importing bcp.parse and bcp.preprocess took %.3fs'
+                        % elapsed)
+
+    def test_no_heavy_dependencies(self):
+        for module in ['bcp.parse', 'bcp.preprocess', 'bcp.stats',
+                       'bcp.ethoscan', 'bcp.util', 'bcp.feature_extraction',
+                       'bcp.cli', 'bcp.plot']:
+            self.assertEqual(import_in_subprocess([module])[1], [], module)
+
+# run unit tests if run from command-line
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+from unittest import TestCase, main
+import numpy as np
+from bcp.intervals import IntervalIndex, ethoscan_intervals
+
+
+class TestIntervalIndex(TestCase):
+    '''Test interval index queries.'''
+
+    def setUp(self):
+        # Unsorted, with one interval nested inside another and one empty.
+        self.starts = np.array([10, 0, 30, 12, 50, 60.])
+        self.ends = np.array([20, 5, 45, 15, 50, 70.])
+        self.index = IntervalIndex(self.starts, self.ends)
+
+    def _brute_overlap(self, qs, qe):
+        if qs == qe:
+            return ((self.starts <= qs) & (self.ends > qs)).nonzero()[0]
+        return ((self.starts < qe) & (self.ends > qs)).nonzero()[0]
+
+    def test_overlap(self):
+        np.testing.assert_array_equal(self.index.overlap(4, 11), [0, 1])
+        np.testing.assert_array_equal(self.index.overlap(13, 14), [0, 3])
+        np.testing.assert_array_equal(self.index.overlap(20, 30), [])
+        np.testing.assert_array_equal(self.index.overlap(-5, 100),
+                                      [0, 1, 2, 3, 4, 5])
+        rs = np.random.RandomState(0)
+        for qs, qe in np.sort(rs.uniform(-5, 80, size=(200, 2)), axis=1):
+            np.testing.assert_array_equal(self.index.overlap(qs, qe),
+                                          self._brute_overlap(qs, qe))
+
+    def test_stab(self):
+        np.testing.assert_array_equal(self.index.stab(10), [0])
+        np.testing.assert_array_equal(self.index.stab(12), [0, 3])
+        np.testing.assert_array_equal(self.index.stab(20), [])
+        np.testing.assert_array_equal(self.index.stab(50), [])
+        np.testing.assert_array_equal(self.index.overlap(12, 12), [0, 3])
+
+    def test_within(self):
+        np.testing.assert_array_equal(self.index.within(46, 47, 2), [2])
+        np.testing.assert_array_equal(self.index.within(46, 47, 30), [0, 2, 4, 5])
+
+    def test_overlap_batch(self):
+        rs = np.random.RandomState(1)
+        q = np.sort(rs.uniform(-5, 80, size=(300, 2)), axis=1)
+        q[:20, 1] = q[:20, 0]
+        q_idx, i_idx = self.index.overlap_batch(q[:, 0], q[:, 1])
+        for i, (qs, qe) in enumerate(q):
+            np.testing.assert_array_equal(np.sort(i_idx[q_idx == i]),
+                                          self._brute_overlap(qs, qe))
+        np.testing.assert_array_equal(
+            self.index.count_overlaps(q[:, 0], q[:, 1]),
+            np.bincount(q_idx, minlength=300))
+
+    def test_stab_batch(self):
+        q_idx, i_idx = self.index.stab_batch([12, 20, 1])
+        np.testing.assert_array_equal(q_idx, [0, 0, 2])
+        np.testing.assert_array_equal(i_idx, [0, 3, 1])
+
+    def test_coverage(self):
+        obs = self.index.coverage([0, 40, 100], [11, 65, 200])
+        np.testing.assert_array_equal(obs, [6, 10, 0])
+
+    def test_nearest(self):
+        idx, dist = self.index.nearest([-3, 7, 17, 25, 48, 100])
+        np.testing.assert_array_equal(idx, [1, 1, 0, 0, 4, 5])
+        np.testing.assert_array_equal(dist, [3, 2, 0, 5, 2, 30])
+        # The empty interval [50, 50) is a valid neighbour.
+        idx, dist = self.index.nearest(51)
+        np.testing.assert_array_equal(idx, [4])
+        np.testing.assert_array_equal(dist, [1])
+
+    def test_errors(self):
+        self.assertRaises(ValueError, IntervalIndex, [1, 2], [0, 3])
+        self.assertRaises(ValueError, IntervalIndex, [1, 2], [3])
+        self.assertRaises(ValueError, IntervalIndex([], []).nearest, 1)
+
+    def test_ethoscan_intervals(self):
+        data = np.array([[1, 7, 15474, 126],
+                         [15475, 5, 13562, 13.315],
+                         [29037, 7, 357, 210]])
+        starts, ends, activity = ethoscan_intervals(data)
+        np.testing.assert_array_equal(starts, [1, 15475, 29037])
+        np.testing.assert_array_equal(ends, [15475, 29037, 29394])
+        np.testing.assert_array_equal(activity, [7, 5, 7])
+        starts, ends, activity = ethoscan_intervals(data, activity=5)
+        np.testing.assert_array_equal(starts, [15475])
+
+# run unit tests if run from command-line
+if __name__ == '__main__':
+    main()
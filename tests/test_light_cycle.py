@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+from unittest import TestCase, main
+import datetime
+import numpy as np
+from bcp.light_cycle import (make_schedule, light_intervals, dark_intervals,
+                             is_light, intervals_to_indices, interval_labels,
+                             complement_intervals)
+
+
+class TestLightCycle(TestCase):
+    '''Test light cycle calculations.'''
+
+    def setUp(self):
+        pass
+
+    def test_make_schedule(self):
+        np.testing.assert_array_equal(make_schedule((7, 12)), [[0, 7, 12]])
+        np.testing.assert_array_equal(make_schedule([[100, 9, 10],
+                                                     [0, 7, 12]]),
+                                      [[0, 7, 12], [100, 9, 10]])
+        self.assertRaises(ValueError, make_schedule, [1, 2, 3, 4])
+        self.assertRaises(ValueError, make_schedule, (7, 25))
+
+    def test_dark_intervals(self):
+        # Same cases as `bcp.util.nights`.
+        start = datetime.datetime(2016, 10, 6, 3, 45, 12)
+        exp = np.array([[0, 11688],
+                        [11688+12*3600, 11688+24*3600],
+                        [141288, 150000]])
+        obs = dark_intervals((7, 12), start, 150000)
+        np.testing.assert_array_equal(obs, exp)
+
+        start = datetime.datetime(2016, 10, 6, 7, 45, 12)
+        exp = np.array([[40488,  83688],
+                        [126888, 170088],
+                        [213288, 256488],
+                        [299688, 342888],
+                        [386088, 429288]])
+        obs = dark_intervals((7, 12), start, 451525)
+        np.testing.assert_array_equal(obs, exp)
+
+    def test_month_end_and_midnight(self):
+        # Start late on the last day of the month; light 20:00 - 08:00 spans
+        # midnight.
+        start = datetime.datetime(2016, 1, 31, 23, 0, 0)
+        obs = light_intervals((20, 12), start, 3 * 86400)
+        exp = np.array([[0, 9 * 3600],
+                        [21 * 3600, 33 * 3600],
+                        [45 * 3600, 57 * 3600],
+                        [69 * 3600, 72 * 3600]])
+        np.testing.assert_array_equal(obs, exp)
+        dark = dark_intervals((20, 12), start, 3 * 86400)
+        np.testing.assert_array_equal(dark, [[9 * 3600, 21 * 3600],
+                                             [33 * 3600, 45 * 3600],
+                                             [57 * 3600, 69 * 3600]])
+
+    def test_schedule_change(self):
+        start = datetime.datetime(2016, 10, 6, 0, 0, 0)
+        # Lights 7-19 for a day, then 9-19 from midnight.
+        schedule = [[0, 7, 12], [86400, 9, 10]]
+        obs = light_intervals(schedule, start, 2 * 86400)
+        exp = np.array([[7 * 3600, 19 * 3600],
+                        [33 * 3600, 43 * 3600]])
+        np.testing.assert_array_equal(obs, exp)
+        # Changing while lights are on continues the same light period.
+        schedule = [[0, 7, 12], [10 * 3600, 7, 14]]
+        obs = light_intervals(schedule, start, 86400)
+        np.testing.assert_array_equal(obs, [[7 * 3600, 21 * 3600]])
+        # The first row applies before it takes effect, as in `is_light`.
+        schedule = [[3600, 7, 12], [86400, 9, 10]]
+        np.testing.assert_array_equal(light_intervals(schedule, start, 86400),
+                                      [[7 * 3600, 19 * 3600]])
+        schedule = [[7.5 * 3600, 0, 8]]
+        obs = light_intervals(schedule, start, 86400)
+        np.testing.assert_array_equal(obs, [[0, 8 * 3600]])
+        times = np.arange(0, 86400, 600.)
+        np.testing.assert_array_equal(
+            interval_labels(obs, times) >= 0, is_light(times, schedule, start))
+
+    def test_is_light(self):
+        start = datetime.datetime(2016, 10, 6, 3, 45, 12)
+        times = np.arange(0, 5 * 86400, 37.)
+        schedule = [[0, 7, 12], [2 * 86400, 20, 12]]
+        light = light_intervals(schedule, start, times[-1] + 1)
+        exp = interval_labels(light, times) >= 0
+        np.testing.assert_array_equal(is_light(times, schedule, start), exp)
+
+    def test_intervals_to_indices(self):
+        times = np.hstack((np.arange(100), np.arange(200, 300)))
+        intervals = np.array([[10, 20], [50, 250]])
+        np.testing.assert_array_equal(intervals_to_indices(intervals, times),
+                                      [[10, 20], [50, 150]])
+
+    def test_interval_labels(self):
+        intervals = np.array([[2, 4], [6, 7]])
+        obs = interval_labels(intervals, np.arange(9))
+        np.testing.assert_array_equal(obs, [-1, -1, 0, 0, -1, -1, 1, -1, -1])
+
+    def test_complement_intervals(self):
+        obs = complement_intervals(np.array([[0, 4], [6, 7]]), 10)
+        np.testing.assert_array_equal(obs, [[4, 6], [7, 10]])
+
+# run unit tests if run from command-line
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+from unittest import TestCase, main
+import numpy as np
+from bcp.occupancy import (grid_indices, interval_labels_by_period,
+                           occupancy_maps, occupancy_fraction)
+
+
+class TestOccupancy(TestCase):
+    '''Test occupancy grid functions.'''
+
+    def setUp(self):
+        self.bounds = (0, 40, 0, 20)
+
+    def test_grid_indices(self):
+        x = np.array([0, 9.99, 10, 39.75, 40, np.nan, 41, 20])
+        y = np.array([0, 0, 5, 19.9, 20, 5, 5, -1])
+        obs = grid_indices(x, y, 4, self.bounds)
+        np.testing.assert_array_equal(obs, [0, 0, 5, 15, 15, -1, -1, -1])
+        # Every cell is distinct.
+        xs, ys = np.meshgrid(np.arange(4) * 10 + 5, np.arange(4) * 5 + 2)
+        obs = grid_indices(xs.ravel(), ys.ravel(), 4, self.bounds)
+        np.testing.assert_array_equal(np.sort(obs), np.arange(16))
+
+    def test_interval_labels_by_period(self):
+        obs = interval_labels_by_period([0, 3599, 3600, 7300], 3600)
+        np.testing.assert_array_equal(obs, [0, 0, 1, 2])
+        obs = interval_labels_by_period([0, 1800], 3600, offset=1800)
+        np.testing.assert_array_equal(obs, [0, 1])
+
+    def test_occupancy_maps(self):
+        rs = np.random.RandomState(0)
+        x = rs.uniform(0, 40, size=(3, 500))
+        y = rs.uniform(0, 20, size=(3, 500))
+        x[1, 10] = np.nan
+        labels = np.repeat(np.arange(5), 100)
+        labels[:7] = -1
+        obs = occupancy_maps(x, y, 4, self.bounds, labels)
+        self.assertEqual(obs.shape, (3, 5, 4, 4))
+        for c in range(3):
+            for l in range(5):
+                m = labels == l
+                exp = np.histogram2d(x[c, m], y[c, m], bins=[4, 4],
+                                     range=[[0, 40], [0, 20]])[0]
+                np.testing.assert_array_equal(obs[c, l], exp)
+        self.assertEqual(obs.sum(), 3 * 493 - 1)
+
+        # Single cage, no labels.
+        obs = occupancy_maps(x[0], y[0], 4, self.bounds)
+        self.assertEqual(obs.shape, (1, 4, 4))
+        self.assertEqual(obs.sum(), 500)
+
+    def test_incremental(self):
+        rs = np.random.RandomState(1)
+        x = rs.uniform(0, 40, size=(2, 300))
+        y = rs.uniform(0, 20, size=(2, 300))
+        labels = np.repeat(np.arange(3), 100)
+        exp = occupancy_maps(x, y, 5, self.bounds, labels)
+        obs = occupancy_maps(x[:, :150], y[:, :150], 5, self.bounds,
+                             labels[:150], n_labels=3)
+        obs = occupancy_maps(x[:, 150:], y[:, 150:], 5, self.bounds,
+                             labels[150:], out=obs)
+        np.testing.assert_array_equal(obs, exp)
+        # An update reaching a new interval returns a grown copy.
+        before = obs.copy()
+        grown = occupancy_maps(x, y, 5, self.bounds, labels + 1, out=obs)
+        self.assertEqual(grown.shape, (2, 4, 5, 5))
+        np.testing.assert_array_equal(obs, before)
+        np.testing.assert_array_equal(grown[:, :3], exp + np.concatenate(
+            (np.zeros((2, 1, 5, 5)), exp[:, :2]), 1))
+        np.testing.assert_array_equal(grown[:, 3], exp[:, 2])
+        # Labels beyond an explicit number of intervals are not silently
+        # dropped.
+        self.assertRaises(ValueError, occupancy_maps, x, y, 5, self.bounds,
+                          labels + 1, n_labels=3, out=obs)
+
+    def test_occupancy_fraction(self):
+        counts = np.array([[[1, 3], [0, 0]], [[0, 0], [0, 0]]])
+        obs = occupancy_fraction(counts)
+        np.testing.assert_array_equal(obs, [[[.25, .75], [0, 0]],
+                                            [[0, 0], [0, 0]]])
+
+# run unit tests if run from command-line
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+from unittest import TestCase, main
+import datetime
+import os
+import shutil
+import tempfile
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PolyCollection
+from matplotlib.figure import Figure
+from bcp.plot import (plot_decimated, shade_intervals, multi_cage_figure,
+                      render_overview)
+
+
+class TestPlot(TestCase):
+    '''Test plotting helpers with the Agg backend.'''
+
+    def setUp(self):
+        rs = np.random.RandomState(0)
+        self.times = np.arange(99999.)
+        # A compactly stored (uint8) channel.
+        self.data = rs.randint(10, 200, 99999).astype(np.uint8)
+        self.data[12345] = 254
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _axes(self, width=4.):
+        fig = Figure(figsize=(width, 2), dpi=100)
+        FigureCanvasAgg(fig)
+        return fig.add_subplot(1, 1, 1)
+
+    def test_plot_decimated(self):
+        ax = self._axes()
+        line = plot_decimated(ax, self.times, self.data)
+        x, y = line.get_data()
+        width = int(ax.bbox.width)
+        self.assertLessEqual(x.shape[0], 4 * width)
+        self.assertEqual(np.max(y), 254)
+        self.assertEqual(np.min(y), 10)
+        # Zooming in redraws the visible range, down to the raw samples.
+        ax.set_xlim(12300, 12400)
+        x, y = line.get_data()
+        self.assertTrue((np.asarray(x) >= 12300 - 1).all())
+        self.assertTrue((np.asarray(x) <= 12400 + 1).all())
+        self.assertIn(254, np.asarray(y))
+        np.testing.assert_array_equal(
+            np.asarray(y)[np.asarray(x) == 12345], [254])
+
+    def test_shade_intervals(self):
+        ax = self._axes()
+        coll = shade_intervals(ax, [[0, 3600], [7200, 10800]], scale=3600.)
+        self.assertIsInstance(coll, PolyCollection)
+        self.assertEqual(list(ax.collections), [coll])
+        paths = coll.get_paths()
+        self.assertEqual(len(paths), 2)
+        np.testing.assert_array_equal(paths[1].vertices[:4, 0], [2, 2, 3, 3])
+
+    def test_multi_cage_figure(self):
+        times = np.arange(0, 3 * 86400, 60.)
+        data = {'Water_1': np.sin(times / 3600.),
+                'FoodA_1': np.cos(times / 3600.),
+                'Water_2': np.arange(times.shape[0]).astype(np.uint8)}
+        start = datetime.datetime(2016, 5, 5, 7, 50, 33)
+        fig = multi_cage_figure(data, times, [1, 2], ['Water', 'FoodA'],
+                                schedule=(7, 12), start_timestamp=start)
+        self.assertEqual(len(fig.axes), 4)
+        for ax in fig.axes:
+            # One collection shading the dark periods per panel.
+            self.assertEqual(len(ax.collections), 1)
+            self.assertIsInstance(ax.collections[0], PolyCollection)
+            self.assertEqual(len(ax.collections[0].get_paths()), 3)
+        # FoodA_2 is missing: its panel is left empty.
+        self.assertEqual([len(ax.lines) for ax in fig.axes], [1, 1, 1, 0])
+        fp = os.path.join(self.tmp, 'overview.png')
+        fig = render_overview(fp, data, times, [1, 2], ['Water', 'FoodA'],
+                              schedule=(7, 12), start_timestamp=start)
+        with open(fp, 'rb') as f:
+            self.assertEqual(f.read(8), b'\x89PNG\r\n\x1a\n')
+        self.assertEqual(len(fig.axes), 4)
+
+
+# run unit tests if run from command-line
+if __name__ == '__main__':
+    main()
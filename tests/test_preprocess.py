@@ -5,7 +5,11 @@ from unittest import TestCase, main
 import numpy as np
 from bcp.preprocess import (weight_sensor_positive_spikes,
                             smooth_positive_spikes, stable_sequences,
-                            valued_sequences, unstable_sequences)
+                            valued_sequences, unstable_sequences,
+                            discretize_observations,
+                            remove_artifacts_body_mass, resample_uniform,
+                            smooth, interpolate_between_nans,
+                            remove_artifacts_wheel_running)
 
 
 class TestWeightPreprocessing(TestCase):
@@ -232,6 +236,92 @@ class TestWeightPreprocessing(TestCase):
                                  stability_duration=stability_duration)
         np.testing.assert_array_equal(obs, exp)
 
+    def test_discretize_observations(self):
+        # Each of the n**2 cells maps to a distinct symbol.
+        xs, ys = np.meshgrid(np.arange(3), np.arange(3))
+        observations = np.vstack((xs.ravel(), ys.ravel())).astype(float)
+        obs = discretize_observations(observations, 3)
+        exp = xs.ravel() * 3 + ys.ravel()
+        np.testing.assert_array_equal(obs, exp)
+
+    def test_remove_artifacts_body_mass(self):
+        # Readings while the mouse is out of the house are replaced by the
+        # mass it had when inside.
+        data = np.array([0.5] * 40 + [24, 26] * 30 + [0.3] * 40)
+        obs = remove_artifacts_body_mass(data, np.arange(140), min_duration=10,
+                                         trim=2, window=20)
+        np.testing.assert_array_equal(obs, np.full(140, 25.))
+
+    def _float32_data(self):
+        rng = np.random.RandomState(0)
+        data = rng.rand(200).astype(np.float32)
+        data[rng.rand(200) < .1] += 1
+        return data
+
+    def test_smooth_dtype_and_out(self):
+        # float32 input gives float32 output; an out buffer gives the same
+        # values.
+        data = self._float32_data()
+        obs = smooth(data, 5, .5, 2)
+        self.assertEqual(obs.dtype, np.float32)
+        np.testing.assert_allclose(obs, smooth(data, 5, .5, 2,
+                                               dtype=np.float64), rtol=1e-6)
+        out = np.full(200, 7, dtype=np.float32)
+        self.assertIs(smooth(data, 5, .5, 2, out=out), out)
+        np.testing.assert_array_equal(out, obs)
+
+    def test_interpolate_between_nans_dtype_and_out(self):
+        data = smooth(self._float32_data(), 5, .5, 2)
+        exp = interpolate_between_nans(data)
+        self.assertEqual(exp.dtype, np.float32)
+        self.assertIs(interpolate_between_nans(data, out=data), data)
+        np.testing.assert_array_equal(data, exp)
+
+    def test_smooth_positive_spikes_dtype_and_out(self):
+        data = self._float32_data()
+        spikes = np.array([20, 50])
+        exp = smooth_positive_spikes(data, spikes, 3, 2)
+        self.assertEqual(exp.dtype, np.float32)
+        obs = data.copy()
+        smooth_positive_spikes(obs, spikes, 3, 2, out=obs)
+        np.testing.assert_array_equal(obs, exp)
+
+    def test_remove_artifacts_wheel_running_dtype_and_out(self):
+        wheel = np.array([0, 3, 12, 40], dtype=np.float32)
+        remove_artifacts_wheel_running(wheel, out=wheel)
+        np.testing.assert_array_equal(wheel, [0, 3, 10, 10])
+        self.assertEqual(wheel.dtype, np.float32)
+        # Compactly stored counts; limits beyond or between the integers of
+        # the dtype.
+        wheel = np.array([0, 3, 12, 255], dtype=np.uint8)
+        np.testing.assert_array_equal(
+            remove_artifacts_wheel_running(wheel, 300), wheel)
+        obs = remove_artifacts_wheel_running(wheel, 10.5)
+        np.testing.assert_array_equal(obs, [0, 3, 10, 10])
+        self.assertEqual(obs.dtype, np.uint8)
+
+    def test_resample_uniform(self):
+        # A gap, a duplicated time and an observation off the grid.
+        data = np.array([[1, 10], [2, 20], [3, 30], [4, 40], [5, 50]],
+                        dtype=np.int16)
+        times = np.array([3, 4, 4, 7.1, 8])
+        grid_data, grid_times, valid = resample_uniform(data, times)
+        exp = np.array([[1, 10], [3, 30], [np.nan, np.nan], [np.nan, np.nan],
+                        [4, 40], [5, 50]])
+        np.testing.assert_array_equal(grid_data, exp)
+        np.testing.assert_array_equal(grid_times, [3, 4, 5, 6, 7, 8])
+        np.testing.assert_array_equal(valid, [1, 1, 0, 0, 1, 1])
+        self.assertEqual(grid_data.dtype, np.float32)
+        # Explicit bounds, time along the last axis.
+        grid_data, grid_times, valid = resample_uniform(data.T, times,
+                                                        start=0, stop=6,
+                                                        fill=-1, axis=1)
+        np.testing.assert_array_equal(grid_data[0], [-1, -1, -1, 1, 3, -1, -1])
+        np.testing.assert_array_equal(grid_times, np.arange(7))
+        self.assertEqual(grid_data.dtype, np.int16)
+        grid_data, _, _ = resample_uniform(data.astype(np.uint8), times)
+        self.assertEqual(grid_data.dtype, np.float32)
+
 # run unit tests if run from command-line
 if __name__ == '__main__':
     main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+from unittest import TestCase, main
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from bcp.profiling import instrument, profiling, enabled
+from bcp.preprocess import smooth_positive_spikes, weight_sensor_positive_spikes
+
+
+@instrument
+def _allocate(n):
+    return np.ones(n)
+
+
+@instrument
+def _outer(n):
+    a = _allocate(n)
+    b = _allocate(2 * n)
+    return a.sum() + b.sum()
+
+
+class TestProfiling(TestCase):
+    '''Test opt-in profiling instrumentation.'''
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_disabled(self):
+        self.assertFalse(enabled())
+        np.testing.assert_array_equal(_allocate(3), np.ones(3))
+        self.assertEqual(_allocate.__name__, '_allocate')
+
+    def test_profiling(self):
+        data = np.array([1, 1, 5, 1, 1, 1], dtype=float)
+        times = np.arange(6)
+        with profiling() as report:
+            self.assertTrue(enabled())
+            spikes = weight_sensor_positive_spikes(data, times, 2)
+            smooth_positive_spikes(data, spikes, 1, 1)
+            smooth_positive_spikes(data, spikes, 1, 1)
+        self.assertFalse(enabled())
+        s = report.stats['bcp.preprocess.smooth_positive_spikes']
+        self.assertEqual(s['calls'], 2)
+        self.assertTrue(s['wall_time'] > 0)
+        s = report.stats['bcp.preprocess.weight_sensor_positive_spikes']
+        self.assertEqual(s['calls'], 1)
+        self.assertEqual(s['input_elements'], 12)
+        self.assertEqual(s['input_bytes'], data.nbytes + times.nbytes)
+
+    def test_memory(self):
+        n = 100000
+        with profiling() as report:
+            _outer(n)
+        inner = report.stats[__name__ + '._allocate']
+        outer = report.stats[__name__ + '._outer']
+        self.assertEqual(inner['calls'], 2)
+        self.assertTrue(inner['peak_bytes'] >= 2 * n * 8)
+        # The outer call holds both arrays at once.
+        self.assertTrue(outer['peak_bytes'] >= 3 * n * 8)
+        self.assertTrue(outer['allocated_bytes'] < n * 8)
+
+    def test_no_memory(self):
+        with profiling(trace_memory=False) as report:
+            _outer(10)
+        self.assertFalse('peak_bytes' in report.stats[__name__ + '._outer'])
+
+    def test_dump(self):
+        fp = os.path.join(self.tmp, 'profile.json')
+        with profiling(fp=fp):
+            _outer(10)
+        with open(fp) as f:
+            obs = json.load(f)
+        self.assertEqual(obs['functions'][__name__ + '._outer']['calls'], 1)
+        self.assertTrue(obs['trace_memory'])
+
+    def test_nested(self):
+        with profiling():
+            with self.assertRaises(RuntimeError):
+                with profiling():
+                    pass
+
+# run unit tests if run from command-line
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+from unittest import TestCase, main
+import os
+import shutil
+import tempfile
+import numpy as np
+from bcp.rollup import (compute_rollup, coarsen_rollup, build_rollups,
+                        merge_rollups, rollup_statistic, rollup_path,
+                        update_rollup, load_rollups, STATISTICS)
+from bcp.store import append_array
+
+
+class TestRollup(TestCase):
+    '''Test rollup construction and maintenance.'''
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        rng = np.random.RandomState(0)
+        self.times = np.concatenate((np.arange(0, 5000),
+                                     np.arange(9000, 20000))).astype(float)
+        self.data = rng.rand(self.times.shape[0])
+        self.data[rng.rand(self.times.shape[0]) < .05] = np.nan
+        self.data[100:300] = np.nan
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def assert_rollups_equal(self, obs, exp):
+        self.assertEqual(sorted(obs), sorted(exp))
+        for r in exp:
+            self.assertEqual(obs[r]['first_bin'], exp[r]['first_bin'])
+            for stat in STATISTICS:
+                np.testing.assert_allclose(obs[r][stat], exp[r][stat])
+
+    def test_compute_rollup(self):
+        data = np.array([1, 2, np.nan, 4, 5, np.nan, np.nan])
+        times = np.array([0, 1, 2, 3, 10, 11, 12])
+        obs = compute_rollup(data, times, 3)
+        self.assertEqual(obs['first_bin'], 0)
+        np.testing.assert_array_equal(obs['count'], [2, 1, 0, 1, 0])
+        np.testing.assert_array_equal(obs['sum'], [3, 4, 0, 5, 0])
+        np.testing.assert_array_equal(obs['sumsq'], [5, 16, 0, 25, 0])
+        np.testing.assert_array_equal(obs['min'], [1, 4, np.nan, 5, np.nan])
+        np.testing.assert_array_equal(obs['max'], [2, 4, np.nan, 5, np.nan])
+
+    def test_coarsen_rollup(self):
+        # Coarsened rollups equal rollups computed from the samples, also
+        # when the data starts in the middle of a coarse bin.
+        for start in (0, 1300):
+            data, times = self.data[start:], self.times[start:]
+            obs = coarsen_rollup(compute_rollup(data, times, 60), 10)
+            self.assert_rollups_equal({600: obs},
+                                      {600: compute_rollup(data, times, 600)})
+
+    def test_merge_rollups(self):
+        exp = build_rollups(self.data, self.times)
+        for split in (1000, 1030, 4999, 5000, 6000):
+            old = build_rollups(self.data[:split], self.times[:split])
+            new = build_rollups(self.data[split:], self.times[split:])
+            obs = {r: merge_rollups(old[r], new[r]) for r in exp}
+            self.assert_rollups_equal(obs, exp)
+        with self.assertRaises(ValueError):
+            merge_rollups(exp[60], exp[60])
+
+    def test_rollup_statistic(self):
+        rollup = compute_rollup(np.array([1., 3., np.nan]),
+                                np.array([4, 5, 9]), 4)
+        np.testing.assert_array_equal(rollup_statistic(rollup, 'mean'),
+                                      [np.nan, 2, np.nan])
+        np.testing.assert_array_equal(rollup_statistic(rollup, 'std'),
+                                      [np.nan, 1, np.nan])
+        np.testing.assert_array_equal(rollup_statistic(rollup, 'count'),
+                                      [0, 2, 0])
+        self.assertRaises(ValueError, rollup_statistic, rollup, 'median')
+
+    def test_update_rollup(self):
+        fp = os.path.join(self.tmp, 'Water_1.npy')
+        append_array(fp, self.data[:0])
+        self.assertIsNone(load_rollups(fp))
+        exp = build_rollups(self.data, self.times)
+        n = 0
+        for stop in (2000, 2030, 9000, self.data.shape[0]):
+            append_array(fp, self.data[n:stop], n)
+            update_rollup(fp, self.times[:stop], n)
+            n = stop
+        self.assert_rollups_equal(load_rollups(fp), exp)
+        # An interrupted append is rolled back by the next one.
+        times = np.concatenate((self.times, np.arange(20000, 20020.)))
+        append_array(fp, np.zeros(10), n)
+        update_rollup(fp, times, n)
+        append_array(fp, np.ones(20), n)
+        update_rollup(fp, times, n)
+        exp = build_rollups(np.concatenate((self.data, np.ones(20))), times)
+        self.assert_rollups_equal(load_rollups(fp), exp)
+        # Rollups of fewer samples than the channel are out of date.
+        append_array(fp, np.ones(5))
+        self.assertIsNone(load_rollups(fp))
+        self.assertTrue(os.path.exists(rollup_path(fp)))
+
+
+# run unit tests if run from command-line
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+from unittest import TestCase, main
+import numpy as np
+from bcp.scoring import (sequence_intervals, mask_intervals, overlaps_any,
+                         precision_recall, overlap_pairs, interval_iou,
+                         match_events, event_scores, confusion)
+
+
+def _greedy_matches(a, b, tolerance=0):
+    '''Greedy matching by decreasing IoU over all pairs.'''
+    pairs = []
+    for x in range(a.shape[0]):
+        for y in range(b.shape[0]):
+            if (a[x, 0] - tolerance < b[y, 1] and
+                    b[y, 0] - tolerance < a[x, 1]):
+                error = abs(a[x, 0] - b[y, 0]) + abs(a[x, 1] - b[y, 1])
+                pairs.append((-interval_iou(a[[x]], b[[y]])[0], error, x, y))
+    used_a, used_b, out = set(), set(), []
+    for _, _, x, y in sorted(pairs):
+        if x not in used_a and y not in used_b:
+            used_a.add(x)
+            used_b.add(y)
+            out.append((x, y))
+    return sorted(out, key=lambda p: p[1])
+
+
+class TestScoring(TestCase):
+    '''Test interval overlap scoring.'''
+
+    def setUp(self):
+        self.detected = np.array([[0, 5], [8, 10], [20, 30], [40, 41]])
+        self.reference = np.array([[4, 6], [12, 15], [25, 26], [28, 35],
+                                   [43, 50]])
+
+    def test_conversions(self):
+        np.testing.assert_array_equal(sequence_intervals([[3, 2], [9, 1]]),
+                                      [[3, 5], [9, 10]])
+        np.testing.assert_array_equal(
+            mask_intervals([True, True, False, True, False, True]),
+            [[0, 2], [3, 4], [5, 6]])
+        self.assertEqual(mask_intervals(np.zeros(3, bool)).shape, (0, 2))
+
+    def test_overlaps_any(self):
+        np.testing.assert_array_equal(
+            overlaps_any(self.detected, self.reference),
+            [True, False, True, False])
+        np.testing.assert_array_equal(
+            overlaps_any(self.reference, self.detected),
+            [True, False, True, True, False])
+        # Events 2 samples apart overlap with a tolerance of 3.
+        np.testing.assert_array_equal(
+            overlaps_any(self.detected, self.reference, tolerance=3),
+            [True, True, True, True])
+        self.assertEqual(overlaps_any(self.detected, []).tolist(),
+                         [False] * 4)
+        # Random, mutually overlapping events against all pairs.
+        rs = np.random.RandomState(0)
+        a = rs.randint(0, 1000, (300, 1)) + np.array([0, 1])
+        a[:, 1] += rs.randint(0, 20, 300)
+        b = rs.randint(0, 1000, (200, 1)) + np.array([0, 1])
+        b[:, 1] += rs.randint(0, 40, 200)
+        exp = ((a[:, None, 0] < b[None, :, 1]) &
+               (b[None, :, 0] < a[:, None, 1])).any(1)
+        np.testing.assert_array_equal(overlaps_any(a, b), exp)
+
+    def test_precision_recall(self):
+        obs = precision_recall(self.detected, self.reference)
+        np.testing.assert_allclose(obs, (.5, .6, 6 / 11.))
+        self.assertEqual(precision_recall([], self.reference), (0, 0, 0))
+
+    def test_overlap_pairs(self):
+        i, j = overlap_pairs(self.detected, self.reference)
+        self.assertEqual(list(zip(i, j)), [(0, 0), (2, 2), (2, 3)])
+        np.testing.assert_allclose(
+            interval_iou(self.detected[i], self.reference[j]),
+            [1 / 6., .1, 2 / 15.])
+
+    def test_match_events(self):
+        # Both detections overlap the first reference event; the better one
+        # is matched to it and the other to the second.
+        detected = np.array([[0, 10], [8, 20], [30, 31]])
+        reference = np.array([[2, 10], [9, 21], [40, 50]])
+        matches = match_events(detected, reference)
+        self.assertEqual(matches.tolist(), [(0, 0, .8, -2, 0),
+                                            (1, 1, 11 / 13., -1, -1)])
+        self.assertEqual(match_events(detected, reference,
+                                      min_iou=.81)['detected'].tolist(), [1])
+        self.assertEqual(match_events(detected, [], 10).shape, (0,))
+        rs = np.random.RandomState(0)
+        for k in range(20):
+            a = np.sort(rs.choice(500, 40, replace=False)).reshape(-1, 2)
+            b = rs.randint(0, 500, (15, 1)) + np.array([0, 1])
+            b[:, 1] += rs.randint(0, 30, 15)
+            for tolerance in (0, 3):
+                matches = match_events(a, b, tolerance)
+                self.assertEqual(
+                    list(zip(matches['detected'], matches['reference'])),
+                    _greedy_matches(a, b, tolerance))
+
+    def test_event_scores(self):
+        obs = event_scores(self.detected, self.reference)
+        self.assertEqual((obs['n_detected'], obs['n_reference'],
+                          obs['n_matched']), (4, 5, 2))
+        np.testing.assert_allclose([obs['precision'], obs['recall'],
+                                    obs['f1'], obs['mean_iou'],
+                                    obs['onset_error'], obs['offset_error']],
+                                   [.5, .4, 4 / 9., (1 / 6. + 2 / 15.) / 2, 6,
+                                    3])
+        obs = event_scores([], self.reference)
+        self.assertEqual(obs['f1'], 0)
+        self.assertTrue(np.isnan(obs['mean_iou']))
+
+    def test_confusion(self):
+        matrix, classes = confusion(self.detected, ['d', 'e', 'd', 'e'],
+                                    self.reference,
+                                    ['d', 'e', 'el', 'd', 'e'])
+        self.assertEqual(classes, ['d', 'e', 'el'])
+        np.testing.assert_array_equal(matrix, [[2, 0, 0, 0],
+                                               [0, 0, 0, 2],
+                                               [0, 0, 0, 1],
+                                               [0, 2, 0, 0]])
+        matrix, classes = confusion(self.detected, ['d', 'e', 'd', 'e'],
+                                    self.reference,
+                                    ['d', 'e', 'el', 'd', 'e'],
+                                    classes=['el', 'e', 'd'])
+        self.assertEqual(matrix[2, 2], 2)
+        self.assertRaises(ValueError, confusion, self.detected, ['d'] * 4,
+                          self.reference, ['d'] * 5, classes=['e'])
+
+
+# run unit tests if run from command-line
+if __name__ == '__main__':
+    main()
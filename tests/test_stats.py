@@ -4,7 +4,8 @@ from __future__ import division
 from unittest import TestCase, main
 import numpy as np
 from bcp.stats import (moving_function, distance_traveled_1d,
-                       distance_traveled_2d)
+                       distance_traveled_2d, window_aggregate)
+from bcp.rollup import build_rollups
 
 
 class TestStats(TestCase):
@@ -117,6 +118,48 @@ class TestStats(TestCase):
         exp = (2.5**2 + 1**2)**.5 + (5**2 + 5.6**2)**.5
         self.assertEqual(obs, exp)
 
+    def test_moving_function_dtype(self):
+        data = np.arange(10, dtype=np.float32)
+        obs = moving_function(data, 3, 'average')
+        self.assertEqual(obs.dtype, np.float32)
+        np.testing.assert_allclose(obs, moving_function(data, 3, 'average',
+                                                        dtype=np.float64),
+                                   rtol=1e-6)
+        exp = moving_function(data, 3, 'sum', 2)
+        self.assertIs(moving_function(data, 3, 'sum', 2, out=data), data)
+        np.testing.assert_array_equal(data, exp)
+        # Longer than the chunks convolved at a time, in place.
+        data = np.random.RandomState(0).rand(3 * 2 ** 16 + 5)
+        for window in (7, 40):
+            exp = np.convolve(np.ones(window), data, 'same')
+            obs = data.copy()
+            self.assertIs(moving_function(obs, window, out=obs), obs)
+            np.testing.assert_allclose(obs, exp, rtol=1e-12)
+
+    def test_window_aggregate(self):
+        data = np.array([1., 2, np.nan, 4, 5, 6, 7])
+        times = np.array([0, 1, 2, 3, 4, 5, 7])
+        obs, starts = window_aggregate(data, times, 3, 'sum')
+        np.testing.assert_array_equal(obs, [3, 15, 7])
+        np.testing.assert_array_equal(starts, [0, 3, 6])
+        obs, _ = window_aggregate(data, times, 3, 'max')
+        np.testing.assert_array_equal(obs, [2, 6, 7])
+        # Windows lining up with the rollups give the same results without
+        # reading the data.
+        rng = np.random.RandomState(0)
+        times = np.arange(150, 20000)
+        data = rng.rand(times.shape[0])
+        rollups = build_rollups(data, times)
+        for window in (120, 1800, 7200, 100):
+            for statistic in ('sum', 'count', 'mean', 'std', 'min', 'max'):
+                exp, exp_starts = window_aggregate(data, times, window,
+                                                   statistic)
+                obs, obs_starts = window_aggregate(None if window % 60 == 0
+                                                   else data, times, window,
+                                                   statistic, rollups)
+                np.testing.assert_allclose(obs, exp)
+                np.testing.assert_array_equal(obs_starts, exp_starts)
+
 # run unit tests if run from command-line
 if __name__ == '__main__':
     main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+from unittest import TestCase, main
+import os
+import shutil
+import tempfile
+import numpy as np
+from bcp.store import (channel_path, channels, read_manifest, write_manifest,
+                       save_array, append_array, is_stale, infer_encoding,
+                       encode_values, decode_values, EncodedChannel,
+                       load_channel, ingest_channel)
+
+
+class TestStore(TestCase):
+    '''Test experiment store helpers.'''
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_channels(self):
+        for field, cage in [('Water', 2), ('Water', 10), ('Water', 1),
+                            ('RT_FoodA', 3), ('WaterClean', 11),
+                            ('WaterCentroids', 12)]:
+            save_array(channel_path(self.tmp, field, cage), np.zeros(2))
+        save_array(os.path.join(self.tmp, 'time.npy'), np.zeros(2))
+        open(os.path.join(self.tmp, 'Water_4.npy.tmp.npy'), 'w').close()
+        self.assertEqual(channels(self.tmp), {'Water': ['1', '2', '10'],
+                                              'RT_FoodA': ['3']})
+        self.assertEqual(sorted(channels(self.tmp, derived=True)),
+                         ['RT_FoodA', 'Water', 'WaterCentroids',
+                          'WaterClean'])
+
+    def test_manifest(self):
+        self.assertEqual(read_manifest(self.tmp), {})
+        write_manifest(self.tmp, {'n': 3})
+        self.assertEqual(read_manifest(self.tmp), {'n': 3})
+
+    def test_append_array(self):
+        fp = os.path.join(self.tmp, 'Water_1.npy')
+        append_array(fp, np.arange(3, dtype=np.float32))
+        append_array(fp, np.arange(3, 5))
+        obs = np.load(fp)
+        np.testing.assert_array_equal(obs, [0, 1, 2, 3, 4])
+        self.assertEqual(obs.dtype, np.float32)
+        # Entries past `length` are dropped before appending.
+        append_array(fp, [7, 8], length=4)
+        np.testing.assert_array_equal(np.load(fp), [0, 1, 2, 3, 7, 8])
+        # Missing entries are padded with NaN.
+        append_array(fp, [9], length=7)
+        np.testing.assert_array_equal(np.load(fp),
+                                      [0, 1, 2, 3, 7, 8, np.nan, 9])
+        fp2 = os.path.join(self.tmp, 'Water_2.npy')
+        append_array(fp2, [1.], length=2)
+        np.testing.assert_array_equal(np.load(fp2), [np.nan, np.nan, 1])
+
+    def test_append_array_large(self):
+        # Shapes whose digits outgrow the header are handled.
+        fp = os.path.join(self.tmp, 'Water_1.npy')
+        append_array(fp, np.zeros(5))
+        append_array(fp, np.ones(10**6))
+        self.assertEqual(np.load(fp).shape, (10**6 + 5,))
+
+    def test_is_stale(self):
+        a = os.path.join(self.tmp, 'a.npy')
+        b = os.path.join(self.tmp, 'b.npy')
+        save_array(a, np.zeros(1))
+        self.assertTrue(is_stale([b], [a]))
+        save_array(b, np.zeros(1))
+        os.utime(a, (1000, 1000))
+        os.utime(b, (2000, 2000))
+        self.assertFalse(is_stale([b], [a]))
+        os.utime(a, (3000, 3000))
+        self.assertTrue(is_stale([b], [a]))
+        self.assertFalse(is_stale([b], [a], since=4000))
+
+    def test_encoding(self):
+        self.assertEqual(infer_encoding([0, 3, np.nan, 254]),
+                         {'dtype': '|u1', 'scale': 1})
+        # The type's extreme value is reserved for missing samples.
+        self.assertEqual(infer_encoding([0, 255])['dtype'], '<u2')
+        self.assertEqual(infer_encoding([-3, 7]), {'dtype': '|i1', 'scale': 1})
+        self.assertEqual(infer_encoding([17.5, 8.25, 0]),
+                         {'dtype': '|u1', 'scale': 4})
+        self.assertEqual(infer_encoding([40.25, 100]),
+                         {'dtype': '<u2', 'scale': 4})
+        self.assertIsNone(infer_encoding([20.1234]))
+        self.assertIsNone(infer_encoding([1, np.inf]))
+        values = np.array([17.5, np.nan, 8.25, 0], dtype=np.float32)
+        encoding = {'dtype': '|u1', 'scale': 4}
+        stored = encode_values(values, encoding)
+        np.testing.assert_array_equal(stored, [70, 255, 33, 0])
+        obs = decode_values(stored, encoding)
+        self.assertEqual(obs.dtype, np.float32)
+        np.testing.assert_array_equal(obs, values)
+        self.assertRaises(ValueError, encode_values, [.1], encoding)
+        self.assertRaises(ValueError, encode_values, [70], encoding)
+        channel = EncodedChannel(stored, encoding)
+        self.assertEqual((channel.shape, channel.ndim, len(channel)),
+                         ((4,), 1, 4))
+        np.testing.assert_array_equal(channel[1:3], [np.nan, 8.25])
+        np.testing.assert_array_equal(np.asarray(channel), values)
+
+    def test_ingest_channel(self):
+        manifest = {}
+        ingest_channel(self.tmp, 'XPos', 1, [17.5, 8.25], 0, manifest)
+        ingest_channel(self.tmp, 'Water', 1, [1., 2.], 0, manifest)
+        ingest_channel(self.tmp, 'WheelCount', 1, [0, 3], 0, manifest,
+                       encoding=None)
+        self.assertEqual(manifest['encodings'],
+                         {'XPos_1': {'dtype': '|u1', 'scale': 4}})
+        self.assertEqual(np.load(channel_path(self.tmp, 'XPos', 1)).dtype,
+                         np.uint8)
+        self.assertEqual(np.load(channel_path(self.tmp, 'Water', 1)).dtype,
+                         np.float32)
+        # Appends keep the encoding; skipped samples are missing.
+        ingest_channel(self.tmp, 'XPos', 1, [1.], 3, manifest)
+        obs = load_channel(self.tmp, 'XPos', 1, manifest=manifest)
+        self.assertIsInstance(obs, EncodedChannel)
+        np.testing.assert_array_equal(obs[:], [17.5, 8.25, np.nan, 1])
+        # Values outgrowing the encoding rewrite the channel.
+        ingest_channel(self.tmp, 'XPos', 1, [70.5], 4, manifest)
+        self.assertEqual(manifest['encodings']['XPos_1'],
+                         {'dtype': '<u2', 'scale': 4})
+        self.assertEqual(read_manifest(self.tmp), manifest)
+        np.testing.assert_array_equal(
+            load_channel(self.tmp, 'XPos', 1)[:], [17.5, 8.25, np.nan, 1,
+                                                   70.5])
+        ingest_channel(self.tmp, 'XPos', 1, [.1], 5, manifest)
+        self.assertNotIn('XPos_1', manifest['encodings'])
+        np.testing.assert_allclose(load_channel(self.tmp, 'XPos', 1),
+                                   [17.5, 8.25, np.nan, 1, 70.5, .1])
+
+# run unit tests if run from command-line
+if __name__ == '__main__':
+    main()
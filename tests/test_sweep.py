@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+from unittest import TestCase, main
+import os
+import shutil
+import tempfile
+import numpy as np
+from bcp.sweep import (read_classifications, load_validation,
+                       unstable_intervals, prepare, score, sweep,
+                       parameter_grid, validation_sweep)
+from bcp.preprocess import unstable_sequences
+
+
+class TestSweep(TestCase):
+    '''Test parameter sweeps against labelled events.'''
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_read_classifications(self):
+        fp = os.path.join(self.tmp, 'classifications.txt')
+        with open(fp, 'w', newline='') as f:
+            f.write('frame_start\tframe_end\tevent\r10\t12\td\r'
+                    '20\t15\te\n30\t30\tel\n\n')
+        labels = read_classifications(fp, offset=100)
+        self.assertEqual(labels.tolist(), [(110, 113, 'd'), (130, 131, 'el')])
+        data, times, labels = load_validation('v3', 'Water')
+        self.assertEqual(data.shape, times.shape)
+        self.assertEqual(labels[0].tolist(), (14699, 14721, 'el'))
+
+    def test_unstable_intervals(self):
+        rs = np.random.RandomState(0)
+        data = np.repeat(rs.rand(200), rs.randint(1, 30, 200))
+        data = (data + rs.normal(0, .01, data.shape[0])).astype(np.float32)
+        absdiff = np.abs(np.diff(data))
+        for params in [(.05, .02, 10), (.1, None, 1), (.02, .01, 0),
+                       (.3, .03, 25)]:
+            np.testing.assert_array_equal(
+                unstable_intervals(absdiff, *params),
+                np.array(unstable_sequences(data, *params)).reshape(-1, 2))
+
+    def test_score(self):
+        data = np.zeros(100)
+        labels = np.array([(10, 20, 'd'), (50, 60, 'd'), (70, 80, 'e')],
+                          dtype=[('start', 'i8'), ('stop', 'i8'),
+                                 ('event', 'U4')])
+        prepared = prepare(data, np.arange(100.), labels, ['d'], (5, 90))
+        # The last detection is clipped to the span, the first dropped.
+        obs = score(prepared, [[0, 3], [15, 25], [40, 45], [85, 95]])
+        np.testing.assert_allclose(obs, (3, 1 / 3., .5, .4, 1 / 3., 1 / 3.,
+                                         .5, .4, 5 / 20., 5 / 20.))
+        # One to one, a fragmented event is matched once; many to one, every
+        # fragment counts as a hit.
+        obs = score(prepared, [[10, 12], [13, 15], [16, 20], [50, 60]])
+        self.assertEqual(obs[:4], (4, .5, 1., 2 / 3.))
+        self.assertEqual(obs[5:8], (1., 1., 1.))
+
+    def test_sweep(self):
+        grid = {'u_diff': [.02, .05, .2], 's_diff': [.01, .02],
+                'stability_duration': [5, 10]}
+        self.assertEqual(len(parameter_grid(grid)), 12)
+        self.assertEqual(parameter_grid({'a': [1], 'b': [2, 3]}),
+                         [{'a': 1, 'b': 2}, {'a': 1, 'b': 3}])
+        table = validation_sweep('v2', 'FoodA', 'unstable_sequences', grid,
+                                 tolerance=2)
+        self.assertEqual(table.shape, (12,))
+        self.assertEqual(table.dtype.names[:3],
+                         ('s_diff', 'stability_duration', 'u_diff'))
+        self.assertTrue((np.diff(table['f1']) <= 0).all())
+        self.assertGreater(table['f1'][0], .8)
+        np.testing.assert_array_equal(
+            validation_sweep('v2', 'FoodA', 'unstable_sequences', grid,
+                             jobs=2, tolerance=2), table)
+        data, times, labels = load_validation('v2', 'FoodA')
+        prepared = prepare(data, times, labels, ['e', 'el'])
+        for detector, grid in [('bouts', {'u_diff': [.1, .2]}),
+                               ('spikes', {'threshold': [.1, .5],
+                                           'max_separation': [0, 10]})]:
+            table = sweep(prepared, detector, grid)
+            self.assertTrue((table['n_detected'] > 0).all())
+
+
+# run unit tests if run from command-line
+if __name__ == '__main__':
+    main()
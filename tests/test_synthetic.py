@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+from unittest import TestCase, main
+import os
+import shutil
+import tempfile
+import numpy as np
+from bcp.synthetic import (promethion_header, simulate_promethion,
+                           write_promethion_csv, ethoscan_report_lines,
+                           write_ethoscan_report, DEFAULT_START)
+from bcp.parse import promethion_to_array
+from bcp.ethoscan import parse_ethoscan_report, BEHAVIOR_CODES_TO_INT_MAP
+
+
+class TestSynthetic(TestCase):
+    '''Test synthetic Promethion data generation.'''
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_promethion_header(self):
+        header = promethion_header(range(1, 9))
+        self.assertEqual(len(header), 1 + 8 * 10 + 8 * 3 + 3)
+        self.assertEqual(header[:3], ['Date    Time', 'XPos_1', 'YPos_1'])
+        self.assertEqual(header[-4:], ['RT_WheelCount_8', 'CommMS',
+                                       'ElSeconds', 'Markers'])
+
+    def test_simulate_promethion(self):
+        chunks = list(simulate_promethion(5000, [1, 2], seed=0,
+                                          gaps=[[1000, 1500]],
+                                          chunk_size=2000))
+        self.assertEqual(len(chunks), 3)
+        times = np.concatenate([c[0] for c in chunks])
+        values = np.vstack([c[1] for c in chunks])
+        self.assertEqual(times.shape, (4500,))
+        self.assertEqual(values.shape, (4500, len(promethion_header([1, 2])) - 1))
+        self.assertEqual(np.diff(times).max(), 501)
+        header = promethion_header([1, 2])[1:]
+        xpos = values[:, header.index('XPos_1')]
+        np.testing.assert_array_equal(xpos * 4, np.round(xpos * 4))
+        wheel = values[:, header.index('WheelCount_2')]
+        np.testing.assert_array_equal(wheel, np.round(wheel))
+        # Same seed, same data.
+        again = next(simulate_promethion(5000, [1, 2], seed=0,
+                                         gaps=[[1000, 1500]],
+                                         chunk_size=2000))
+        np.testing.assert_array_equal(again[1], chunks[0][1])
+
+    def test_write_promethion_csv(self):
+        fp = os.path.join(self.tmp, 'export.csv')
+        events = write_promethion_csv(fp, 3000, [1, 2], seed=1,
+                                      gaps=[[100, 200]], chunk_size=1000)
+        data, times, keys = promethion_to_array(fp, [1, 2],
+                                                ['Water', 'BodyMass'])
+        self.assertEqual(keys, ['Water_1', 'BodyMass_1', 'Water_2',
+                                'BodyMass_2'])
+        self.assertEqual(data.shape, (2900, 4))
+        self.assertEqual(times[100] - times[99], 101)
+        self.assertEqual(sorted(events), [1, 2])
+        self.assertTrue((events[1]['end'] > events[1]['start']).all())
+
+    def test_ethoscan_report(self):
+        events = next(simulate_promethion(20000, [1], seed=2, gaps=[]))[2][1]
+        lines = ethoscan_report_lines(events, 1, DEFAULT_START)
+        data = parse_ethoscan_report(lines)
+        # Behaviors tile time from the first classified second.
+        self.assertEqual(data[0, 0], 1)
+        self.assertTrue((data[1:, 0] >= data[:-1, 0] + data[:-1, 2]).all())
+        codes = set(data[:, 1].astype(int))
+        self.assertTrue(BEHAVIOR_CODES_TO_INT_MAP['DWATR'] in codes)
+        self.assertTrue(BEHAVIOR_CODES_TO_INT_MAP['LLNGE'] in codes)
+
+        fp = os.path.join(self.tmp, 'ethoscan.txt')
+        write_ethoscan_report(fp, events, 1, DEFAULT_START)
+        with open(fp, newline='') as f:
+            np.testing.assert_array_equal(
+                parse_ethoscan_report(f.readlines()), data)
+
+# run unit tests if run from command-line
+if __name__ == '__main__':
+    main()
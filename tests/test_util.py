@@ -2,7 +2,8 @@
 
 from unittest import TestCase, main
 import numpy as np
-from bcp.util import (add_seconds, binary_rearing, seconds_till, nights, days)
+from bcp.util import (add_seconds, binary_rearing, seconds_till, nights, days,
+                      float_dtype, output_array)
 import datetime
 
 
@@ -98,6 +99,10 @@ class TestUtil(TestCase):
         obs_days = days(nights, total_exp_seconds)
         np.testing.assert_array_equal(obs_days, exp_days)
 
+        # No night, e.g. constant light.
+        np.testing.assert_array_equal(days(np.empty((0, 2)), 1000),
+                                      [[0, 1000]])
+
     def test_binary_rearing(self):
         data = np.arange(1000) - 500
         obs = binary_rearing(data)
@@ -106,6 +111,15 @@ class TestUtil(TestCase):
         exp[501:] = 1
         np.testing.assert_array_equal(obs, exp)
 
+    def test_float_dtype(self):
+        self.assertEqual(float_dtype(np.zeros(2, np.float32)), np.float32)
+        self.assertEqual(float_dtype(np.zeros(2, np.int16)), np.float64)
+        self.assertEqual(float_dtype(np.zeros(2, np.float32), np.float64),
+                         np.float64)
+        out = np.zeros(3)
+        self.assertIs(output_array(out, (3,), np.float64), out)
+        self.assertRaises(ValueError, output_array, out, (4,), np.float64)
+
 # run unit tests if run from command-line
 if __name__ == '__main__':
     main()